@@ -21,13 +21,15 @@ class AstPrinter:
         self.filter = filter
 
     def print(self, code, node, level=0):
-        """Recursive function to traverse the AST."""
-        print('  ' * level + self._stringify_node(code, node))
-
-        use_filter = self.filter is not None and level == 0
-        children = filter(self.filter, node.get_children()) if use_filter else node.get_children()
-        for child in children:
-            self.print(code, child, level + 1)
+        """Function to traverse the AST, parents before children."""
+        stack = [(node, level)]
+        while stack: 
+            (current_node, current_level) = stack.pop()
+            print('  ' * current_level + self._stringify_node(code, current_node))
+
+            use_filter = self.filter is not None and current_level == 0
+            children = filter(self.filter, current_node.get_children()) if use_filter else current_node.get_children()
+            stack.extend(reversed([(c, current_level + 1) for c in children]))
 
     def _stringify_node(self, code, node): 
         buffer = f"{get_node_type(node)}: "
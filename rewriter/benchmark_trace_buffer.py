@@ -0,0 +1,78 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from emcc_builder import OPTIMIZATION_FLAGS, EmccBuilder
+from rewrite import generate_temp_files, get_path_with_name, write_file
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "basic-example", "main.c")
+WRAPPER_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "wrapper")
+
+# Runs main of an Emscripten build repeatedly under Node, printing the step count and the duration of each run
+RUNNER = """
+import { loadModule } from %s;
+const [path, repeats] = process.argv.slice(-2);
+const evaluate = await loadModule(path);
+const durations = [];
+let stepCount = 0;
+for (let i = 0; i < Number(repeats); i++) {
+    const module = { noInitialRun: true, simulatorMaxSteps: Infinity };
+    await new Promise(resolve => {
+        module.onRuntimeInitialized = resolve;
+        evaluate(module);
+    });
+    const start = performance.now();
+    module._main();
+    module.flushSimulatorSteps?.();
+    durations.push(performance.now() - start);
+    stepCount = module.simulatorSteps.length;
+}
+console.log(JSON.stringify({ stepCount, durations }));
+"""
+
+def get_scaled_example(size):
+    """Returns the nested loops of the basic example, counting up to size instead of 7"""
+    with open(EXAMPLE_PATH) as f:
+        return re.sub(r"int n = \d+;", f"int n = {size};", f.read())
+
+def run_variant(directory, source_path, trace_buffer, optimization, repeats):
+    name = "trace-buffer" if trace_buffer else "per-step"
+    c_path = os.path.join(directory, f"{name}.g.c")
+    js_path = os.path.join(directory, f"{name}.g.js")
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_temp_files(source_path, c_path, js_path, get_path_with_name(source_path, "output.meta"), native=trace_buffer)
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    output_path = os.path.join(directory, f"{name}.js")
+    pre_js_paths = [os.path.join(script_directory, "metadata.js"), os.path.join(script_directory, "output-capture.js"), js_path]
+    EmccBuilder(optimization, trace_buffer=trace_buffer).build(c_path, pre_js_paths, os.path.join(script_directory, "library.js"), output_path)
+
+    runner = RUNNER % json.dumps("file://" + os.path.abspath(os.path.join(WRAPPER_DIRECTORY, "module-loader.js")))
+    process = subprocess.run(["node", "--input-type=module", "-e", runner, output_path, str(repeats)], capture_output=True, text=True, check=True)
+    return json.loads(process.stdout)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compares notify of library.js with trace buffer builds on the nested loops of the basic example")
+    parser.add_argument("--size", type=int, default=300, help="upper bound of the outer loop, the example counts up to 7")
+    parser.add_argument("--repeats", type=int, default=5, help="runs of each build, the median is reported")
+    parser.add_argument("--optimization", choices=list(OPTIMIZATION_FLAGS), default="optimized")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, "main.c")
+        write_file(source_path, get_scaled_example(args.size))
+        try:
+            results = {trace_buffer: run_variant(directory, source_path, trace_buffer, args.optimization, args.repeats) for trace_buffer in [False, True]}
+        except Exception as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    for (trace_buffer, result) in results.items():
+        name = "trace buffer" if trace_buffer else "per step"
+        print(f"{name:>12}: {result['stepCount']} steps, median {statistics.median(result['durations']):.1f} ms")
+    print(f"     speedup: {statistics.median(results[False]['durations']) / statistics.median(results[True]['durations']):.2f}x")
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import signal
+import sys
+import time
+from emcc_builder import OPTIMIZATION_FLAGS
+
+REWRITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rewrite.py")
+
+# Classes in the order their waiting builds are started, interactive builds are waited for by a user
+PRIORITIES = ["interactive", "batch"]
+
+# Finished jobs kept for get_metrics
+HISTORY_SIZE = 1000
+
+def get_default_limits(cpu_count: int|None = None) -> dict[str, int]:
+    """Interactive builds may use every CPU, batch builds at most half of them, so interactive builds never wait for all of them"""
+    cpu_count = cpu_count if cpu_count is not None else os.cpu_count() or 1
+    return { "interactive": cpu_count, "batch": max(1, cpu_count // 2) }
+
+def get_rewrite_command(input_files: list[str], options: list[str]|None = None) -> list[str]:
+    """Returns the command rewriting and compiling a program, see rewrite.py for its options"""
+    return [sys.executable, REWRITE_PATH] + input_files + (options if options is not None else [])
+
+def get_output_directory(input_file: str) -> str:
+    """Returns where the program of a source file is built, rewrite.py names outputs alike for every source file of a directory"""
+    (directory, file_name) = os.path.split(input_file)
+    return os.path.join(directory, "simulator-build", os.path.splitext(file_name)[0])
+
+class BuildJob():
+    """A build of a program, holding when it was submitted, started and finished, times are in seconds of time.monotonic"""
+    def __init__(self, key: str, priority: str, command: list[str]):
+        self.key = key
+        self.priority = priority
+        self.command = command
+        self.status = "queued"
+        self.output = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    @property
+    def queue_wait(self) -> float|None:
+        """Seconds the job waited for a slot of its class, None while it is still waiting"""
+        if self.started_at is not None:
+            return self.started_at - self.submitted_at
+        return self.finished_at - self.submitted_at if self.finished_at is not None else None
+
+    @property
+    def run_time(self) -> float|None:
+        """Seconds the build ran, None when it did not start or still runs"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> dict:
+        return { "key": self.key, "priority": self.priority, "status": self.status, "queueWait": self.queue_wait, "runTime": self.run_time }
+
+class BuildScheduler():
+    """Runs builds in processes, at most limits[priority] of each class and at most cpu_count in total
+
+    Waiting interactive builds start before waiting batch builds. A build submitted with the key of a build which is still
+    queued or running supersedes it: the older build is cancelled, its processes are killed, before the newer one starts.
+    Each build is bounded by timeout (in seconds) and fails with its captured output, like EmccBuilder.run.
+    """
+    def __init__(self, cpu_count: int|None = None, limits: dict[str, int]|None = None, timeout = 300) -> None:
+        self.cpu_count = cpu_count if cpu_count is not None else os.cpu_count() or 1
+        self.limits = { **get_default_limits(self.cpu_count), **(limits if limits is not None else {}) }
+        for priority in self.limits:
+            if priority not in PRIORITIES:
+                raise Exception(f"Unknown priority {priority}")
+        self.timeout = timeout
+        self.waiting = { priority: collections.deque() for priority in PRIORITIES }
+        self.running = { priority: 0 for priority in PRIORITIES }
+        self.jobs: dict[str, BuildJob] = {}
+        self.history: collections.deque[BuildJob] = collections.deque(maxlen=HISTORY_SIZE)
+
+    def submit(self, key: str, command: list[str], priority = "interactive") -> BuildJob:
+        """Queues a build, its task resolves to the output of the command. Must be called from the event loop."""
+        if priority not in PRIORITIES:
+            raise Exception(f"Unknown priority {priority}")
+        previous = self.jobs.get(key)
+        if previous is not None:
+            previous.task.cancel()
+
+        job = BuildJob(key, priority, command)
+        job.task = asyncio.get_running_loop().create_task(self.run_job(job, previous))
+        self.jobs[key] = job
+        return job
+
+    def cancel(self, key: str) -> bool:
+        """Cancels the latest build of key, returning whether it was still queued or running"""
+        job = self.jobs.get(key)
+        return job is not None and job.task.cancel()
+
+    def get_metrics(self) -> list[dict]:
+        """Returns queue wait and run time of recent finished jobs and of queued and running ones"""
+        unfinished = [job for job in self.jobs.values() if job.finished_at is None]
+        return [job.to_dict() for job in list(self.history) + unfinished]
+
+    async def run_job(self, job: BuildJob, previous: BuildJob|None) -> str:
+        try:
+            # Superseded builds write the same files, so they are finished before this one starts
+            if previous is not None:
+                await asyncio.gather(previous.task, return_exceptions=True)
+            await self.acquire(job)
+            try:
+                job.started_at = time.monotonic()
+                job.status = "running"
+                job.output = await self.run_command(job.command)
+            finally:
+                self.release(job)
+            job.status = "done"
+            return job.output
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception:
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.monotonic()
+            self.history.append(job)
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+
+    async def acquire(self, job: BuildJob) -> None:
+        slot = asyncio.get_running_loop().create_future()
+        self.waiting[job.priority].append(slot)
+        self.dispatch()
+        try:
+            await slot
+        except asyncio.CancelledError:
+            # A slot granted at the same time as the cancellation is passed on
+            if slot.done() and not slot.cancelled():
+                self.release(job)
+            else:
+                self.waiting[job.priority].remove(slot)
+            raise
+
+    def release(self, job: BuildJob) -> None:
+        self.running[job.priority] -= 1
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """Starts waiting builds while their class and the machine have free slots, interactive ones first"""
+        for priority in PRIORITIES:
+            waiting = self.waiting[priority]
+            while waiting and sum(self.running.values()) < self.cpu_count and self.running[priority] < self.limits[priority]:
+                slot = waiting.popleft()
+                self.running[priority] += 1
+                slot.set_result(None)
+
+    async def run_command(self, command: list[str]) -> str:
+        """Runs a command in a process group of its own, so cancelling it also kills the compilers it started"""
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, start_new_session=True)
+        try:
+            (output, _) = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError as e:
+            await self.kill(process)
+            raise Exception(f"{command[0]} did not finish within {self.timeout} seconds: {' '.join(command)}") from e
+        except asyncio.CancelledError:
+            await self.kill(process)
+            raise
+
+        output = output.decode("utf-8", errors="replace")
+        if process.returncode != 0:
+            raise Exception(f"{command[0]} failed with exit code {process.returncode}: {' '.join(command)}\n{output}")
+        return output
+
+    async def kill(self, process: asyncio.subprocess.Process) -> None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+async def build_all(input_files: list[str], priority: str, options: list[str], cpu_count: int|None) -> list[dict]:
+    scheduler = BuildScheduler(cpu_count)
+    jobs = [scheduler.submit(os.path.realpath(p), get_rewrite_command([p], options + ["--output-directory", get_output_directory(p)]), priority) for p in input_files]
+    results = await asyncio.gather(*[job.task for job in jobs], return_exceptions=True)
+    for (input_file, result) in zip(input_files, results):
+        if isinstance(result, BaseException):
+            print(f"{input_file}: {result}", file=sys.stderr)
+    return scheduler.get_metrics()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="builds programs of single source files in parallel into simulator-build/<name> next to each file, printing the queue wait and run time of each build")
+    parser.add_argument("input_files", nargs="+", help="source files, each built as a program of its own")
+    parser.add_argument("--priority", choices=PRIORITIES, default="batch", help="class of the builds, batch builds leave CPUs to interactive ones")
+    parser.add_argument("--cpu-count", type=int, help="CPUs builds may use, all of them by default")
+    parser.add_argument("--optimization", choices=list(OPTIMIZATION_FLAGS), default="interactive", help="passed to rewrite.py")
+    parser.add_argument("--native", action="store_true", help="passed to rewrite.py")
+    args = parser.parse_args()
+
+    options = ["--optimization", args.optimization] + (["--native"] if args.native else [])
+    metrics = asyncio.run(build_all(args.input_files, args.priority, options, args.cpu_count))
+    print(json.dumps(metrics, indent=2))
+    sys.exit(1 if any(m["status"] != "done" for m in metrics) else 0)
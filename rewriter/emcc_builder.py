@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Runtime methods the wrapper uses, to reset pooled instances (see module-pool.js)
+RUNTIME_METHODS = ["HEAPU8", "stackSave", "stackRestore"]
+
+RUNTIME_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Replaces notify of library.js in trace buffer builds, reading values with the types of notification_values.h
+TRACE_BUFFER_PATH = os.path.join(RUNTIME_DIRECTORY, "trace_buffer.c")
+NOTIFICATION_VALUES_PATH = os.path.join(RUNTIME_DIRECTORY, "notification_values.h")
+
+# Interactive builds favour compile time, published examples favour code size and speed
+OPTIMIZATION_FLAGS = {
+    "interactive": ["-O0"],
+    "optimized": ["-O2"],
+}
+
+def read_dependency_file(dependency_path) -> list[str]:
+    """Returns the absolute paths of the files listed by a make rule the compiler wrote with -MMD -MF"""
+    with open(dependency_path) as f:
+        rule = f.read().replace("\\\n", " ")
+    (_, _, dependencies) = rule.partition(": ")
+    # Spaces within paths are escaped with a backslash
+    return [os.path.abspath(p.replace("\\ ", " ")) for p in re.findall(r"(?:\\ |\S)+", dependencies)]
+
+def hash_file(path) -> str|None:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+class EmccBuilder:
+    """Builds instrumented code with emcc, compiling and linking separately
+
+    Compiled objects are cached by the hash of their code, flags, emcc version and of the headers they include, so only
+    changed programs are compiled again. Every emcc run is bounded by timeout (in seconds) and fails with its captured diagnostics.
+    Asyncify builds can pause in notify, so the wrapper runs them on demand (see Simulation.runOnDemand).
+    Trace buffer builds link trace_buffer.c, which buffers steps in linear memory instead of calling notify of library.js.
+    """
+    missing_hint = "is emscripten installed and activated?"
+
+    def __init__(self, optimization = "interactive", cache_directory = None, timeout = 120, emcc: list[str]|None = None, asyncify = False, trace_buffer = False) -> None:
+        if optimization not in OPTIMIZATION_FLAGS:
+            raise Exception(f"Unknown optimization {optimization}")
+        if asyncify and trace_buffer:
+            raise Exception("Asyncify builds pause in notify of library.js, which trace buffer builds do not call")
+        self.optimization = optimization
+        self.cache_directory = cache_directory if cache_directory is not None else os.path.join(tempfile.gettempdir(), "c-simulator-objects")
+        self.timeout = timeout
+        self.emcc = emcc if emcc is not None else ["emcc"]
+        self.asyncify = asyncify
+        self.trace_buffer = trace_buffer
+        self.version = None
+
+    def build(self, c_path, pre_js_paths: list[str], js_library_path, output_path):
+        object_path = self.compile(c_path)
+        return self.link(object_path, pre_js_paths, js_library_path, output_path)
+
+    def build_project(self, c_paths: list[str], pre_js_paths: list[str], js_library_path, output_path, include_paths: list[str]|None = None, header_paths: list[str]|None = None, jobs = 1):
+        """Compiles translation units of a project in parallel and links them once"""
+        object_paths = self.compile_project(c_paths, include_paths, header_paths, jobs)
+        return self.link(object_paths, pre_js_paths, js_library_path, output_path)
+
+    def compile_project(self, c_paths: list[str], include_paths: list[str]|None = None, header_paths: list[str]|None = None, jobs = 1) -> list[str]:
+        """Returns paths of the objects of c_paths, compiled in parallel threads, each waiting for its own compiler process"""
+        with ThreadPoolExecutor(max_workers=jobs) as executor: 
+            return list(executor.map(lambda c_path: self.compile(c_path, include_paths, header_paths), c_paths))
+
+    def compile(self, c_path, include_paths: list[str]|None = None, header_paths: list[str]|None = None) -> str:
+        """Returns path of the cached object for c_path, compiling it when missing
+
+        The compiler lists the headers an object included in a manifest next to it, their current content is part of
+        the key of the object, so changing a local header compiles the code again. Headers of a project passed in
+        header_paths are part of the key in any case.
+        """
+        include_paths = include_paths if include_paths is not None else []
+        with open(c_path, "rb") as f:
+            code = f.read()
+        for header_path in header_paths if header_paths is not None else []: 
+            with open(header_path, "rb") as f:
+                code += f.read()
+        # Quote includes are searched next to the source first, so the same code in another directory may include other headers
+        key = json.dumps([self.get_version(), OPTIMIZATION_FLAGS[self.optimization], include_paths, os.path.dirname(os.path.realpath(c_path))]).encode("utf-8") + code
+        source_key = hashlib.sha256(key).hexdigest()
+        manifest_path = os.path.join(self.cache_directory, source_key + ".deps.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                object_path = self.get_object_path(source_key, json.load(f))
+            if object_path is not None and os.path.exists(object_path):
+                return object_path
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        (file_descriptor, temp_path) = tempfile.mkstemp(dir=self.cache_directory, suffix=".o")
+        os.close(file_descriptor)
+        dependency_path = temp_path + ".d"
+        try:
+            self.run(self.get_compile_command(c_path, temp_path, include_paths) + ["-MMD", "-MF", dependency_path])
+            dependencies = read_dependency_file(dependency_path) if os.path.exists(dependency_path) else []
+            object_path = self.get_object_path(source_key, dependencies)
+            if object_path is None:
+                raise Exception(f"A header of {c_path} was removed while compiling it")
+            # Replaced atomically, so parallel builds never link a partially written object or read a partial manifest
+            os.replace(temp_path, object_path)
+            with open(dependency_path, "w") as f:
+                json.dump(dependencies, f)
+            os.replace(dependency_path, manifest_path)
+            return object_path
+        finally:
+            for path in [temp_path, dependency_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def get_object_path(self, source_key: str, dependencies: list[str]) -> str|None:
+        """Returns the path of the object for the current content of its dependencies, None when one of them is missing"""
+        hashes = [hash_file(p) for p in dependencies]
+        if None in hashes:
+            return None
+        key = json.dumps([source_key, list(zip(dependencies, hashes))]).encode("utf-8")
+        return os.path.join(self.cache_directory, hashlib.sha256(key).hexdigest() + ".o")
+
+    def link(self, object_paths: list[str]|str, pre_js_paths: list[str], js_library_path, output_path) -> str:
+        # emcc overwrites the output before reading the pre-js, f.e. when building a program next to the runtime files
+        if os.path.realpath(output_path) in [os.path.realpath(p) for p in pre_js_paths + [js_library_path]]:
+            raise Exception(f"Output {output_path} would overwrite an input of the build")
+        if self.trace_buffer:
+            object_paths = ([object_paths] if isinstance(object_paths, str) else object_paths) + [self.compile(TRACE_BUFFER_PATH, header_paths=[NOTIFICATION_VALUES_PATH])]
+        return self.run(self.get_link_command(object_paths, pre_js_paths, js_library_path, output_path))
+
+    def get_compile_command(self, c_path, object_path, include_paths: list[str]|None = None) -> list[str]:
+        # Quote includes are searched in include paths after the directory of the including file
+        includes = [a for p in (include_paths if include_paths is not None else []) for a in ["-iquote", p]]
+        return self.emcc + ["-c", c_path] + includes + OPTIMIZATION_FLAGS[self.optimization] + ["-o", object_path]
+
+    def get_link_command(self, object_paths: list[str]|str, pre_js_paths: list[str], js_library_path, output_path) -> list[str]:
+        object_paths = [object_paths] if isinstance(object_paths, str) else object_paths
+        command = self.emcc + object_paths + OPTIMIZATION_FLAGS[self.optimization]
+        command += ["-s", "WASM=1", "-s", "EXPORTED_FUNCTIONS=['_main']", "-s", "NO_EXIT_RUNTIME=0"]
+        # Output is captured in every build, also in those which do not call notify (see output-capture.js)
+        command += ["-s", "DEFAULT_LIBRARY_FUNCS_TO_INCLUDE=['$simulatorRecordStep']"]
+        runtime_methods = RUNTIME_METHODS + (["ccall"] if self.asyncify else [])
+        command += ["-s", "EXPORTED_RUNTIME_METHODS=[" + ",".join(f"'{m}'" for m in runtime_methods) + "]"]
+        if self.asyncify:
+            command += ["-s", "ASYNCIFY=1", "-s", "ASYNCIFY_IMPORTS=['notify','notify_aggregate']", "-s", "INVOKE_RUN=0"]
+        for pre_js_path in pre_js_paths:
+            command += ["--pre-js", pre_js_path]
+        return command + ["--js-library", js_library_path, "-o", output_path]
+
+    def get_version(self) -> str:
+        if self.version is None:
+            self.version = self.run(self.emcc + ["--version"]).split("\n")[0]
+        return self.version
+
+    def run(self, command: list[str]) -> str:
+        """Runs emcc, returning its diagnostics"""
+        if shutil.which(command[0]) is None:
+            raise Exception(f"{command[0]} not found, {self.missing_hint}")
+        try:
+            process = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired as e:
+            raise Exception(f"{command[0]} did not finish within {self.timeout} seconds: {' '.join(command)}") from e
+
+        diagnostics = process.stdout + process.stderr
+        if process.returncode != 0:
+            raise Exception(f"{command[0]} failed with exit code {process.returncode}: {' '.join(command)}\n{diagnostics}")
+        return diagnostics
@@ -1,6 +1,74 @@
 mergeInto(LibraryManager.library, {
+    $simulatorAppendStep: function(step) {
+        Module.simulatorSteps = Module.simulatorSteps || [];
+        if (Module.simulatorSteps.length < (Module.simulatorMaxSteps || 10000)) {
+            Module.simulatorSteps.push(step);
+            if (Module.simulatorLogSteps) console.log(step);
+        }
+        else throw new Error("Too many steps (possible infinite loop)");
+    },
+
+    // Also pushes the output steps of output-capture.js, which cannot pause in a write (see writeSimulatorOutput)
+    $simulatorRecordStep__deps: ['$simulatorAppendStep'],
+    $simulatorRecordStep__postset: 'Module["simulatorRecordStep"] = simulatorRecordStep;',
+    $simulatorRecordStep: function(step) {
+        simulatorAppendStep(step);
+        if (Module.onSimulatorCheckpoint && Module.simulatorSteps.length % Module.simulatorCheckpointInterval === 0) 
+            Module.onSimulatorCheckpoint(Module.simulatorSteps.length, HEAPU8);
+    },
+
+    $simulatorPushStep__deps: ['$simulatorRecordStep'],
+    $simulatorPushStep: function(step) {
+        simulatorRecordStep(step);
+
+        // Asyncify builds pause here, until the wrapper resumes them (see Simulation.runOnDemand)
+        if (Module.simulatorPauseAt !== undefined && Module.simulatorSteps.length >= Module.simulatorPauseAt) {
+            return Asyncify.handleSleep(function(wakeUp) {
+                Module.simulatorResume = wakeUp;
+                if (Module.onSimulatorPause) Module.onSimulatorPause();
+            });
+        }
+    },
+
+    // Coverage builds register their static counters before main, the wrapper reads them from memory (see coverage.js)
+    register_counters: function(address, count) {
+        Module.simulatorCounters = { address: address, count: count };
+    },
+
+    // Trace buffer builds append steps to records in linear memory (see trace_buffer.c), they are read in one call per flush.
+    // Memory is checkpointed after a flush, when it matches the last buffered step.
+    register_trace_buffer__deps: ['$simulatorAppendStep'],
+    register_trace_buffer: function(address, countAddress, capacity) {
+        Module.flushSimulatorSteps = function() {
+            var count = HEAP32[countAddress >> 2];
+            if (count === 0) return;
+            // Reset first, so records are not read twice when the step limit is exceeded
+            HEAP32[countAddress >> 2] = 0;
+
+            var steps = Module.simulatorSteps = Module.simulatorSteps || [];
+            var previousLength = steps.length;
+            for (var i = 0; i < count; i++) {
+                // Records are 16 bytes: id, address and value, aligned to 8 bytes
+                var record = (address >> 2) + 4 * i;
+                var id = HEAP32[record];
+                var step = { ...Module.getSimulatorNotification(id), id: id, dataValue: HEAPF64[(record >> 1) + 1] };
+                if (step.action === "assign") step.address = HEAPU32[record + 1];
+                simulatorAppendStep(step);
+            }
+
+            var interval = Module.simulatorCheckpointInterval;
+            if (Module.onSimulatorCheckpoint && Math.floor(steps.length / interval) > Math.floor(previousLength / interval)) 
+                Module.onSimulatorCheckpoint(steps.length, HEAPU8);
+        };
+    },
+
+    flush_trace_buffer: function() {
+        Module.flushSimulatorSteps();
+    },
+
+    notify__deps: ['$simulatorPushStep'],
     notify: function(metadataPtr, dataPtr) {
-        var metadata = Module.simulatorNotifications[metadataPtr];
+        var metadata = Module.getSimulatorNotification(metadataPtr);
 
         // Retreive data value
         var dataType = metadata.dataType;
@@ -16,11 +84,32 @@ mergeInto(LibraryManager.library, {
         }
 
         // Create step 
-        Module.simulatorSteps = Module.simulatorSteps || [];
-        if (Module.simulatorSteps.length < 10000) {
-            Module.simulatorSteps.push({ ...metadata, dataValue: dataValue });
-            console.log({ ...metadata, dataValue: dataValue });
+        var step = { ...metadata, id: metadataPtr, dataValue: dataValue };
+        // Assignments notify the address of their target, so memory checkpoints can be replayed up to any step
+        if (metadata.action === "assign") step.address = dataPtr;
+        return simulatorPushStep(step);
+    },
+
+    // Arrays and structs are captured as a copy of their bytes, shared with the previous capture of the same region while it is unchanged
+    notify_aggregate__deps: ['$simulatorPushStep'],
+    notify_aggregate: function(metadataPtr, dataPtr, size) {
+        if (Module.flushSimulatorSteps) Module.flushSimulatorSteps();
+        var metadata = Module.getSimulatorNotification(metadataPtr);
+        var captures = Module.simulatorCaptures = Module.simulatorCaptures || new Map();
+
+        var current = HEAPU8.subarray(dataPtr, dataPtr + size);
+        var dataValue = captures.get(dataPtr);
+        var isChanged = dataValue === undefined || dataValue.length !== size;
+        for (var i = 0; !isChanged && i < size; i++) {
+            isChanged = dataValue[i] !== current[i];
         }
-        else throw new Error("Too many steps (possible infinite loop)");
+        if (isChanged) {
+            dataValue = current.slice();
+            captures.set(dataPtr, dataValue);
+        }
+
+        var step = { ...metadata, id: metadataPtr, dataValue: dataValue };
+        if (metadata.action === "assign") step.address = dataPtr;
+        return simulatorPushStep(step);
     }
-});
\ No newline at end of file
+});
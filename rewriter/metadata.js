@@ -0,0 +1,86 @@
+// Loads notification metadata written by NotifyMetadataSerializer (see source_visitors.py).
+// Notifications are decoded on first use, so startup only reads the columns.
+var SIMULATOR_ACTIONS = ["stat", "decl", "eval", "assign"];
+
+Module.decodeSimulatorMetadata = function(buffer) {
+    var view = new DataView(buffer);
+    var decoder = new TextDecoder("utf-8");
+    if (decoder.decode(new Uint8Array(buffer, 0, 4)) !== "CSIM") 
+        throw new Error("Not a notification metadata file");
+    if (view.getUint32(4, true) !== 2) 
+        throw new Error("Unsupported notification metadata version " + view.getUint32(4, true));
+
+    var count = view.getUint32(8, true);
+    var stringLength = view.getUint32(12, true);
+    var strings = JSON.parse(decoder.decode(new Uint8Array(buffer, 16, stringLength)));
+    var codeOffset = 16 + stringLength;
+    var codeLength = view.getUint32(codeOffset, true);
+    var code = decoder.decode(new Uint8Array(buffer, codeOffset + 4, codeLength));
+    var columnsOffset = codeOffset + 4 + codeLength;
+    columnsOffset += (4 - columnsOffset % 4) % 4;
+
+    Module.simulatorCode = code;
+    Module.simulatorNotifications = new Array(count);
+    Module.simulatorMetadata = {
+        strings: strings,
+        actions: new Int32Array(buffer, columnsOffset, count),
+        dataTypes: new Int32Array(buffer, columnsOffset + 4 * count, count),
+        identifiers: new Int32Array(buffer, columnsOffset + 8 * count, count),
+        locations: new Int32Array(buffer, columnsOffset + 12 * count, 4 * count),
+        derivedFrom: new Int32Array(buffer, columnsOffset + 28 * count, count)
+    };
+};
+
+Module.getSimulatorNotification = function(id) {
+    var notification = Module.simulatorNotifications[id];
+    if (notification !== undefined) return notification;
+    if (id < 0 || id >= Module.simulatorNotifications.length) return undefined;
+
+    var metadata = Module.simulatorMetadata;
+    notification = { action: SIMULATOR_ACTIONS[metadata.actions[id]] };
+    if (metadata.dataTypes[id] !== -1) 
+        notification.dataType = metadata.strings[metadata.dataTypes[id]];
+    if (metadata.locations[4 * id] !== -1) 
+        notification.location = Array.from(metadata.locations.subarray(4 * id, 4 * id + 4));
+    if (metadata.identifiers[id] !== -1) 
+        notification.identifier = metadata.strings[metadata.identifiers[id]];
+    if (metadata.derivedFrom[id] !== -1) 
+        notification.derivedFrom = metadata.derivedFrom[id];
+
+    Module.simulatorNotifications[id] = notification;
+    return notification;
+};
+
+Module.preRun = Module.preRun || [];
+Module.preRun.push(function() {
+    var path = (typeof locateFile === "function") ? locateFile(Module.simulatorMetadataFile) : Module.simulatorMetadataFile;
+    // Instances of a module pool share the metadata they loaded (see module-pool.js)
+    var cache = Module.simulatorMetadataCache;
+    if (cache && cache[path]) {
+        Module.decodeSimulatorMetadata(cache[path]);
+        return;
+    }
+    var onload = function(buffer) {
+        if (cache) cache[path] = buffer;
+        Module.decodeSimulatorMetadata(buffer);
+        removeRunDependency("simulator-metadata");
+    };
+
+    addRunDependency("simulator-metadata");
+    if (typeof process === "object" && process.versions && process.versions.node) {
+        var data = require("fs").readFileSync(path);
+        onload(data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength));
+    }
+    else {
+        // A missing file would otherwise hold the run dependency forever, so the program silently never starts
+        fetch(path)
+            .then(function(response) {
+                if (!response.ok) throw new Error(response.status + " " + response.statusText);
+                return response.arrayBuffer();
+            })
+            .then(onload)
+            .catch(function(error) {
+                abort("Could not load notification metadata " + path + ": " + error.message);
+            });
+    }
+});
@@ -25,6 +25,33 @@ def get_token_equals(token1, token2):
     isEqualExtent = start1.line == start2.line and start1.column == start2.column and end1.line == end2.line and end1.column == end2.line
     return token1.spelling == token2 and isEqualExtent
         
+def replace_depth_first(source_node: SourceNode, modifications: list['ReplaceModificationNode']) -> SourceNode:
+    """Copies tree, replacing each node by its first applicable modification, children before parents"""
+    stack = [(source_node, None, False)]
+    replaced_nodes = []
+
+    while stack: 
+        (current_node, modification, is_expanded) = stack.pop()
+        children = current_node.get_children()
+        if not is_expanded: 
+            modification = next((m for m in modifications if m.is_applicable(current_node)), None)
+            # Children which are replaced anyway are not copied, so nested replacements do not copy their subtrees again and again
+            if modification is not None and modification.replaces_children: 
+                replaced_nodes.append(modification.apply(SourceNode.copy(current_node)))
+                continue
+            stack.append((current_node, modification, True))
+            stack.extend((c, None, False) for c in reversed(children))
+            continue
+
+        new_source_node = SourceNode.copy(current_node)
+        new_source_node.children = replaced_nodes[len(replaced_nodes) - len(children):]
+        del replaced_nodes[len(replaced_nodes) - len(children):]
+
+        # Apply modification if found
+        replaced_nodes.append(modification.apply(new_source_node) if modification is not None else new_source_node)
+
+    return replaced_nodes[0]
+
 # Basic nodes
 class ModificationNode():
     def get_children(self) -> list['ModificationNode']:
@@ -35,6 +62,9 @@ class InsertModificationNode(ModificationNode):
         raise Exception("Not implemented")
     
 class ReplaceModificationNode(ModificationNode):
+    # Whether apply ignores the children of the node it is given, replacing them as well
+    replaces_children = False
+
     def is_applicable(self, node: SourceNode) -> bool:
         return False
     def apply(self, node: SourceNode) -> SourceNode:
@@ -74,18 +104,7 @@ class CopyReplaceNode(InsertModificationNode):
         return self.apply_to(self.source)
     
     def apply_to(self, source_node: SourceNode):
-        # Depth first replacement
-        new_children = [self.apply_to(c) for c in source_node.get_children()]
-        new_source_node = SourceNode.copy(source_node)
-        new_source_node.children = new_children
-
-        replacement_node = next((r for r in self.replacements if r.is_applicable(source_node)), None)
-
-        # Apply modification if found
-        if replacement_node is not None:
-            return replacement_node.apply(new_source_node) 
-        else: 
-            return new_source_node
+        return replace_depth_first(source_node, self.replacements)
 
     def get_children(self) -> list[ModificationNode]:
         return self.replacements
@@ -108,6 +127,8 @@ class TemplatedNode(InsertModificationNode):
 
 # Replace nodes
 class ReplaceNode(ReplaceModificationNode):
+    replaces_children = True
+
     def __init__(self, target: SourceNode, insertion: InsertModificationNode) -> None:
         assert_type(target, SourceNode)
         assert_type(insertion, InsertModificationNode)
@@ -156,6 +177,8 @@ class ReplaceTokenKindNode(ReplaceTokenNode):
         super().__init__(targetNode, targetToken, replacement)
 
 class ReplaceChildrenNode(ReplaceModificationNode): 
+    replaces_children = True
+
     def __init__(self, target: SourceNode, insertions: list[InsertModificationNode]) -> None:
         assert_type(target, SourceNode)
         assert_list_type(insertions, InsertModificationNode)
@@ -214,18 +237,7 @@ class CompoundReplaceNode(ReplaceModificationNode):
         return self.apply_to(node)
     
     def apply_to(self, source_node: SourceNode):
-        # Depth first replacement
-        new_children = [self.apply_to(c) for c in source_node.get_children()]
-        new_source_node = SourceNode.copy(source_node)
-        new_source_node.children = new_children
-
-        replacement_node = next((r for r in self.modifications if r.is_applicable(source_node)), None)
-
-        # Apply modification if found
-        if replacement_node is not None:
-            return replacement_node.apply(new_source_node) 
-        else: 
-            return new_source_node
+        return replace_depth_first(source_node, self.modifications)
 
     @staticmethod
     def isApplicableCommonAncestor(node, modifications: list[ModificationNode]):
@@ -237,16 +249,19 @@ class CompoundReplaceNode(ReplaceModificationNode):
 
     @staticmethod
     def isAnyDescendantApplicable(node: SourceNode, modification: ModificationNode):
-        if modification.is_applicable(node):
-            return True
-
-        for child in node.children:
-            if CompoundReplaceNode.isAnyDescendantApplicable(child, modification):
+        # Parents before children, in the same order as a recursive search
+        stack = [node]
+        while stack: 
+            current_node = stack.pop()
+            if modification.is_applicable(current_node):
                 return True
+            stack.extend(reversed(current_node.children))
             
         return False
 
 class TemplatedReplaceNode(ReplaceModificationNode): 
+    replaces_children = True
+
     def __init__(self, target: SourceNode, template: str, insertions: list[InsertModificationNode]) -> None:
         assert_type(target, SourceNode)
         assert_type(template, str)
@@ -329,43 +344,42 @@ class InsertIntializerNode(ReplaceModificationNode):
 
 
 # Node creation functions 
-# Template functions are recursive by default
+# Template functions join all arguments into a single node
 def copy_replace_node(source: SourceNode, *args: list[ReplaceModificationNode]): 
     return CopyReplaceNode(source, args)
 
-def template_node(template1, template2, *args): 
-    if len(args) == 1: 
+# Placeholders {0}, {1}, ... of joined templates, created once since flattened expressions join thousands of them
+placeholders: list[str] = []
+
+def get_placeholders(count: int) -> list[str]:
+    while len(placeholders) < count: 
+        placeholders.append("{" + f"{len(placeholders)}" + "}")
+    return placeholders[:count]
+
+def join_template(template1: str, template2: str, count: int) -> str:
+    """Expands binary templates to count arguments, f.e. ({0}, {1}) and {0}, {1} to ({0}, {1}, {2})"""
+    if count < 2: 
         raise Exception("Unexpected number of arguments")
-    elif len(args) == 2:
-        return TemplatedNode(
-            template1,
-            args
-        )
-    else: 
-        return template_node(
-            template1,
-            template2,
-            template_node(template2, template2, *args[:-1]),
-            args[-1]
-        )
+    
+    (outer_prefix, outer_rest) = template1.split("{0}")
+    (outer_separator, outer_suffix) = outer_rest.split("{1}")
+    inner_separator = template2.split("{0}")[1].split("{1}")[0]
+
+    placeholders = get_placeholders(count)
+    return outer_prefix + inner_separator.join(placeholders[:-1]) + outer_separator + placeholders[-1] + outer_suffix
+
+def template_node(template1, template2, *args): 
+    return TemplatedNode(
+        join_template(template1, template2, len(args)),
+        args
+    )
 
 def template_replace_node(template1, template2, target, *args):
-    if len(args) == 1: 
-        raise Exception("Unexpected number of arguments")
-    elif len(args) == 2:
-        return TemplatedReplaceNode(
-            target,
-            template1,
-            args
-        )
-    else: 
-        return template_replace_node(
-            template1,
-            template2,
-            target, 
-            template_node(template2, template2, *args[:-1]),
-            args[-1],
-        )
+    return TemplatedReplaceNode(
+        target,
+        join_template(template1, template2, len(args)),
+        args
+    )
     
 def assignment_node(*args):
     return template_node("{0} = {1}", "{0} = {1}", *args)
@@ -0,0 +1,28 @@
+import os
+from emcc_builder import NOTIFICATION_VALUES_PATH, OPTIMIZATION_FLAGS, RUNTIME_DIRECTORY, EmccBuilder
+
+# Stands in for library.js and output-capture.js in native builds
+RUNTIME_PATH = os.path.join(RUNTIME_DIRECTORY, "native_runtime.c")
+
+class NativeBuilder(EmccBuilder):
+    """Builds instrumented code with the system C compiler, linked against native_runtime.c instead of the Emscripten runtime
+
+    Native programs write their steps to a binary trace (see native_runtime.c) rather than to a module, so they run
+    without a JS engine, f.e. for grading on a server. Objects are cached like those of emcc builds.
+    """
+    missing_hint = "is a C compiler installed?"
+
+    def __init__(self, optimization = "interactive", cache_directory = None, timeout = 120, cc: list[str]|None = None) -> None:
+        super().__init__(optimization, cache_directory, timeout, cc if cc is not None else [os.environ.get("CC", "cc")])
+
+    def build(self, c_path, output_path):
+        return self.link([self.compile(c_path)], output_path)
+
+    def build_project(self, c_paths: list[str], output_path, include_paths: list[str]|None = None, header_paths: list[str]|None = None, jobs = 1):
+        return self.link(self.compile_project(c_paths, include_paths, header_paths, jobs), output_path)
+
+    def link(self, object_paths: list[str], output_path) -> str:
+        return self.run(self.get_link_command(object_paths + [self.compile(RUNTIME_PATH, header_paths=[NOTIFICATION_VALUES_PATH])], output_path))
+
+    def get_link_command(self, object_paths: list[str], output_path) -> list[str]:
+        return self.emcc + object_paths + OPTIMIZATION_FLAGS[self.optimization] + ["-o", output_path]
@@ -0,0 +1,242 @@
+// Native counterpart of library.js and output-capture.js, for programs built by rewrite.py --native.
+// Steps are appended to a binary trace in the format of wrapper/trace-writer.js, so trace_reader.py and
+// wrapper/trace-loader.js read them like traces of the batch runner:
+//   header: magic "CSTRACE1", record size (uint32), reserved (uint32)
+//   record: id (uint32), address (uint32), value (float64)
+// The trace is written to $SIMULATOR_TRACE (trace.bin by default), at most $SIMULATOR_MAX_STEPS steps are traced.
+// Output is captured into <trace>.stdout and <trace>.stderr, with an output step per line of stdout and per write to stderr.
+// Records and output are buffered in static buffers and written with write(2), so when the program crashes
+// (SIGSEGV, SIGBUS, SIGFPE or SIGABRT) the steps and output up to the crash are written before it terminates.
+// Output is captured with custom stdio streams: fopencookie of glibc and musl, or funopen of macOS and the BSDs.
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include "notification_values.h"
+
+#define RECORD_SIZE 16
+#define BUFFER_RECORDS 4096
+#define STDOUT_ID 0xFFFFFFFFu
+#define STDERR_ID 0xFFFFFFFEu
+#define AGGREGATE_FLAG 0x80000000u
+#define DEFAULT_MAX_STEPS 1000000
+
+// Values of the latest step of each notification, derived steps repeat them
+static double* last_values;
+
+static int trace = -1;
+static int data = -1;
+static char* trace_path;
+static unsigned char buffer[BUFFER_RECORDS * RECORD_SIZE];
+static size_t buffer_offset;
+static uint32_t data_offset;
+static long long step_count;
+static long long max_steps = DEFAULT_MAX_STEPS;
+
+// Async-signal-safe, so the crash handler can write pending steps with it
+static void write_all(int fd, const void* bytes, size_t size) {
+    while (size > 0) {
+        ssize_t written = write(fd, bytes, size);
+        if (written < 0 && errno == EINTR) continue;
+        if (written <= 0) return;
+        bytes = (const char*)bytes + written;
+        size -= written;
+    }
+}
+
+static void flush_records(void) {
+    if (buffer_offset == 0 || trace < 0) return;
+    write_all(trace, buffer, buffer_offset);
+    buffer_offset = 0;
+}
+
+static void write_record(uint32_t id, uint32_t address, double value) {
+    if (trace < 0) return;
+    // Little endian hosts only, like the wasm traces
+    memcpy(buffer + buffer_offset, &id, 4);
+    memcpy(buffer + buffer_offset + 4, &address, 4);
+    memcpy(buffer + buffer_offset + 8, &value, 8);
+    buffer_offset += RECORD_SIZE;
+    if (buffer_offset == sizeof(buffer)) flush_records();
+}
+
+static int open_sidecar(const char* extension) {
+    size_t length = strlen(trace_path) + strlen(extension) + 2;
+    char* path = malloc(length);
+    snprintf(path, length, "%s.%s", trace_path, extension);
+    int fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0666);
+    free(path);
+    return fd;
+}
+
+// Captured streams are unbuffered, lines are buffered here instead of by stdio, so output pending at a crash is kept
+struct output_stream {
+    int fd;
+    uint32_t id;
+    int line_buffered;
+    double end;
+    char pending[BUFSIZ];
+    size_t pending_size;
+};
+
+static struct output_stream output_streams[2];
+
+// Writes the first size pending bytes as one output step
+static void write_pending(struct output_stream* stream, size_t size) {
+    if (size == 0 || stream->fd < 0) return;
+    write_all(stream->fd, stream->pending, size);
+    memmove(stream->pending, stream->pending + size, stream->pending_size - size);
+    stream->pending_size -= size;
+    stream->end += size;
+    write_record(stream->id, 0, stream->end);
+}
+
+static ssize_t write_output(void* cookie, const char* bytes, size_t size) {
+    struct output_stream* stream = cookie;
+    size_t remaining = size;
+    while (remaining > 0) {
+        size_t free_size = sizeof(stream->pending) - stream->pending_size;
+        size_t count = remaining < free_size ? remaining : free_size;
+        memcpy(stream->pending + stream->pending_size, bytes, count);
+        stream->pending_size += count;
+        bytes += count;
+        remaining -= count;
+        if (stream->pending_size == sizeof(stream->pending)) write_pending(stream, stream->pending_size);
+    }
+
+    // Like a line buffered stream, everything up to the last line break is written
+    size_t line_end = stream->pending_size;
+    while (stream->line_buffered && line_end > 0 && stream->pending[line_end - 1] != '\n') line_end--;
+    write_pending(stream, line_end);
+    return size;
+}
+
+#if defined(__APPLE__) || defined(__FreeBSD__) || defined(__NetBSD__) || defined(__OpenBSD__) || defined(__DragonFly__)
+static int write_output_int(void* cookie, const char* bytes, int size) {
+    return (int)write_output(cookie, bytes, (size_t)size);
+}
+
+static FILE* open_output_stream(struct output_stream* stream) {
+    return funopen(stream, NULL, write_output_int, NULL, NULL);
+}
+#else
+static FILE* open_output_stream(struct output_stream* stream) {
+    cookie_io_functions_t functions = { NULL, write_output, NULL, NULL };
+    return fopencookie(stream, "w", functions);
+}
+#endif
+
+static void capture_output(FILE** target, struct output_stream* stream, const char* extension, uint32_t id, int line_buffered) {
+    stream->fd = open_sidecar(extension);
+    stream->id = id;
+    stream->line_buffered = line_buffered;
+    FILE* file = stream->fd >= 0 ? open_output_stream(stream) : NULL;
+    if (file == NULL) return;
+    setvbuf(file, NULL, _IONBF, 0);
+    *target = file;
+}
+
+static void close_trace(void) {
+    if (trace < 0) return;
+    for (int i = 0; i < 2; i++) write_pending(&output_streams[i], output_streams[i].pending_size);
+    flush_records();
+    close(trace);
+    trace = -1;
+    if (data >= 0) close(data);
+    for (int i = 0; i < 2; i++) {
+        if (output_streams[i].fd >= 0) close(output_streams[i].fd);
+        output_streams[i].fd = -1;
+    }
+}
+
+static const int crash_signals[] = { SIGSEGV, SIGBUS, SIGFPE, SIGABRT };
+
+// Stack overflows of runaway recursion are reported by SIGSEGV, so the handler runs on a stack of its own
+static char crash_stack[1 << 16];
+
+static void write_at_crash(int signal_number) {
+    // Only writes static buffers with write(2), the crash may have interrupted stdio or malloc
+    for (int i = 0; i < 2; i++) write_pending(&output_streams[i], output_streams[i].pending_size);
+    flush_records();
+    // The handler was reset to the default action, which terminates the program like the crash would have
+    raise(signal_number);
+}
+
+static void handle_crashes(void) {
+    stack_t stack = { 0 };
+    stack.ss_sp = crash_stack;
+    stack.ss_size = sizeof(crash_stack);
+    sigaltstack(&stack, NULL);
+
+    struct sigaction action;
+    memset(&action, 0, sizeof(action));
+    action.sa_handler = write_at_crash;
+    action.sa_flags = SA_ONSTACK | SA_RESETHAND | SA_NODEFER;
+    sigemptyset(&action.sa_mask);
+    for (size_t i = 0; i < sizeof(crash_signals) / sizeof(*crash_signals); i++) sigaction(crash_signals[i], &action, NULL);
+}
+
+__attribute__((constructor(101))) static void open_trace(void) {
+    const char* path = getenv("SIMULATOR_TRACE");
+    const char* steps = getenv("SIMULATOR_MAX_STEPS");
+    trace_path = strdup(path != NULL ? path : "trace.bin");
+    if (steps != NULL) max_steps = atoll(steps);
+
+    trace = open(trace_path, O_WRONLY | O_CREAT | O_TRUNC, 0666);
+    if (trace < 0) {
+        perror(trace_path);
+        exit(EXIT_FAILURE);
+    }
+    unsigned char header[16] = "CSTRACE1";
+    uint32_t record_size = RECORD_SIZE;
+    memcpy(header + 8, &record_size, 4);
+    write_all(trace, header, sizeof(header));
+
+    // A line of stdout is one output step like the terminal of Emscripten, every write to stderr is one
+    capture_output(&stdout, &output_streams[0], "stdout", STDOUT_ID, 1);
+    capture_output(&stderr, &output_streams[1], "stderr", STDERR_ID, 0);
+    atexit(close_trace);
+    handle_crashes();
+}
+
+static void push_step(int id, uint32_t record_id, uint32_t address, double value) {
+    if (++step_count > max_steps) {
+        fprintf(stderr, "Too many steps (possible infinite loop)\n");
+        exit(EXIT_FAILURE);
+    }
+    write_record(record_id, address, value);
+    if (id < 0 || id >= notification_count) return;
+    // Notifications are registered by constructors, so all of them are known by the first step
+    if (last_values == NULL) last_values = calloc(notification_count, sizeof(*last_values));
+
+    // Derived steps are written as separate records, so record indexes are step indexes
+    last_values[id] = value;
+    for (int i = id + 1; i < notification_count && notifications[i].derived_from >= 0; i++) {
+        last_values[i] = last_values[notifications[i].derived_from];
+        write_record((uint32_t)i | ((notifications[i].flags & VALUE_AGGREGATE) ? AGGREGATE_FLAG : 0), 0, last_values[i]);
+        step_count++;
+    }
+}
+
+void notify(int id, void* address) {
+    double value = 0;
+    if (address != NULL && id >= 0 && id < notification_count) value = read_value(&notifications[id], address);
+    push_step(id, (uint32_t)id, (uint32_t)(uintptr_t)address, value);
+}
+
+void notify_aggregate(int id, void* address, unsigned long size) {
+    if (data < 0) data = open_sidecar("data");
+    uint32_t length = (uint32_t)size;
+    if (data >= 0) {
+        write_all(data, &length, 4);
+        write_all(data, address, size);
+    }
+    uint32_t offset = data_offset + 4;
+    data_offset = offset + length;
+    push_step(id, (uint32_t)id | AGGREGATE_FLAG, (uint32_t)(uintptr_t)address, offset);
+}
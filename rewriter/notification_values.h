@@ -0,0 +1,61 @@
+// Value types of notifications, shared by the C runtimes (native_runtime.c and trace_buffer.c) of which a program links one.
+// Instrumented code registers the size and flags of each notification before main, see get_native_prefix in rewrite.py.
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define VALUE_SIGNED 1
+#define VALUE_FLOAT 2
+#define VALUE_POINTER 4
+#define VALUE_AGGREGATE 8
+
+struct simulator_notification {
+    unsigned char size;
+    unsigned char flags;
+    int derived_from;
+};
+
+static struct simulator_notification* notifications;
+static int notification_count;
+
+void register_notifications(int first_id, int count, const unsigned char* values, const int* derived_from) {
+    if (first_id + count > notification_count) {
+        notifications = realloc(notifications, (first_id + count) * sizeof(*notifications));
+        memset(notifications + notification_count, 0, (first_id + count - notification_count) * sizeof(*notifications));
+        notification_count = first_id + count;
+    }
+    for (int i = 0; i < count; i++) {
+        notifications[first_id + i].size = values[2 * i];
+        notifications[first_id + i].flags = values[2 * i + 1];
+        notifications[first_id + i].derived_from = derived_from[i];
+    }
+}
+
+static double read_value(const struct simulator_notification* notification, const void* address) {
+    unsigned char size = notification->size;
+    unsigned char flags = notification->flags;
+    if (flags & VALUE_POINTER) return (double)(uintptr_t)*(void* const*)address;
+    if (flags & VALUE_FLOAT) {
+        if (size == sizeof(float)) return *(const float*)address;
+        if (size == sizeof(double)) return *(const double*)address;
+        return (double)*(const long double*)address;
+    }
+    // Each branch converts to double itself, a signed and an unsigned operand of ?: would be converted to unsigned
+    if (flags & VALUE_SIGNED) {
+        switch (size) {
+            case 1: return *(const int8_t*)address;
+            case 2: return *(const int16_t*)address;
+            case 4: return *(const int32_t*)address;
+            case 8: return (double)*(const int64_t*)address;
+        }
+    }
+    else {
+        switch (size) {
+            case 1: return *(const uint8_t*)address;
+            case 2: return *(const uint16_t*)address;
+            case 4: return *(const uint32_t*)address;
+            case 8: return (double)*(const uint64_t*)address;
+        }
+    }
+    return 0.0 / 0.0;
+}
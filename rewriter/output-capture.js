@@ -0,0 +1,36 @@
+// Keeps stdout and stderr in one append-only text per stream. Output steps only store the end offset of their text,
+// so the wrapper reads the output up to any step with a single substring (see Simulation.getOutput).
+Module.simulatorOutput = Module.simulatorOutput || { stdout: "", stderr: "" };
+
+Module.writeSimulatorOutput = function(stream, text) {
+    if (text.length === 0) return;
+    // Steps buffered in linear memory precede the output (see trace_buffer.c)
+    if (Module.flushSimulatorSteps) Module.flushSimulatorSteps();
+    Module.simulatorOutput[stream] += text;
+    // Counted towards the step limit and memory checkpoints like notified steps (see library.js). Asyncify would repeat
+    // the write when resuming a pause in it, so an output step reaching simulatorPauseAt pauses at the next notified step.
+    Module.simulatorRecordStep({ action: stream, end: Module.simulatorOutput[stream].length });
+};
+
+// Output which does not pass through the terminal, lines are passed without their line break
+Module.print = function() {
+    Module.writeSimulatorOutput("stdout", Array.from(arguments).join("") + "\n");
+};
+Module.printErr = function() {
+    Module.writeSimulatorOutput("stderr", Array.from(arguments).join("") + "\n");
+};
+
+// Terminal writes are captured as written, including lines without a line break,
+// rather than character by character through the line buffer of the default terminal
+Module.preRun = Module.preRun || [];
+Module.preRun.push(function() {
+    if (typeof TTY === "undefined") return;
+
+    var decoders = { stdout: new TextDecoder("utf-8"), stderr: new TextDecoder("utf-8") };
+    TTY.stream_ops.write = function(stream, buffer, offset, length) {
+        var name = stream.tty && stream.tty.ops === TTY.default_tty1_ops ? "stderr" : "stdout";
+        var bytes = new Uint8Array(buffer.buffer, buffer.byteOffset + offset, length);
+        Module.writeSimulatorOutput(name, decoders[name].decode(bytes, { stream: true }));
+        return length;
+    };
+});
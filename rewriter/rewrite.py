@@ -1,10 +1,16 @@
+import argparse
 import sys
 import json
 import os
-import clang.cindex
+from concurrent.futures import ProcessPoolExecutor
 from ast_visitors import AstPrinter
-from source_nodes import SourceTreeCreator, SourceTreePrinter
-from source_visitors import CompositeTreeVisitor, NotifyDataSerializer, PartialTreeVisitor_BinaryOperator_Assignment, PartialTreeVisitor_BinaryOperator, PartialTreeVisitor_CallExpr, PartialTreeVisitor_DeclRefExpr, PartialTreeVisitor_FunctionDecl, PartialTreeVisitor_GenericLiteral, PartialTreeVisitor_TranslationUnit, PartialTreeVisitor_UnaryOperator, PartialTreeVisitor_UnaryOperator_Assignment, PartialTreeVisitor_VarDecl, SourceTreeModifier
+from emcc_builder import OPTIMIZATION_FLAGS, EmccBuilder
+from native_builder import NativeBuilder
+from rewrite_context import RELOCATION_MARKER, RewriteContext
+from source_analysis import RedundantNotifyAnalysis, get_reentrant_functions
+from source_nodes import SourceNode, SourceTreeCreator, SourceTreePrinter
+from translation_unit_cache import TranslationUnitCache, is_main_file_cursor
+from source_visitors import COUNTERS_NAME, CompositeTreeVisitor, NotifyDataSerializer, NotifyMetadataSerializer, PartialTreeVisitor_BinaryOperator_Assignment, PartialTreeVisitor_BinaryOperator, PartialTreeVisitor_CallExpr, PartialTreeVisitor_Counter, PartialTreeVisitor_DeclRefExpr, PartialTreeVisitor_DeclStmt_Aggregate, PartialTreeVisitor_FunctionDecl, PartialTreeVisitor_GenericLiteral, PartialTreeVisitor_TranslationUnit, PartialTreeVisitor_UnaryOperator, PartialTreeVisitor_UnaryOperator_Assignment, PartialTreeVisitor_VarDecl, PartialTreeVisitor_VarDecl_Counter, SourceTreeModifier
 
 def read_file(file_name): 
     f = open(file_name)
@@ -35,24 +41,26 @@ def get_path_with_extension(source_path, file_extension):
     else: 
         return file_name + "." + file_extension    
 
-def generate_temp_files(source_path, c_target_path, js_target_path):
-    source_content = read_file(source_path)
-    
-    print('\nGenerating AST...')
-    tu = clang.cindex.Index.create().parse(source_path)
-    tu_filter = lambda n: n.location.file.name == source_path
-    AstPrinter(tu_filter).print(source_content, tu.cursor)
+# Kept per process, so workers parse the source file once for all of their partitions
+translation_unit_cache: TranslationUnitCache|None = None
 
-    print('\nGenerating source tree...')
-    source_root = SourceTreeCreator(tu_filter).create(source_content, tu.cursor)
-    SourceTreePrinter(False).print(source_root)
-    SourceTreePrinter(True).print(source_root)
+def parse_source(source_path, source_content):
+    global translation_unit_cache
+    if translation_unit_cache is None: 
+        translation_unit_cache = TranslationUnitCache()
+    return translation_unit_cache.parse(source_path, source_content)
 
-    print('\nGenerating modification tree...')
-    partial_visitors = [
+def create_partial_visitors(coverage = False):
+    if coverage: 
+        return [
+            PartialTreeVisitor_VarDecl_Counter(),
+            PartialTreeVisitor_Counter()
+        ]
+    return [
         #PartialTreeVisitor_TranslationUnit(),
         PartialTreeVisitor_FunctionDecl(),
         PartialTreeVisitor_VarDecl(),
+        PartialTreeVisitor_DeclStmt_Aggregate(),
         PartialTreeVisitor_CallExpr(),
         PartialTreeVisitor_BinaryOperator_Assignment(),
         PartialTreeVisitor_BinaryOperator(),
@@ -61,43 +69,326 @@ def generate_temp_files(source_path, c_target_path, js_target_path):
         PartialTreeVisitor_DeclRefExpr(),
         PartialTreeVisitor_GenericLiteral()
     ]
-    composite_visitor = CompositeTreeVisitor(partial_visitors)
+
+def get_partitions(sizes, number_of_partitions):
+    """Splits consecutive items into ranges of roughly equal total size"""
+    partition_size = sum(sizes) / max(1, number_of_partitions)
+    partitions = []
+    start_index = 0
+    total_size = 0
+    for (i, size) in enumerate(sizes):
+        total_size += size
+        if total_size >= partition_size * (len(partitions) + 1): 
+            partitions.append(range(start_index, i + 1))
+            start_index = i + 1
+    if start_index < len(sizes):
+        partitions.append(range(start_index, len(sizes)))
+    return partitions
+
+def instrument_partition(source_path, indexes, reentrant_functions = None, coverage = False):
+    """Instruments top level declarations at indexes, with notification ids relative to the partition
+
+    Redundant notifications are eliminated when the reentrant functions of the whole file are given.
+    """
+    source_content = read_file(source_path)
+    context = RewriteContext(relocatable=True)
+
+    tu = parse_source(source_path, source_content)
+    tu_filter = is_main_file_cursor
+    source_root = SourceTreeCreator(tu_filter, context).create_partition(source_content, tu.cursor, indexes)
+    composite_visitor = CompositeTreeVisitor(create_partial_visitors(coverage), context)
+
+    codes = []
+    for i in indexes: 
+        source_node = source_root.get_children()[i]
+        if reentrant_functions is not None: 
+            context.derivations.update(RedundantNotifyAnalysis(reentrant_functions).analyze(source_node))
+        modification_node = composite_visitor.visit(source_node)
+        modified_source_node = SourceTreeModifier([modification_node]).visit(source_node) if modification_node is not None else source_node
+        codes.append(f"{modified_source_node}")
+    
+    return (codes, composite_visitor.get_notifies(), context.notify_count)
+
+def relocate_notifications(notifications, notify_offset, line_offset = 0):
+    """Shifts ids of notifications by the ids of preceding partitions or files, and their lines by the lines of preceding files"""
+    for notification in notifications: 
+        notification.id += notify_offset
+        if notification.derived_from is not None: 
+            notification.derived_from += notify_offset
+        if notification.location is not None and line_offset != 0: 
+            notification.location = [notification.location[0] + line_offset, notification.location[1], notification.location[2] + line_offset, notification.location[3]]
+
+def generate_partitioned_code(source_path, source_content, jobs, eliminate_redundant_notifies = False, coverage = False):
+    """Instruments top level declarations in a process pool, stitching the results back in source order"""
+    if RELOCATION_MARKER in source_content: 
+        raise Exception("Source file contains null characters")
+
+    tu = parse_source(source_path, source_content)
+    tu_filter = is_main_file_cursor
+    source_creator = SourceTreeCreator(tu_filter)
+    top_level_nodes = source_creator.get_children(tu.cursor, 0)
+    sizes = [n.extent.end.offset - n.extent.start.offset for n in top_level_nodes]
+    partitions = get_partitions(sizes, 4 * jobs)
+    reentrant_functions = get_reentrant_functions(tu.cursor, tu_filter) if eliminate_redundant_notifies else None
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor: 
+        results = list(executor.map(instrument_partition, [source_path] * len(partitions), partitions, [reentrant_functions] * len(partitions), [coverage] * len(partitions)))
+
+    codes = []
+    notifications = []
+    notify_offset = 0
+    for (partition_codes, partition_notifications, notify_count) in results:
+        relocate_notifications(partition_notifications, notify_offset)
+        codes.extend(RewriteContext.relocate_notify_ids(c, notify_offset) for c in partition_codes)
+        notifications.extend(partition_notifications)
+        notify_offset += notify_count
+
+    source_root = source_creator.create_partition(source_content, tu.cursor, range(0))
+    source_root.children = [SourceNode.create(None, c, [], []) for c in codes]
+    return (f"{source_root}", notifications)
+
+def generate_code(source_path, source_content, eliminate_redundant_notifies = False, coverage = False): 
+    context = RewriteContext()
+
+    print('\nGenerating AST...')
+    tu = parse_source(source_path, source_content)
+    tu_filter = is_main_file_cursor
+    AstPrinter(tu_filter).print(source_content, tu.cursor)
+
+    print('\nGenerating source tree...')
+    source_root = SourceTreeCreator(tu_filter, context).create(source_content, tu.cursor)
+    SourceTreePrinter(False).print(source_root)
+    SourceTreePrinter(True).print(source_root)
+
+    if eliminate_redundant_notifies: 
+        print('\nAnalyzing redundant notifications...')
+        context.derivations = RedundantNotifyAnalysis(get_reentrant_functions(tu.cursor, tu_filter)).analyze(source_root)
+
+    print('\nGenerating modification tree...')
+    composite_visitor = CompositeTreeVisitor(create_partial_visitors(coverage), context)
     modification_root = composite_visitor.visit(source_root)
+    modified_source_root = SourceTreeModifier([modification_root]).visit(source_root)
+    return (f"{modified_source_root}", composite_visitor.get_notifies())
+
+def get_project_headers(tu, project_root) -> list[str]:
+    """Returns real paths of the headers below project root a translation unit includes, directly or through other headers"""
+    root = os.path.join(os.path.realpath(project_root), "")
+    headers = []
+    for inclusion in tu.get_includes():
+        header_path = os.path.realpath(inclusion.include.name)
+        if header_path.startswith(root) and header_path not in headers: 
+            headers.append(header_path)
+    return headers
+
+def instrument_unit(source_path, project_root, eliminate_redundant_notifies = False, coverage = False):
+    """Instruments a source or header file of a project, with notification ids relative to the file
+
+    Headers are parsed as files of their own, so each of them is instrumented once, however many files include it.
+    Returns the code, the notifications and their count, and the project headers the file includes.
+    """
+    source_content = read_file(source_path)
+    if RELOCATION_MARKER in source_content: 
+        raise Exception(f"{source_path} contains null characters")
+    context = RewriteContext(relocatable=True)
+
+    tu = parse_source(source_path, source_content)
+    tu_filter = is_main_file_cursor
+    source_root = SourceTreeCreator(tu_filter, context).create(source_content, tu.cursor)
+    headers = get_project_headers(tu, project_root)
+
+    if eliminate_redundant_notifies: 
+        # Functions declared in project headers may be defined in other files and call back into this one
+        is_project_cursor = lambda c: tu_filter(c) or (c.location.file is not None and os.path.realpath(c.location.file.name) in headers)
+        context.derivations = RedundantNotifyAnalysis(get_reentrant_functions(tu.cursor, is_project_cursor)).analyze(source_root)
+
+    composite_visitor = CompositeTreeVisitor(create_partial_visitors(coverage), context)
+    modification_root = composite_visitor.visit(source_root)
+    modified_source_root = SourceTreeModifier([modification_root]).visit(source_root) if modification_root is not None else source_root
+    return (f"{modified_source_root}", composite_visitor.get_notifies(), context.notify_count, headers)
+
+def get_project_target_path(source_path, project_root, output_directory) -> str:
+    """Returns the path of a project file below output directory, so relative includes of instrumented files find instrumented headers"""
+    relative_path = os.path.relpath(os.path.realpath(source_path), os.path.realpath(project_root))
+    if relative_path.split(os.sep)[0] == os.pardir: 
+        raise Exception(f"{source_path} is outside of project root {project_root}")
+    return os.path.join(output_directory, relative_path)
+
+def generate_project_files(source_paths, project_root, output_directory, js_target_path, meta_target_path, jobs = 1, eliminate_redundant_notifies = False, coverage = False, native = False):
+    """Instruments source files of a project and the project headers they include in a process pool
+
+    Every file gets its own range of notification ids. Their metadata is merged into one file, whose code shows the
+    files one after another, each below a comment naming it. Returns paths of the instrumented source files and headers.
+    """
+    source_paths = [os.path.realpath(p) for p in source_paths]
+    os.makedirs(output_directory, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=jobs) as executor: 
+        results = list(executor.map(instrument_unit, source_paths, [project_root] * len(source_paths), [eliminate_redundant_notifies] * len(source_paths), [coverage] * len(source_paths)))
+        header_paths = list(dict.fromkeys(h for (_, _, _, headers) in results for h in headers))
+        results += list(executor.map(instrument_unit, header_paths, [project_root] * len(header_paths), [eliminate_redundant_notifies] * len(header_paths), [coverage] * len(header_paths)))
+
+    codes = []
+    notifications = []
+    source_parts = []
+    notify_offset = 0
+    line_offset = 0
+    for (path, (code, unit_notifications, notify_count, _)) in zip(source_paths + header_paths, results):
+        source_part = f"// {os.path.relpath(path, os.path.realpath(project_root))}\n{read_file(path)}"
+        source_part += "" if source_part.endswith("\n") else "\n"
+        relocate_notifications(unit_notifications, notify_offset, line_offset + 1)
+        codes.append(RewriteContext.relocate_notify_ids(code, notify_offset))
+        notifications.extend(unit_notifications)
+        source_parts.append(source_part)
+        notify_offset += notify_count
+        line_offset += source_part.count("\n")
 
     print('\nGenerating metadata file...')
-    notifications = composite_visitor.get_notifies()
-    notification_json = NotifyDataSerializer().serialize_list(notifications)
-    code_json = json.dumps(source_content)
-    js_target_content = (
+    write_binary_file(meta_target_path, NotifyMetadataSerializer().serialize("".join(source_parts), notifications))
+    write_file(js_target_path, get_js_content(meta_target_path))
+
+    print("\nGenerating code files...")
+    c_target_paths = [get_path_with_extension(get_project_target_path(p, project_root, output_directory), 'g.c') for p in source_paths]
+    header_target_paths = [get_project_target_path(p, project_root, output_directory) for p in header_paths]
+    for (i, (target_path, code)) in enumerate(zip(c_target_paths + header_target_paths, codes)): 
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Counters and native value types are defined by the first source file, the others refer to them
+        native_prefix = get_native_prefix(notifications) if native and i == 0 else ""
+        write_file(target_path, f"{native_prefix}{get_code_prefix(notifications, coverage, defines_counters=(i == 0))} {code}")
+    return (c_target_paths, header_target_paths)
+
+def write_binary_file(file_name, content): 
+    f = open(file_name, "wb")
+    f.write(content)
+    f.close()
+
+def get_code_prefix(notifications, coverage = False, defines_counters = True):
+    """Declares the runtime functions instrumented code calls, coverage builds register their counters before main"""
+    if not coverage: 
+        return "void notify(int ref, void* data);\nvoid notify_aggregate(int ref, void* data, unsigned long size);\n"
+    if not defines_counters: 
+        return f"extern unsigned long long {COUNTERS_NAME}[];\n"
+    count = max(1, len(notifications))
+    return (
+        "void register_counters(unsigned long long* counters, int count);\n"
+        f"unsigned long long {COUNTERS_NAME}[{count}];\n"
+        f"__attribute__((constructor)) static void register_{COUNTERS_NAME}(void) {{ register_counters({COUNTERS_NAME}, {count}); }}\n"
+    )
+
+def get_native_prefix(notifications):
+    """Registers how the C runtimes (see notification_values.h) read values of notifications, which have consecutive ids, and which of them are derived"""
+    if len(notifications) == 0: 
+        return ""
+    values = []
+    for n in notifications: 
+        if n.size is not None: 
+            values.append("0, 8")
+        elif n.value_type is None: 
+            values.append("0, 0")
+        elif n.value_type == "void*": 
+            values.append("sizeof(void*), 4")
+        elif n.value_type in ["float", "double", "long double"]: 
+            values.append(f"sizeof({n.value_type}), 2")
+        else: 
+            values.append(f"sizeof({n.value_type}), ({n.value_type})-1 < 0")
+    derived_from = [f"{n.derived_from if n.derived_from is not None else -1}" for n in notifications]
+    return (
+        "void register_notifications(int first_id, int count, const unsigned char* values, const int* derived_from);\n"
+        f"static const unsigned char simulator_values[] = {{ {', '.join(values)} }};\n"
+        f"static const int simulator_derived_from[] = {{ {', '.join(derived_from)} }};\n"
+        f"__attribute__((constructor)) static void register_simulator_notifications(void) {{ register_notifications({notifications[0].id}, {len(notifications)}, simulator_values, simulator_derived_from); }}\n"
+    )
+
+def get_js_content(meta_target_path):
+    meta_target_json = json.dumps(os.path.basename(meta_target_path))
+    return (
         "var Module = Module || { };\n"
-        "Module.print = function() { \n   Module.simulatorSteps = Module.simulatorSteps || [];\n   Module.simulatorSteps.push({ action: \"stdout\", value: Array.from(arguments).join(\"\") + \"\\\\n\\n\"});\n}\n"
-        "Module.printErr = function() { \n   Module.simulatorSteps = Module.simulatorSteps || [];\n   Module.simulatorSteps.push({ action: \"stderr\", value: Array.from(arguments).join(\"\") + \"\\\\n\\n\"});\n}\n"
-        "Module.preRun = Module.preRun || [];\n"
-        f"Module.preRun.push(function() {{\n Module.simulatorCode = {code_json};\n Module.simulatorNotifications = {notification_json}; \n}})"
+        f"Module.simulatorMetadataFile = {meta_target_json};\n"
     )
-    write_file(js_target_path, js_target_content)
+
+def generate_temp_files(source_path, c_target_path, js_target_path, meta_target_path, jobs = 1, eliminate_redundant_notifies = False, coverage = False, native = False):
+    source_content = read_file(source_path)
+
+    if jobs > 1:
+        print(f'\nGenerating modified code in {jobs} processes...')
+        (modified_code, notifications) = generate_partitioned_code(source_path, source_content, jobs, eliminate_redundant_notifies, coverage)
+    else: 
+        (modified_code, notifications) = generate_code(source_path, source_content, eliminate_redundant_notifies, coverage)
+
+    print('\nGenerating metadata file...')
+    meta_target_content = NotifyMetadataSerializer().serialize(source_content, notifications)
+    write_binary_file(meta_target_path, meta_target_content)
+
+    write_file(js_target_path, get_js_content(meta_target_path))
 
     print("\nGenerating code file...")
-    modified_source_root = SourceTreeModifier([modification_root]).visit(source_root)
-    c_target_content = f"void notify(int ref, void* data);\n {modified_source_root}"
+    native_prefix = get_native_prefix(notifications) if native else ""
+    c_target_content = f"{native_prefix}{get_code_prefix(notifications, coverage)} {modified_code}"
     write_file(c_target_path, c_target_content)
 
 if __name__ == "__main__":
-    #if len(sys.argv) < 2:
-    #    raise Exception("Sorry, please supply an input file")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_files", nargs="+", help="source file, or source files of a project, which are linked into one program")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes instrumenting functions, or the files of a project, in parallel")
+    parser.add_argument("--eliminate-redundant-notifies", action="store_true", help="skip notifications of values known from earlier steps, they are replayed by the wrapper")
+    parser.add_argument("--optimization", choices=list(OPTIMIZATION_FLAGS), default="interactive", help="interactive builds compile fast, optimized builds are meant for published examples")
+    parser.add_argument("--timeout", type=int, default=120, help="seconds each compiler run may take")
+    parser.add_argument("--pause-on-demand", action="store_true", help="build with Asyncify, so the wrapper can run the program step by step")
+    parser.add_argument("--coverage", action="store_true", help="only count executions of statements, for coverage and hot lines, instead of tracing values")
+    parser.add_argument("--native", action="store_true", help="build an executable with the system C compiler (gcc or clang against glibc, musl, macOS or BSD libc), which writes a binary trace to $SIMULATOR_TRACE")
+    parser.add_argument("--trace-buffer", action="store_true", help="buffer steps in linear memory, which the wrapper reads in batches instead of one call per step")
+    parser.add_argument("--project-root", default=".", help="directory of a project, headers below it are instrumented")
+    parser.add_argument("--output-directory", help="directory receiving the instrumented files and the program, simulator-build below the project root for projects and the directory of the source file otherwise")
+    args = parser.parse_args()
+    if args.native and (args.coverage or args.pause_on_demand): 
+        parser.error("--native builds trace values, they cannot be combined with --coverage or --pause-on-demand")
+    if args.trace_buffer and (args.native or args.coverage or args.pause_on_demand): 
+        parser.error("--trace-buffer builds trace values without pausing, they cannot be combined with --native, --coverage or --pause-on-demand")
+    # Trace buffers read values in C like native builds, with the value types registered by the instrumented code
+    registers_values = args.native or args.trace_buffer
 
     script_file = sys.argv[0]
-    input_file = sys.argv[1]
+    library_path = get_path_with_name(script_file, 'library.js')
+    metadata_library_path = get_path_with_name(script_file, 'metadata.js')
+    output_library_path = get_path_with_name(script_file, 'output-capture.js')
+    builder = EmccBuilder(args.optimization, timeout=args.timeout, asyncify=args.pause_on_demand, trace_buffer=args.trace_buffer)
+    native_builder = NativeBuilder(args.optimization, timeout=args.timeout)
+
+    if len(args.input_files) > 1: 
+        output_directory = args.output_directory if args.output_directory is not None else os.path.join(args.project_root, "simulator-build")
+        temp_js_path = os.path.join(output_directory, 'output.g.js')
+        output_meta_path = os.path.join(output_directory, 'output.meta')
+        (temp_c_paths, temp_header_paths) = generate_project_files(args.input_files, args.project_root, output_directory, temp_js_path, output_meta_path, args.jobs, args.eliminate_redundant_notifies, args.coverage, registers_values)
+
+        # Headers outside of the project are still found relative to the original source files
+        include_paths = list(dict.fromkeys(os.path.dirname(os.path.realpath(p)) for p in args.input_files))
+        try: 
+            if args.native: 
+                print(native_builder.build_project(temp_c_paths, os.path.join(output_directory, 'output'), include_paths, temp_header_paths, args.jobs))
+            else: 
+                print(builder.build_project(temp_c_paths, [metadata_library_path, output_library_path, temp_js_path], library_path, os.path.join(output_directory, 'output.js'), include_paths, temp_header_paths, args.jobs))
+        except Exception as e: 
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    input_file = args.input_files[0]
+    # Outputs have fixed names, so programs of the same directory are built in directories of their own
+    if args.output_directory is not None: 
+        os.makedirs(args.output_directory, exist_ok=True)
+    target_file = os.path.join(args.output_directory, os.path.basename(input_file)) if args.output_directory is not None else input_file
 
     # Generate temporary files 
-    temp_c_path = get_path_with_extension(input_file, 'g.c')
-    temp_js_path = get_path_with_extension(input_file, 'g.js')
-    generate_temp_files(input_file, temp_c_path, temp_js_path)
+    temp_c_path = get_path_with_extension(target_file, 'g.c')
+    temp_js_path = get_path_with_extension(target_file, 'g.js')
+    output_meta_path = get_path_with_name(target_file, 'output.meta')
+    generate_temp_files(input_file, temp_c_path, temp_js_path, output_meta_path, args.jobs, args.eliminate_redundant_notifies, args.coverage, registers_values)
 
     # Generate output file
-    library_path = get_path_with_name(script_file, 'library.js')
-    output_c_path = get_path_with_name(input_file, 'output.js')
-    args = (temp_c_path, temp_js_path, library_path, output_c_path)
-    command = 'emcc %s -s WASM=1 -s "EXPORTED_FUNCTIONS=[\'_main\']" -s "NO_EXIT_RUNTIME=0" --pre-js %s --js-library %s -o %s' % args
-    print(command)
-    os.system(command)
\ No newline at end of file
+    output_c_path = get_path_with_name(target_file, 'output.js')
+    try: 
+        if args.native: 
+            print(native_builder.build(temp_c_path, get_path_with_name(target_file, 'output')))
+        else: 
+            print(builder.build(temp_c_path, [metadata_library_path, output_library_path, temp_js_path], library_path, output_c_path))
+    except Exception as e: 
+        print(e, file=sys.stderr)
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,35 @@
+import itertools
+
+# Marks notification ids in relocatable code, source files cannot contain it
+RELOCATION_MARKER = "\0"
+
+class RewriteContext: 
+    """State of a single rewrite, so several rewrites can run sequentially or in parallel threads"""
+    def __init__(self, first_notify_id = 0, relocatable = False) -> None:
+        self.node_ids = itertools.count(1)
+        self.first_notify_id = first_notify_id
+        self.notify_count = 0
+        self.relocatable = relocatable
+        self.notifies = []
+        self.variables = []
+        # Redundant source nodes mapped to the source node they are derived from, see RedundantNotifyAnalysis
+        self.derivations = dict()
+        self.node_notify_ids = dict()
+
+    def next_node_id(self) -> int: 
+        return next(self.node_ids)
+    
+    def next_notify_id(self) -> int: 
+        notify_id = self.first_notify_id + self.notify_count
+        self.notify_count += 1
+        return notify_id
+    
+    def format_notify_id(self, notify_id: int) -> str:
+        """Relocatable ids are marked, so they can be shifted once the ids of preceding partitions are known"""
+        return f"{RELOCATION_MARKER}{notify_id}{RELOCATION_MARKER}" if self.relocatable else f"{notify_id}"
+
+    @staticmethod
+    def relocate_notify_ids(code: str, offset: int) -> str:
+        parts = code.split(RELOCATION_MARKER)
+        parts[1::2] = [f"{int(p) + offset}" for p in parts[1::2]]
+        return "".join(parts)
@@ -0,0 +1,191 @@
+from source_nodes import SourceNode, SourceNodeResolver
+
+ASSIGNMENT_OPERATORS = ["=", "+=", "-=", "*=", "/=", "%=", "<<=", ">>=", "&=", "^=", "|="]
+
+# Expressions which the partial visitors flatten into comma expressions, evaluated left to right in notify id order
+FLATTENED_KINDS = ["BinaryOperator", "CompoundAssignmentOperator", "UnaryOperator", "CallExpr", "ParenExpr", "UnexposedExpr", "CStyleCastExpr", "DeclRefExpr", "IntegerLiteral", "FloatingLiteral", "CharacterLiteral", "StringLiteral"]
+
+# Full expressions which start with a stat notification, so the step before their first read is always executed
+STATEMENT_KINDS = ["CompoundStmt", "ForStmt", "ReturnStmt", "IfStmt", "WhileStmt"]
+STATEMENT_ROOT_KINDS = ["BinaryOperator", "CompoundAssignmentOperator", "UnaryOperator", "CallExpr", "DeclRefExpr"]
+
+# Jumps which can skip declarations, so a declaration does not necessarily precede the reads of its variable
+JUMP_KINDS = ["GotoStmt", "IndirectGotoStmt", "SwitchStmt"]
+
+SCALAR_TYPE_KINDS = ["BOOL", "CHAR_U", "UCHAR", "USHORT", "UINT", "ULONG", "ULONGLONG", "CHAR_S", "SCHAR", "SHORT", "INT", "LONG", "LONGLONG", "FLOAT", "DOUBLE", "LONGDOUBLE"]
+
+def get_descendants(source_node: SourceNode) -> list[SourceNode]:
+    """Returns source node and its descendants in pre-order"""
+    descendants = []
+    stack = [source_node]
+    while stack:
+        node = stack.pop()
+        descendants.append(node)
+        stack.extend(reversed(node.children))
+    return descendants
+
+def get_cursor_descendants(cursor, filter = None) -> list:
+    """Returns descendants of a clang cursor in pre-order, only filtering its direct children"""
+    descendants = []
+    stack = list(reversed([c for c in cursor.get_children() if filter is None or filter(c)]))
+    while stack:
+        node = stack.pop()
+        descendants.append(node)
+        stack.extend(reversed(list(node.get_children())))
+    return descendants
+
+def get_reentrant_functions(cursor, filter = None) -> set[str]:
+    """Returns USRs of functions defined below cursor, which can be entered again while they are running
+
+    Functions are reentrant when they can reach themselves through calls to functions defined in the same file,
+    or through functions declared but not defined in it. When the address of any function is taken, all functions are reentrant.
+    """
+    from clang.cindex import CursorKind
+
+    calls = dict()
+    undefined_functions = set()
+    callee_hashes = set()
+    is_address_taken = False
+    current_function = None
+
+    for node in get_cursor_descendants(cursor, filter):
+        if node.kind == CursorKind.FUNCTION_DECL:
+            if node.is_definition():
+                current_function = node.get_usr()
+                calls.setdefault(current_function, set())
+            elif filter is None or filter(node):
+                undefined_functions.add(node.get_usr())
+        elif node.kind == CursorKind.CALL_EXPR:
+            callee = next(node.get_children(), None)
+            while callee is not None and callee.kind in [CursorKind.UNEXPOSED_EXPR, CursorKind.PAREN_EXPR]:
+                callee = next(callee.get_children(), None)
+            if callee is not None:
+                callee_hashes.add(callee.hash)
+            if node.referenced is not None and current_function is not None:
+                calls[current_function].add(node.referenced.get_usr())
+        elif node.kind == CursorKind.DECL_REF_EXPR and node.hash not in callee_hashes:
+            is_address_taken = is_address_taken or (node.referenced is not None and node.referenced.kind == CursorKind.FUNCTION_DECL)
+
+    if is_address_taken:
+        return set(calls)
+
+    undefined_functions -= set(calls)
+    for callees in calls.values():
+        if not callees.isdisjoint(undefined_functions):
+            callees.update(calls)
+
+    reentrant_functions = set()
+    for function in calls:
+        visited = set()
+        stack = list(calls[function])
+        while stack:
+            callee = stack.pop()
+            if callee == function:
+                reentrant_functions.add(function)
+                break
+            if callee not in visited:
+                visited.add(callee)
+                stack.extend(calls.get(callee, []))
+    return reentrant_functions
+
+class RedundantNotifyAnalysis:
+    """Finds reads of local variables and parameters whose value is already known from an earlier notification
+
+    A read is redundant when its variable is never written after its declaration, or when the same variable was
+    read earlier in the same full expression, without a write in between. Only functions which cannot be entered again
+    while running are analyzed, so the latest step of the earlier notification always belongs to the same call.
+    """
+    def __init__(self, reentrant_functions: set[str]) -> None:
+        self.reentrant_functions = reentrant_functions
+
+    def analyze(self, source_node: SourceNode) -> dict[int, int]:
+        """Returns ids of redundant DeclRefExpr nodes, mapped to the id of the VarDecl or DeclRefExpr they are derived from"""
+        derivations = dict()
+        for node in get_descendants(source_node):
+            if node.node_type == "FunctionDecl" and node.node.is_definition() and node.node.get_usr() not in self.reentrant_functions:
+                derivations.update(self.analyze_function(node))
+        return derivations
+
+    def analyze_function(self, function_node: SourceNode) -> dict[int, int]:
+        nodes = get_descendants(function_node)
+        if any(n.node_type in JUMP_KINDS for n in nodes):
+            return dict()
+
+        variables = { n.node.hash: n for n in nodes if n.node_type in ["VarDecl", "ParmDecl"] and self.is_tracked_variable(n) }
+        written_variables = set()
+        for node in nodes:
+            written_variable = self.get_written_variable(node)
+            if written_variable is not None:
+                written_variables.add(written_variable)
+            if node.node_type == "UnaryOperator" and SourceNodeResolver.get_unary_operator(node) == "&":
+                variables.pop(self.get_variable(node.children[0]), None)
+        # Parameters are not notified on entry, so only initialized local variables are derived from their declaration
+        constant_variables = set(h for (h, n) in variables.items() if h not in written_variables and n.node_type == "VarDecl" and any(c.node_type in FLATTENED_KINDS for c in n.children))
+
+        derivations = dict()
+        for root in (n for n in nodes if self.is_full_expression(n)):
+            expression_nodes = get_descendants(root)
+            if any(n.node_type not in FLATTENED_KINDS for n in expression_nodes):
+                continue
+
+            # Assigned expressions are copied as they are, so they do not notify
+            assigned_nodes = set(id(d) for n in expression_nodes if self.is_assignment(n) for d in get_descendants(n.children[0]))
+            last_reads = dict()
+            for node in self.get_evaluation_order(root):
+                written_variable = self.get_written_variable(node)
+                if written_variable is not None:
+                    last_reads.pop(written_variable, None)
+                if node.node_type != "DeclRefExpr" or id(node) in assigned_nodes:
+                    continue
+
+                variable = self.get_variable(node)
+                if variable not in variables:
+                    continue
+                if variable in constant_variables:
+                    derivations[node.id] = variables[variable].id
+                elif variable in last_reads:
+                    derivations[node.id] = last_reads[variable].id
+                last_reads[variable] = node
+        return derivations
+
+    def is_tracked_variable(self, source_node: SourceNode) -> bool:
+        cursor = source_node.node
+        return cursor.storage_class.name in ["NONE", "AUTO", "REGISTER"] and cursor.type.get_canonical().kind.name in SCALAR_TYPE_KINDS
+
+    def is_full_expression(self, source_node: SourceNode) -> bool:
+        parent = source_node.parent
+        if parent is None or source_node.node_type not in FLATTENED_KINDS:
+            return False
+        return parent.node_type == "VarDecl" or (parent.node_type in STATEMENT_KINDS and source_node.node_type in STATEMENT_ROOT_KINDS)
+
+    def get_evaluation_order(self, source_node: SourceNode) -> list[SourceNode]:
+        """Returns nodes in post-order, the order in which flattened expressions notify"""
+        stack = [(source_node, False)]
+        ordered_nodes = []
+        while stack:
+            (node, is_expanded) = stack.pop()
+            if is_expanded:
+                ordered_nodes.append(node)
+                continue
+            stack.append((node, True))
+            stack.extend((c, False) for c in reversed(node.children))
+        return ordered_nodes
+
+    def get_variable(self, source_node: SourceNode) -> int|None:
+        """Returns the hash of the variable referenced by an expression, ignoring parentheses"""
+        while source_node.node_type == "ParenExpr" and len(source_node.children) == 1:
+            source_node = source_node.children[0]
+        if source_node.node_type != "DeclRefExpr":
+            return None
+        referenced = source_node.node.referenced
+        return referenced.hash if referenced is not None and referenced.kind.name in ["VAR_DECL", "PARM_DECL"] else None
+
+    def is_assignment(self, source_node: SourceNode) -> bool:
+        if source_node.node_type in ["BinaryOperator", "CompoundAssignmentOperator"] and len(source_node.children) == 2:
+            return SourceNodeResolver.get_binary_operator(source_node) in ASSIGNMENT_OPERATORS
+        if source_node.node_type == "UnaryOperator" and len(source_node.children) == 1:
+            return SourceNodeResolver.get_unary_operator(source_node) in ["++", "--"]
+        return False
+
+    def get_written_variable(self, source_node: SourceNode) -> int|None:
+        return self.get_variable(source_node.children[0]) if self.is_assignment(source_node) else None
@@ -1,16 +1,32 @@
-def get_code_index(code, location) -> int: 
-    current_l = location.line
+import bisect
+import itertools
+import re
+import sys
+from rewrite_context import RewriteContext
+
+placeholder_pattern = re.compile(r"\{(t?)(\d+)\}")
+
+def get_line_offsets(code) -> list[int]:
+    """Returns start index of every line, followed by the index after the last line"""
+    offsets = [0]
+    for line in code.split("\n"):
+        offsets.append(offsets[-1] + len(line) + 1)
+    return offsets
+
+def get_code_index(code, location, line_offsets = None) -> int: 
+    line_offsets = line_offsets if line_offsets is not None else get_line_offsets(code)
+    current_l = min(location.line, len(line_offsets) - 1)
     current_c = location.column - 1
-    lines = code.split("\n")
-    prior_lines = lines[0:current_l]
-    if len(prior_lines) > 0:
-        prior_lines[-1] = prior_lines[-1][0:current_c]
-        return len("\n".join(prior_lines))
+    if current_l > 0:
+        line_start = line_offsets[current_l - 1]
+        line_length = line_offsets[current_l] - line_start - 1
+        return line_start + min(current_c, line_length)
     else: 
         return current_c
 
-def get_code_indexes(code, extent) -> (int, int):
-    return (get_code_index(code, extent.start), get_code_index(code, extent.end))
+def get_code_indexes(code, extent, line_offsets = None) -> (int, int):
+    line_offsets = line_offsets if line_offsets is not None else get_line_offsets(code)
+    return (get_code_index(code, extent.start, line_offsets), get_code_index(code, extent.end, line_offsets))
 
 class SourceToken: 
     def __init__(self) -> None:
@@ -28,7 +44,8 @@ class SourceToken:
         return t
 
 class SourceNode: 
-    counter = 0
+    # Nodes created outside of a rewrite context get negative ids, so they never collide with source nodes
+    created_ids = itertools.count(-1, -1)
     
     def get_children(self) -> list['SourceNode']: 
         return self.children
@@ -42,19 +59,38 @@ class SourceNode:
         return self.id == node.id
 
     def __str__(self) -> str:
-        buffer = self.value
-        for i in range(0, len(self.tokens)): 
-            buffer = buffer.replace("{t"+f"{i}"+"}", f"{self.tokens[i]}")
-        for i in range(0, len(self.children)):
-            buffer = buffer.replace("{"+f"{i}"+"}", f"{self.children[i]}")
-        return buffer
+        return self.render_descendants()[id(self)]
+
+    def render_descendants(self) -> dict[int, str]:
+        """Renders node and its descendants once each, by id() of node"""
+        # Renders children before parents, so deep trees do not hit the recursion limit
+        rendered = dict()
+        stack = [(self, False)]
+        while stack: 
+            (node, is_expanded) = stack.pop()
+            if id(node) in rendered: 
+                continue
+            if not is_expanded: 
+                stack.append((node, True))
+                stack.extend((c, False) for c in node.children)
+                continue
+            rendered[id(node)] = node.render([f"{t}" for t in node.tokens], [rendered[id(c)] for c in node.children])
+        return rendered
+
+    def render(self, token_values: list[str], child_values: list[str]) -> str:
+        # Single pass over value, so inserted text is never rescanned for placeholders
+        def replace(match):
+            values = token_values if match.group(1) else child_values
+            index = int(match.group(2))
+            return values[index] if index < len(values) else match.group(0)
+        return placeholder_pattern.sub(replace, self.value)
     
     @staticmethod
-    def create(node, value, tokens: list[SourceToken], children: list['SourceNode']) -> None:
-        SourceNode.counter += 1
+    def create(node, value, tokens: list[SourceToken], children: list['SourceNode'], context: RewriteContext|None = None) -> None:
         s = SourceNode()
-        s.id = SourceNode.counter
+        s.id = context.next_node_id() if context is not None else next(SourceNode.created_ids)
         s.node = node
+        s.node_type = SourceNodeResolver.get_cursor_type(node) if node is not None else None
         s.value = value
         s.tokens = tokens
         s.parent = None
@@ -67,6 +103,7 @@ class SourceNode:
         s.id = source.id
         s.value = source.value
         s.node = source.node
+        s.node_type = source.node_type
         s.tokens = source.tokens
         s.parent = source.parent
         s.children = source.children
@@ -123,12 +160,22 @@ class SourceNode:
 
 class SourceNodeResolver: 
     """Utility methods for SourceNode information"""
-    
+    cursor_types = dict()
+
     @staticmethod
     def get_type(node: SourceNode) -> str:
-        # Based on https://stackoverflow.com/questions/19053707/converting-snake-case-to-lower-camel-case-lowercamelcase
-        kind = node.node.kind.name
-        return "".join(x.capitalize() for x in kind.lower().split("_"))
+        return node.node_type
+
+    @staticmethod
+    def get_cursor_type(cursor) -> str:
+        """Resolves CamelCase type of cursor, computed once per cursor kind"""
+        kind = cursor.kind
+        cursor_type = SourceNodeResolver.cursor_types.get(kind)
+        if cursor_type is None:
+            # Based on https://stackoverflow.com/questions/19053707/converting-snake-case-to-lower-camel-case-lowercamelcase
+            cursor_type = sys.intern("".join(x.capitalize() for x in kind.name.lower().split("_")))
+            SourceNodeResolver.cursor_types[kind] = cursor_type
+        return cursor_type
 
     @staticmethod
     def get_unary_operator(node: SourceNode) -> str:
@@ -143,20 +190,78 @@ class SourceNodeResolver:
         return node.get_tokens()[0].token.spelling
 
 class SourceTreeCreator: 
-    def __init__(self, filter = None) -> None:
+    def __init__(self, filter = None, context: RewriteContext|None = None) -> None:
         self.filter = filter
+        self.context = context if context is not None else RewriteContext()
 
     def create(self, code, node, level = 0):
-        """Recursively split code into segments based on node ranges"""
+        """Split code into segments based on node ranges"""
+        line_offsets = get_line_offsets(code)
+        node_tokens = self.get_node_tokens(node)
+        return self.create_tree(code, line_offsets, node_tokens, node, level)
+    
+    def create_partition(self, code, node, indexes, level = 0):
+        """Split code into segments, only creating the children at indexes, other children are left empty"""
+        line_offsets = get_line_offsets(code)
+        node_tokens = self.get_node_tokens(node)
+        children = self.get_children(node, level)
+        transformed_children = [
+            self.create_tree(code, line_offsets, node_tokens, c, level + 1) if i in indexes else SourceNode.create(c, "", [], [], self.context)
+            for (i, c) in enumerate(children)
+        ]
+        return self.create_node(code, line_offsets, node, node_tokens.get(node.hash, []), children, transformed_children)
+
+    def create_tree(self, code, line_offsets, node_tokens, node, level):
+        """Creates children before parents, so deep trees do not hit the recursion limit"""
+        stack = [(node, level, None)]
+        created_nodes = []
+
+        while stack: 
+            (current_node, current_level, children) = stack.pop()
+            if children is None: 
+                children = self.get_children(current_node, current_level)
+                stack.append((current_node, current_level, children))
+                stack.extend((c, current_level + 1, None) for c in reversed(children))
+                continue
+
+            transformed_children = created_nodes[len(created_nodes) - len(children):]
+            del created_nodes[len(created_nodes) - len(children):]
+            tokens = node_tokens.get(current_node.hash, [])
+            created_nodes.append(self.create_node(code, line_offsets, current_node, tokens, children, transformed_children))
+
+        return created_nodes[0]
+    
+    def get_node_tokens(self, node) -> dict[int, list]:
+        """Groups tokens by the hash of the cursor they belong to, annotating all tokens at once"""
+        # Imported here, so source nodes can be used without libclang
+        from clang.cindex import Cursor, Token, conf
+
+        tokens = list(node.get_tokens())
+        token_array = (Token * len(tokens))(*tokens)
+        cursor_array = (Cursor * len(tokens))()
+        conf.lib.clang_annotateTokens(node.translation_unit, token_array, len(tokens), cursor_array)
+
+        node_tokens = dict()
+        for (token, cursor) in zip(tokens, cursor_array):
+            node_tokens.setdefault(cursor.hash, []).append(token)
+        return node_tokens
+
+    def get_children(self, node, level):
+        use_filter = self.filter is not None and level == 0
+        return list(filter(self.filter, node.get_children())) if use_filter else list(node.get_children())
+
+    def create_node(self, code, line_offsets, node, tokens, children, transformed_children):
         token_buffer = []
         value_buffer = []
 
-        use_filter = self.filter is not None and level == 0
-        children = list(filter(self.filter, node.get_children())) if use_filter else list(node.get_children())
-        tokens = list([t for t in node.get_tokens() if t.cursor.hash == node.hash])
-        child_locations = [(i, c, get_code_index(code, c.extent.start), get_code_index(code, c.extent.end)) for i,c in enumerate(children)]
-        token_locations = [(i, t, get_code_index(code, t.extent.start), get_code_index(code, t.extent.end)) for i,t in enumerate(tokens)]
-        (startIndex, endIndex) = get_code_indexes(code, node.extent)
+        (startIndex, endIndex) = get_code_indexes(code, node.extent, line_offsets)
+        token_locations = []
+        for t in tokens: 
+            (token_start_index, token_end_index) = get_code_indexes(code, t.extent, line_offsets)
+            if startIndex <= token_start_index < endIndex:
+                token_locations.append((len(token_locations), t, token_start_index, token_end_index))
+        child_locations = [(i, c, *get_code_indexes(code, c.extent, line_offsets)) for i,c in enumerate(children)]
+        location_starts = sorted(l[2] for l in child_locations + token_locations)
 
         i = startIndex
         while i < endIndex:
@@ -165,19 +270,22 @@ class SourceTreeCreator:
             
             if child_location is not None: 
                 (child_number, _, child_start_index, child_end_index) = child_location
-                value_buffer += ("{" + f"{child_number}" + "}")
+                value_buffer.append("{" + f"{child_number}" + "}")
                 i += (child_end_index - child_start_index)
             elif token_location is not None: 
-                (token_number, token, token_start_index, token_end_index) = token_location
-                value_buffer += ("{t" + f"{token_number}" + "}") 
+                (_, token, token_start_index, token_end_index) = token_location
+                # Numbered by emitted tokens, tokens inside of children (f.e. array sizes annotated to their declaration) are skipped
+                value_buffer.append("{t" + f"{len(token_buffer)}" + "}") 
                 i += (token_end_index - token_start_index)
                 token_buffer.append(SourceToken.create(token, code[token_start_index:token_end_index]))
             else: 
-                value_buffer += code[i]
-                i += 1
+                # Copies plain code up to the next child or token at once
+                next_start_index = bisect.bisect_right(location_starts, i)
+                next_index = min(location_starts[next_start_index], endIndex) if next_start_index < len(location_starts) else endIndex
+                value_buffer.append(code[i:next_index])
+                i = next_index
         
-        transformed_children = [self.create(code, n, level + 1) for n in children]
-        source_node = SourceNode.create(node, "".join(value_buffer), token_buffer, transformed_children)
+        source_node = SourceNode.create(node, "".join(value_buffer), token_buffer, transformed_children, self.context)
         for child in source_node.get_children():
             child.parent = source_node
         return source_node
@@ -187,9 +295,12 @@ class SourceTreePrinter:
         self.show_placeholders = show_placeholders
 
     def print(self, node, level = 0):
-        """Recursive print function to traverse the AST"""
-        node_value = f"{node.value}" if self.show_placeholders else f"{node}"
-        print('  ' * level + f"{node_value} (#{node.id})".replace("\n", "\\n"))
-
-        for child in node.children: 
-            self.print(child, level + 1)
\ No newline at end of file
+        """Print function to traverse the AST"""
+        # Rendered once for all nodes, rendering each node on its own would render deep trees again and again
+        rendered = node.render_descendants() if not self.show_placeholders else None
+        stack = [(node, level)]
+        while stack: 
+            (current_node, current_level) = stack.pop()
+            node_value = f"{current_node.value}" if self.show_placeholders else rendered[id(current_node)]
+            print('  ' * current_level + f"{node_value} (#{current_node.id})".replace("\n", "\\n"))
+            stack.extend((c, current_level + 1) for c in reversed(current_node.children))
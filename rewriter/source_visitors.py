@@ -1,13 +1,41 @@
 
 # Based on pycparser's NodeVisitor
-from typing import Callable
-from modification_nodes import CompoundReplaceNode, ConstantNode, CopyNode, CopyReplaceNode, InsertIntializerNode, InsertModificationNode, ModificationNode, ReplaceChildrenNode, ReplaceNode, ReplaceTokenKindNode, TemplatedNode, TemplatedReplaceNode, assignment_node, comma_node, comma_node_with_parentheses, comma_replace_node, comma_stmt_replace_node, compound_replace_node, copy_replace_node
+import array
+import json
+import struct
+import sys
+from types import GeneratorType
+from typing import Callable, Generator
+from modification_nodes import CompoundReplaceNode, ConstantNode, CopyNode, CopyReplaceNode, InsertIntializerNode, InsertModificationNode, ModificationNode, ReplaceChildrenNode, replace_depth_first, ReplaceNode, ReplaceTokenKindNode, TemplatedNode, TemplatedReplaceNode, assignment_node, comma_node, comma_node_with_parentheses, comma_replace_node, comma_replace_node_with_parentheses, comma_stmt_replace_node, compound_replace_node, copy_replace_node
+from rewrite_context import RewriteContext
 from source_nodes import SourceNode, SourceNodeResolver
 
 # Based on https://stackoverflow.com/questions/952914/how-do-i-make-a-flat-list-out-of-a-list-of-lists
 def flatten(l):
     return [item for sublist in l for item in sublist]
 
+# Kinds which only wrap the value of their single child
+TRANSPARENT_KINDS = ["UnexposedExpr", "ParenExpr"]
+
+def is_value_of(target: SourceNode, source_node: SourceNode):
+    """Checks whether target is source node or the value it wraps, f.e. in implicit casts and parentheses"""
+    while not SourceNode.equals(target, source_node):
+        children = source_node.get_children()
+        if source_node.node_type not in TRANSPARENT_KINDS or len(children) != 1:
+            return False
+        source_node = children[0]
+    return True
+
+def split_comma_node(source_node: SourceNode, modification_node: ModificationNode) -> tuple[list[ModificationNode], ModificationNode]:
+    """Splits comma node replacing source node into its leading side effects and its resulting value
+
+    Modifications of parts of source node (f.e. the index of an array subscript) are kept in a copy of source node.
+    """
+    if not isinstance(modification_node, TemplatedReplaceNode) or not is_value_of(modification_node.target, source_node):
+        return ([], copy_replace_node(source_node, modification_node))
+    children = modification_node.get_children()
+    return (list(children[:-1]), children[-1])
+
 def is_first_expression(source_node: SourceNode):
     return source_node.parent is not None and SourceNodeResolver.get_type(source_node.parent) in ["CompoundStmt", "ForStmt", "ReturnStmt", "IfStmt", "WhileStmt"]
 
@@ -22,17 +50,86 @@ def is_statement(source_node: SourceNode):
     parent_children = source_node.parent.get_children()
     return parent_type in ["ForStmt", "IfStmt", "WhileStmt"] and parent_children[-1] == source_node
 
+# Kinds whose operands bind tighter than a comma expression or are separated by commas themselves
+PARENTHESIZED_PARENT_KINDS = ["InitListExpr", "MemberRefExpr", "ArraySubscriptExpr", "VarDecl"]
+
+def get_comma_replace_node(source_node: SourceNode):
+    if is_statement(source_node):
+        return comma_stmt_replace_node
+
+    parent = source_node.parent
+    while parent is not None and parent.node_type == "UnexposedExpr":
+        parent = parent.parent
+    if parent is not None and parent.node_type in PARENTHESIZED_PARENT_KINDS:
+        return comma_replace_node_with_parentheses
+    return comma_replace_node
+
+# Arrays and structs are captured as a whole by notify_aggregate, rather than read as a single value
+AGGREGATE_TYPE_KINDS = ["CONSTANTARRAY", "RECORD"]
+
+def is_aggregate(source_node: SourceNode):
+    return source_node.node.type.get_canonical().kind.name in AGGREGATE_TYPE_KINDS
+
+def has_static_storage(source_node: SourceNode):
+    """Checks whether a declared variable lives as long as the program, its initializer must then be a constant"""
+    cursor = source_node.node
+    return cursor.storage_class.name in ["EXTERN", "STATIC"] or cursor.semantic_parent.kind.name == "TRANSLATION_UNIT"
+
+def get_aggregate_size(source_node: SourceNode, value: str) -> str|None:
+    return f"sizeof({value})" if is_aggregate(source_node) else None
+
+# Builtin types the native runtime reads values as, by canonical type kind (see native_runtime.c)
+VALUE_TYPES = {
+    "BOOL": "_Bool", "CHAR_S": "char", "CHAR_U": "char", "SCHAR": "signed char", "UCHAR": "unsigned char",
+    "SHORT": "short", "USHORT": "unsigned short", "INT": "int", "UINT": "unsigned int", "LONG": "long", "ULONG": "unsigned long",
+    "LONGLONG": "long long", "ULONGLONG": "unsigned long long", "FLOAT": "float", "DOUBLE": "double", "LONGDOUBLE": "long double",
+    "POINTER": "void*",
+}
+
+def get_value_type(type) -> str|None:
+    """Returns the builtin type a value of type is stored as, None for aggregates and types without a value"""
+    canonical = type.get_canonical()
+    if canonical.kind.name == "ENUM": 
+        canonical = canonical.get_declaration().enum_type.get_canonical()
+    return VALUE_TYPES.get(canonical.kind.name)
+
+# Static array of counters declared by coverage builds (see rewrite.py)
+COUNTERS_NAME = "simulator_counters"
+
 # Basic visitors 
 class SourceTreeVisitor:
+    """Visits source trees with an explicit stack instead of recursion, so deep trees do not hit the recursion limit
+
+    Visit methods return the modification of a node. To visit children first, they are generators which yield each
+    child and receive its modification in return, f.e. modification = yield child.
+    """
     def visit(self, source_node: SourceNode): 
-        node_type = SourceNodeResolver.get_type(source_node)
-        node_method_name = 'visit_' + node_type
+        stack = []
+        node_result = self.visit_node(source_node)
+        while True: 
+            if isinstance(node_result, GeneratorType): 
+                stack.append(node_result)
+                node_result = None
+            elif not stack: 
+                return node_result
+
+            try: 
+                child = stack[-1].send(node_result)
+            except StopIteration as e: 
+                stack.pop()
+                node_result = e.value
+                continue
+            node_result = self.visit_node(child)
+
+    def visit_node(self, source_node: SourceNode):
+        node_method_name = 'visit_' + source_node.node_type
         node_method = getattr(self, node_method_name, self.generic_visit)
-        node_result = node_method(source_node)
-        return node_result
+        return node_method(source_node)
 
-    def generic_visit(self, source_node: SourceNode) -> ModificationNode|None: 
-        source_node_modifications = [self.visit(c) for c in source_node.children]
+    def generic_visit(self, source_node: SourceNode) -> Generator[SourceNode, ModificationNode|None, ModificationNode|None]: 
+        source_node_modifications = []
+        for c in source_node.children: 
+            source_node_modifications.append((yield c))
         source_node_modifications_filtered = [m for m in source_node_modifications if m is not None]
 
         if len(source_node_modifications_filtered) == 0: 
@@ -47,28 +144,17 @@ class SourceTreeModifier:
         self.modification_nodes = modification_nodes
 
     def visit(self, source_node: SourceNode): 
-        # Depth first replacement
-        new_children = [self.visit(c) for c in source_node.children]
-        new_source_node = SourceNode.copy(source_node)
-        new_source_node.children = new_children
-
-        modification_node = next((m for m in self.modification_nodes if m.is_applicable(source_node)), None)
-
-        # Apply modification if found
-        if modification_node is not None:
-            return modification_node.apply(new_source_node) 
-        else: 
-            return new_source_node
+        return replace_depth_first(source_node, self.modification_nodes)
 
 class ReplaceAdditionSourceTreeVisitor(SourceTreeVisitor):
     def visit_BinaryOperator(self, source_node: SourceNode) -> ModificationNode:
         if SourceNodeResolver.get_binary_operator(source_node) != '+':
             return []
         
-        lvalue = self.visit(source_node.children[0])
+        lvalue = yield source_node.children[0]
         if len(lvalue) == 0: 
             lvalue = [CopyNode(source_node.children[0])]
-        rvalue = self.visit(source_node.children[1])
+        rvalue = yield source_node.children[1]
         if len(rvalue) == 0: 
             rvalue = [CopyNode(source_node.children[1])]
         
@@ -99,8 +185,6 @@ class ReplaceIdentifierSourceTreeVisitor(SourceTreeVisitor):
 
 # Composite visitors 
 class NotifyData(): 
-    counter = -1
-
     def __init__(self, id: int, value: str) -> None:
         self.id = id
         self.value = value
@@ -108,13 +192,17 @@ class NotifyData():
         self.type:str|None = None
         self.identifier:str|None = None
         self.location:str|None = None
+        self.derived_from:int|None = None
+        # Size expression of aggregate values, which are notified by address and size
+        self.size:str|None = None
+        # Builtin type of the value, for the native runtime
+        self.value_type:str|None = None
 
     @staticmethod 
-    def create_assign(source_node: SourceNode, identifier_node: SourceNode): 
+    def create_assign(context: RewriteContext, source_node: SourceNode, identifier_node: SourceNode): 
         extent = source_node.node.extent
         
-        NotifyData.counter += 1
-        n = NotifyData(NotifyData.counter, f"&{identifier_node}")
+        n = NotifyData(context.next_notify_id(), f"&{identifier_node}")
         n.action = "assign" 
         n.identifier = f"{identifier_node}"
         n.location = [
@@ -124,23 +212,25 @@ class NotifyData():
             extent.end.column - 1
         ]
         n.type = identifier_node.node.type.spelling
+        n.value_type = get_value_type(identifier_node.node.type)
+        n.size = get_aggregate_size(identifier_node, f"{identifier_node}")
         return n
 
     @staticmethod
-    def create_decl(source_node: SourceNode, value_node: ConstantNode): 
-        NotifyData.counter += 1
-        n = NotifyData(NotifyData.counter, f"&{value_node.value}")
+    def create_decl(context: RewriteContext, source_node: SourceNode, value_node: ConstantNode): 
+        n = NotifyData(context.next_notify_id(), f"&{value_node.value}")
         n.action = "decl" 
         n.type = source_node.node.type.spelling
+        n.value_type = get_value_type(source_node.node.type)
         n.identifier = source_node.node.spelling
+        n.size = get_aggregate_size(source_node, value_node.value)
         return n
 
     @staticmethod
-    def create_eval(source_node: SourceNode, value_node: ConstantNode): 
+    def create_eval(context: RewriteContext, source_node: SourceNode, value_node: ConstantNode): 
         extent = source_node.node.extent
         
-        NotifyData.counter += 1
-        n = NotifyData(NotifyData.counter, f"&{value_node.value}")
+        n = NotifyData(context.next_notify_id(), f"&{value_node.value}")
         n.action = "eval" 
         n.location = [
             extent.start.line, 
@@ -149,14 +239,15 @@ class NotifyData():
             extent.end.column - 1
         ]
         n.type = source_node.node.type.spelling
+        n.value_type = get_value_type(source_node.node.type)
+        n.size = get_aggregate_size(source_node, value_node.value)
         return n 
     
     @staticmethod
-    def create_stat(source_node: SourceNode):
+    def create_stat(context: RewriteContext, source_node: SourceNode):
         extent = source_node.node.extent
         
-        NotifyData.counter += 1
-        n = NotifyData(NotifyData.counter, "(void*)0")
+        n = NotifyData(context.next_notify_id(), "(void*)0")
         n.action = "stat" 
         n.location = [
             extent.start.line, 
@@ -185,71 +276,181 @@ class NotifyDataSerializer():
         if (notification.action in ["assign", "decl"]):
             buffer["identifier"] = f"\"{notification.identifier}\""
 
+        if (notification.derived_from is not None):
+            buffer["derivedFrom"] = f"{notification.derived_from}"
+
         items = [f"\"{key}\":{buffer[key]}" for key in buffer]
         serialized_items = ",".join(items)
         return "{" + serialized_items + "}"
 
+class NotifyMetadataSerializer():
+    """Serializes notifications into columns, with string tables for types and identifiers
+
+    Layout (little endian): magic, version, number of notifications, byte length and UTF-8 JSON of the string table,
+    byte length and UTF-8 of the source code, padding to 4 bytes, followed by int32 columns for actions, types,
+    identifiers, locations (4 per notification) and the notifications redundant ones are derived from. Absent values are stored as -1.
+    """
+    magic = b"CSIM"
+    version = 2
+    actions = ["stat", "decl", "eval", "assign"]
+
+    def serialize(self, code: str, notifications: list[NotifyData]) -> bytes:
+        strings = []
+        string_indexes = dict()
+        def get_string_index(value): 
+            if value not in string_indexes: 
+                string_indexes[value] = len(strings)
+                strings.append(value)
+            return string_indexes[value]
+
+        actions = array.array("i", [self.actions.index(n.action) for n in notifications])
+        types = array.array("i", [get_string_index(f"{n.type}") if n.action in ["assign", "eval", "decl"] else -1 for n in notifications])
+        identifiers = array.array("i", [get_string_index(f"{n.identifier}") if n.action in ["assign", "decl"] else -1 for n in notifications])
+        locations = array.array("i", flatten([n.location if n.action in ["assign", "eval", "stat"] else [-1, -1, -1, -1] for n in notifications]))
+        derived_from = array.array("i", [n.derived_from if n.derived_from is not None else -1 for n in notifications])
+
+        string_bytes = json.dumps(strings).encode("utf-8")
+        code_bytes = code.encode("utf-8")
+        header = self.magic + struct.pack("<II", self.version, len(notifications))
+        buffer = header + struct.pack("<I", len(string_bytes)) + string_bytes + struct.pack("<I", len(code_bytes)) + code_bytes
+        buffer += b"\0" * (-len(buffer) % 4)
+
+        for column in [actions, types, identifiers, locations, derived_from]: 
+            if sys.byteorder != "little": 
+                column.byteswap()
+            buffer += column.tobytes()
+        return buffer
+    
+    def deserialize_columns(self, buffer: bytes) -> tuple[str, list[str], dict[str, array.array]]:
+        """Reads code, the string table and the columns, locations hold 4 values per notification"""
+        if buffer[0:4] != self.magic: 
+            raise Exception("Not a notification metadata file")
+        (version, count) = struct.unpack_from("<II", buffer, 4)
+        if version != self.version: 
+            raise Exception(f"Unsupported notification metadata version {version}")
+        
+        (string_length, ) = struct.unpack_from("<I", buffer, 12)
+        strings = json.loads(buffer[16:16 + string_length].decode("utf-8"))
+        code_offset = 16 + string_length
+        (code_length, ) = struct.unpack_from("<I", buffer, code_offset)
+        code = buffer[code_offset + 4:code_offset + 4 + code_length].decode("utf-8")
+        
+        columns = array.array("i")
+        columns_offset = code_offset + 4 + code_length
+        columns.frombytes(buffer[columns_offset + (-columns_offset % 4):])
+        if sys.byteorder != "little": 
+            columns.byteswap()
+
+        return (code, strings, {
+            "actions": columns[0:count],
+            "types": columns[count:2 * count],
+            "identifiers": columns[2 * count:3 * count],
+            "locations": columns[3 * count:7 * count],
+            "derived_from": columns[7 * count:8 * count],
+        })
+
+    def deserialize(self, buffer: bytes) -> tuple[str, list[dict]]:
+        """Reads code and notifications, in the same shape as NotifyDataSerializer's output"""
+        (code, strings, columns) = self.deserialize_columns(buffer)
+
+        notifications = []
+        for i in range(0, len(columns["actions"])): 
+            notification = { "action": self.actions[columns["actions"][i]] }
+            if columns["types"][i] != -1: 
+                notification["dataType"] = strings[columns["types"][i]]
+            if columns["locations"][4 * i] != -1:
+                notification["location"] = columns["locations"][4 * i:4 * i + 4].tolist()
+            if columns["identifiers"][i] != -1: 
+                notification["identifier"] = strings[columns["identifiers"][i]]
+            if columns["derived_from"][i] != -1: 
+                notification["derivedFrom"] = columns["derived_from"][i]
+            notifications.append(notification)
+        return (code, notifications)
+
 class PartialTreeVisitor():
+    """Visitor for a subset of node kinds, only consulted for nodes of one of the declared kinds"""
+    kinds: list[str] = []
+
     def __init__(self) -> None:
+        self.context: RewriteContext|None = None
         self.create_notify: Callable[[NotifyData], InsertModificationNode]|None = None
+        self.create_counter: Callable[[NotifyData], InsertModificationNode]|None = None
+        self.derive_notify: Callable[[NotifyData, int], None]|None = None
         self.push_variable: Callable[[SourceNode], InsertModificationNode]|None = None
         self.pop_variables: Callable[[], list[InsertModificationNode]]|None = None
-        self.callback: Callable[[SourceNode], ModificationNode]|None = None
 
     def can_visit(self, source_node: SourceNode):
         raise Exception("Not implemented")
     
     def visit(self, source_node: SourceNode): 
+        """Returns the modification of source node, yielding the children it transforms like the visit methods of SourceTreeVisitor"""
         raise Exception("Not implemented")
 
 class CompositeTreeVisitor(SourceTreeVisitor):
-    def __init__(self, partial_visitors: list[PartialTreeVisitor]) -> None:
+    def __init__(self, partial_visitors: list[PartialTreeVisitor], context: RewriteContext|None = None) -> None:
         super().__init__() 
-        self.notifies = []
-        self.variables = []
+        self.context = context if context is not None else RewriteContext()
         self.partial_visitors = partial_visitors
+        self.dispatch_table: dict[str, list[PartialTreeVisitor]] = dict()
 
         for visitor in partial_visitors: 
+            visitor.context = self.context
+            for kind in visitor.kinds:
+                self.dispatch_table.setdefault(kind, []).append(visitor)
+
             visitor.create_notify = self.create_notify
+            visitor.create_counter = self.create_counter
+            visitor.derive_notify = self.derive_notify
             visitor.push_variable = self.push_variable
             visitor.pop_variables = self.pop_variable
-            visitor.callback = self.generic_visit
 
     def generic_visit(self, source_node: SourceNode) -> ModificationNode | None:
-        partial_visitor = next((v for v in self.partial_visitors if v.can_visit(source_node)), None)
+        candidate_visitors = self.dispatch_table.get(source_node.node_type, [])
+        partial_visitor = next((v for v in candidate_visitors if v.can_visit(source_node)), None)
         if partial_visitor is not None: 
             return partial_visitor.visit(source_node)
         else: 
             return super().generic_visit(source_node)
     
     def create_notify(self, data: NotifyData) -> InsertModificationNode: 
-        self.notifies.append(data)
-        return ConstantNode(f"notify({data.id}, {data.value})")
+        self.context.notifies.append(data)
+        if data.size is not None: 
+            return ConstantNode(f"notify_aggregate({self.context.format_notify_id(data.id)}, {data.value}, {data.size})")
+        return ConstantNode(f"notify({self.context.format_notify_id(data.id)}, {data.value})")
+
+    def create_counter(self, data: NotifyData) -> InsertModificationNode: 
+        self.context.notifies.append(data)
+        return ConstantNode(f"{COUNTERS_NAME}[{self.context.format_notify_id(data.id)}]++")
+
+    def derive_notify(self, data: NotifyData, source_node_id: int) -> None:
+        """Records a redundant notification without notifying, it is replayed from the notification of the source node"""
+        data.derived_from = self.context.node_notify_ids[source_node_id]
+        self.context.notifies.append(data)
 
     def get_notifies(self) -> list[NotifyData]:
-        return self.notifies
+        return self.context.notifies
 
     def push_variable(self, source_node: SourceNode) -> InsertModificationNode:
         variable_type = source_node.node.type.spelling
-        variable_name = f"temp{len(self.variables)}"
+        variable_name = f"temp{len(self.context.variables)}"
         variable = ConstantNode(f"{variable_type} {variable_name};")
-        self.variables.append(variable)
+        self.context.variables.append(variable)
         return ConstantNode(variable_name)
     
     def pop_variable(self) -> list[InsertModificationNode]:
-        return self.variables
+        # Every function declares only its own temp variables
+        self.context.variables = []
+        return self.context.variables
 
 class PartialTreeVisitor_GenericLiteral(PartialTreeVisitor):
+    kinds = ["IntegerLiteral", "StringLiteral"]
+
     def can_visit(self, source_node: SourceNode):
-        if source_node.parent is None:
-            return False 
-        
-        node_type = SourceNodeResolver.get_type(source_node)
-        return is_first_expression(source_node) and node_type in ["IntegerLiteral", "StringLiteral"]
+        return is_first_expression(source_node)
     
     def visit(self, source_node: SourceNode):
-        notify_data = NotifyData.create_stat(source_node.parent)
-        replace_node = comma_stmt_replace_node if is_statement(source_node) else comma_replace_node
+        notify_data = NotifyData.create_stat(self.context, source_node.parent)
+        replace_node = get_comma_replace_node(source_node)
         return replace_node(
             source_node, 
             self.create_notify(notify_data),
@@ -257,46 +458,71 @@ class PartialTreeVisitor_GenericLiteral(PartialTreeVisitor):
         )
 
 class PartialTreeVisitor_DeclRefExpr(PartialTreeVisitor):
+    kinds = ["DeclRefExpr"]
+
     def can_visit(self, source_node: SourceNode):
-        return SourceNodeResolver.get_type(source_node) == "DeclRefExpr"
+        return True
 
     def visit(self, source_node: SourceNode):
         buffer = []
 
+        # Reading elements or members would capture the whole aggregate, their changes are notified by assignments
+        if is_aggregate(source_node):
+            value_node = source_node
+            while value_node.parent is not None and value_node.parent.node_type == "UnexposedExpr":
+                value_node = value_node.parent
+            if not is_first_expression(value_node):
+                return None
+            notify_stat = NotifyData.create_stat(self.context, value_node)
+            return get_comma_replace_node(value_node)(value_node, self.create_notify(notify_stat), CopyNode(value_node))
+
         if is_first_expression(source_node):
-            notify_stat = NotifyData.create_stat(source_node)
+            notify_stat = NotifyData.create_stat(self.context, source_node)
             buffer.append(self.create_notify(notify_stat))
 
         temp_variable = self.push_variable(source_node)
-        notify_data = NotifyData.create_eval(source_node, temp_variable)
-        buffer.extend([
-            assignment_node(temp_variable, CopyNode(source_node)),
-            self.create_notify(notify_data),
-            temp_variable
-        ])
+        notify_data = NotifyData.create_eval(self.context, source_node, temp_variable)
+        self.context.node_notify_ids[source_node.id] = notify_data.id
+        derived_node_id = self.context.derivations.get(source_node.id)
+        if derived_node_id is not None: 
+            self.derive_notify(notify_data, derived_node_id)
+            buffer.extend([
+                assignment_node(temp_variable, CopyNode(source_node)),
+                temp_variable
+            ])
+        else: 
+            buffer.extend([
+                assignment_node(temp_variable, CopyNode(source_node)),
+                self.create_notify(notify_data),
+                temp_variable
+            ])
 
-        replace_node = comma_stmt_replace_node if is_statement(source_node) else comma_replace_node
+        replace_node = get_comma_replace_node(source_node)
         return replace_node(
             source_node, 
             *buffer
         )
     
 class PartialTreeVisitor_UnaryOperator(PartialTreeVisitor):
+    kinds = ["UnaryOperator"]
+    # Whether the (left) operand is visited, assigned operands are copied as they are
+    transforms_left = True
+
     def can_visit(self, source_node: SourceNode):
-        return SourceNodeResolver.get_type(source_node) == "UnaryOperator"
+        return True
 
     def visit(self, source_node: SourceNode):
         buffer = []
 
         if is_first_expression(source_node):
-            notify_stat = NotifyData.create_stat(source_node)
+            notify_stat = NotifyData.create_stat(self.context, source_node)
             buffer.append(self.create_notify(notify_stat))
 
         children = source_node.get_children()
-        transformed_operand = self.transform_left(children[0]) 
+        transformed_operand = (yield children[0]) if self.transforms_left else None
         if transformed_operand is not None: 
-            buffer.append(transformed_operand.get_children()[0])
-            lvalue = transformed_operand.get_children()[1]
+            (side_effects, lvalue) = split_comma_node(children[0], transformed_operand)
+            buffer.extend(side_effects)
         else: 
             lvalue = CopyNode(children[0])
 
@@ -311,33 +537,26 @@ class PartialTreeVisitor_UnaryOperator(PartialTreeVisitor):
         buffer.extend(self.create_notify_nodes(source_node, temp_variable, children[0]))
         buffer.append(temp_variable)
         
-        replace_node = comma_stmt_replace_node if is_statement(source_node) else comma_replace_node
+        replace_node = get_comma_replace_node(source_node)
         return replace_node(
             source_node, 
             *buffer
         )
     
-    def transform_left(self, source_node: SourceNode): 
-        return self.callback(source_node)
-
     def create_notify_nodes(self, source_node: SourceNode, value_node: SourceNode, identifier_node: SourceNode) -> list[InsertModificationNode]:
-        notify_data = NotifyData.create_eval(source_node, value_node)
+        notify_data = NotifyData.create_eval(self.context, source_node, value_node)
         return [self.create_notify(notify_data)]
 
 class PartialTreeVisitor_UnaryOperator_Assignment(PartialTreeVisitor_UnaryOperator):
+    transforms_left = False
+
     def can_visit(self, source_node: SourceNode):
-        if (SourceNodeResolver.get_type(source_node) != "UnaryOperator"):
-            return False
-        
         operator = SourceNodeResolver.get_unary_operator(source_node) 
         return operator == "++" or operator == "--"
-    
-    def transform_left(self, source_node: SourceNode):
-        return None
 
     def create_notify_nodes(self, source_nodes: SourceNode, value_node: SourceNode, identifier_node: SourceNode) -> list[InsertModificationNode]:
-        notify_data_eval = NotifyData.create_eval(source_nodes, value_node)
-        notify_data_assign = NotifyData.create_assign(source_nodes, identifier_node)
+        notify_data_eval = NotifyData.create_eval(self.context, source_nodes, value_node)
+        notify_data_assign = NotifyData.create_assign(self.context, source_nodes, identifier_node)
 
         return [
             self.create_notify(notify_data_eval),
@@ -345,29 +564,33 @@ class PartialTreeVisitor_UnaryOperator_Assignment(PartialTreeVisitor_UnaryOperat
         ]
     
 class PartialTreeVisitor_BinaryOperator(PartialTreeVisitor):
+    kinds = ["BinaryOperator"]
+    # Whether the (left) operand is visited, assigned operands are copied as they are
+    transforms_left = True
+
     def can_visit(self, source_node: SourceNode):
-        return SourceNodeResolver.get_type(source_node) == "BinaryOperator"
+        return True
 
     def visit(self, source_node: SourceNode):
         buffer = []
 
         if is_first_expression(source_node):
-            notify_stat = NotifyData.create_stat(source_node)
+            notify_stat = NotifyData.create_stat(self.context, source_node)
             buffer.append(self.create_notify(notify_stat))
 
         children = source_node.get_children()
-        transformed_left = self.transform_left(children[0])
-        transformed_right = self.callback(children[1])
+        transformed_left = (yield children[0]) if self.transforms_left else None
+        transformed_right = yield children[1]
         
         if transformed_left is not None: 
-            buffer.append(transformed_left.get_children()[0])
-            lvalue = transformed_left.get_children()[1]
+            (side_effects, lvalue) = split_comma_node(children[0], transformed_left)
+            buffer.extend(side_effects)
         else: 
             lvalue = CopyNode(children[0])
 
         if  transformed_right is not None: 
-            buffer.append(transformed_right.get_children()[0])
-            rvalue = transformed_right.get_children()[1]
+            (side_effects, rvalue) = split_comma_node(children[1], transformed_right)
+            buffer.extend(side_effects)
         else:
             rvalue = CopyNode(children[1])
 
@@ -384,33 +607,27 @@ class PartialTreeVisitor_BinaryOperator(PartialTreeVisitor):
         buffer.extend(self.create_notify_nodes(source_node, temp_variable, children[0]))
         buffer.append(temp_variable)
         
-        replace_node = comma_stmt_replace_node if is_statement(source_node) else comma_replace_node
+        replace_node = get_comma_replace_node(source_node)
         return replace_node(
             source_node, 
             *buffer
         )
     
-    def transform_left(self, source_node: SourceNode):
-        return self.callback(source_node)
-
     def create_notify_nodes(self, source_nodes: SourceNode, value_node: SourceNode, identifier_node: SourceNode) -> list[InsertModificationNode]:
-        notify_data_eval = NotifyData.create_eval(source_nodes, value_node)
+        notify_data_eval = NotifyData.create_eval(self.context, source_nodes, value_node)
         return [self.create_notify(notify_data_eval)]
 
 class PartialTreeVisitor_BinaryOperator_Assignment(PartialTreeVisitor_BinaryOperator):
+    kinds = ["BinaryOperator", "CompoundAssignmentOperator"]
+    transforms_left = False
+
     def can_visit(self, source_node: SourceNode):
-        if SourceNodeResolver.get_type(source_node) not in ["BinaryOperator", "CompoundAssignmentOperator"]:
-            return False 
-        
         binary_operator = SourceNodeResolver.get_binary_operator(source_node)
         return binary_operator in ["=", "+=", "-=", "*=", "/=", "%=", "<<=", ">>=", "&=", "^=", "|="]
-    
-    def transform_left(self, source_nodes: SourceNode): 
-        return None
 
     def create_notify_nodes(self, source_nodes: SourceNode, value_node: SourceNode, identifier_node: SourceNode) -> list[InsertModificationNode]:
-        notify_data_eval = NotifyData.create_eval(source_nodes, value_node)
-        notify_data_assign = NotifyData.create_assign(source_nodes, identifier_node)
+        notify_data_eval = NotifyData.create_eval(self.context, source_nodes, value_node)
+        notify_data_assign = NotifyData.create_assign(self.context, source_nodes, identifier_node)
 
         return [
             self.create_notify(notify_data_eval),
@@ -418,8 +635,10 @@ class PartialTreeVisitor_BinaryOperator_Assignment(PartialTreeVisitor_BinaryOper
         ]
     
 class PartialTreeVisitor_CallExpr(PartialTreeVisitor):
+    kinds = ["CallExpr"]
+
     def can_visit(self, source_node: SourceNode):
-        return SourceNodeResolver.get_type(source_node) == "CallExpr"
+        return True
 
     def visit(self, source_node: SourceNode):
         buffer_comma = []
@@ -428,18 +647,20 @@ class PartialTreeVisitor_CallExpr(PartialTreeVisitor):
         parameters = source_node.get_children()[1:]
         
         if is_first_expression(source_node):
-            notify_stat = NotifyData.create_stat(source_node)
+            notify_stat = NotifyData.create_stat(self.context, source_node)
             buffer_comma.append(self.create_notify(notify_stat))
         
         # Capture parameter values 
-        transformed_parameters = [(p, self.callback(p)) for p in parameters]
+        transformed_parameters = []
+        for p in parameters: 
+            transformed_parameters.append((p, (yield p)))
         for transformed_parameter in transformed_parameters:
             if transformed_parameter[1] is None: 
                 buffer_parameters.append(CopyNode(transformed_parameter[0]))
             else: 
-                parameter_children = transformed_parameter[1].get_children()
-                buffer_comma.append(parameter_children[0])
-                buffer_parameters.append(parameter_children[1])
+                (side_effects, parameter_value) = split_comma_node(transformed_parameter[0], transformed_parameter[1])
+                buffer_comma.extend(side_effects)
+                buffer_parameters.append(parameter_value)
 
         transformed_children = [CopyNode(identifier)] + buffer_parameters
         transformed_node = copy_replace_node(
@@ -450,7 +671,7 @@ class PartialTreeVisitor_CallExpr(PartialTreeVisitor):
         # Capture return value
         if (source_node.node.type.spelling != "void"):
             temp_variable = self.push_variable(source_node)
-            notify_data = NotifyData.create_eval(source_node, temp_variable)
+            notify_data = NotifyData.create_eval(self.context, source_node, temp_variable)
             buffer_comma.append(assignment_node(temp_variable, transformed_node))
             buffer_comma.append(self.create_notify(notify_data))
             buffer_comma.append(temp_variable)
@@ -460,45 +681,52 @@ class PartialTreeVisitor_CallExpr(PartialTreeVisitor):
         if len(buffer_comma) < 2:
             return None 
         
-        replace_node = comma_stmt_replace_node if is_statement(source_node) else comma_replace_node
+        replace_node = get_comma_replace_node(source_node)
         return replace_node(
             source_node, 
             *buffer_comma
         )
 
 class PartialTreeVisitor_VarDecl(PartialTreeVisitor):
+    kinds = ["VarDecl"]
+
     def can_visit(self, source_node: SourceNode):
-        return SourceNodeResolver.get_type(source_node) == "VarDecl"
+        return not is_aggregate(source_node) and not has_static_storage(source_node)
 
     def visit(self, source_node: SourceNode):
         child_buffer = []
         
         if (source_node.parent is None or source_node.parent.get_children()[0] == source_node):
-            notify_stat = NotifyData.create_stat(source_node)
+            notify_stat = NotifyData.create_stat(self.context, source_node)
             child_buffer.append(self.create_notify(notify_stat))
         
         children = source_node.get_children()
         if (len(children) == 0):
             temp_value = self.push_variable(source_node)
-            notify_decl = NotifyData.create_decl(source_node, temp_value)
+            notify_decl = NotifyData.create_decl(self.context, source_node, temp_value)
             child_buffer.append(self.create_notify(notify_decl))
             child_buffer.append(temp_value)
             initalizer = comma_node_with_parentheses(*child_buffer)
 
             return InsertIntializerNode(source_node, initalizer)
 
-        transformed_operand = self.callback(children[0]) 
+        transformed_operand = yield children[0]
         if transformed_operand is not None: 
-            child_buffer.append(transformed_operand.get_children()[0])
-            lvalue = transformed_operand.get_children()[1]
+            (side_effects, lvalue) = split_comma_node(children[0], transformed_operand)
+            child_buffer.extend(side_effects)
+        else: 
+            lvalue = CopyNode(children[0])
 
-            notify_decl = NotifyData.create_decl(source_node, lvalue)
+        if isinstance(lvalue, ConstantNode): 
+            notify_decl = NotifyData.create_decl(self.context, source_node, lvalue)
+            self.context.node_notify_ids[source_node.id] = notify_decl.id
             child_buffer.append(self.create_notify(notify_decl))
             child_buffer.append(lvalue)
         else: 
             temp_value = self.push_variable(source_node)
-            notify_decl = NotifyData.create_decl(source_node, temp_value)
-            child_buffer.append(assignment_node(temp_value, CopyNode(children[0])))
+            notify_decl = NotifyData.create_decl(self.context, source_node, temp_value)
+            self.context.node_notify_ids[source_node.id] = notify_decl.id
+            child_buffer.append(assignment_node(temp_value, lvalue))
             child_buffer.append(self.create_notify(notify_decl))
             child_buffer.append(temp_value)
 
@@ -507,18 +735,86 @@ class PartialTreeVisitor_VarDecl(PartialTreeVisitor):
             [comma_node_with_parentheses(*child_buffer)]
         )
 
+class PartialTreeVisitor_DeclStmt_Aggregate(PartialTreeVisitor):
+    """Captures declared arrays and structs after their declaration, they cannot be initialized by a comma expression"""
+    kinds = ["DeclStmt"]
+
+    def can_visit(self, source_node: SourceNode):
+        return source_node.parent is not None and SourceNodeResolver.get_type(source_node.parent) == "CompoundStmt" and any(is_aggregate(c) for c in source_node.get_children())
+
+    def visit(self, source_node: SourceNode):
+        children = source_node.get_children()
+        statement_buffer = []
+        if is_aggregate(children[0]):
+            notify_stat = NotifyData.create_stat(self.context, children[0])
+            statement_buffer.append(self.create_notify(notify_stat))
+
+        transformed_children = []
+        for c in children: 
+            transformed_child = yield c
+            if transformed_child is not None: 
+                transformed_children.append(transformed_child)
+        declaration = copy_replace_node(source_node, *transformed_children) if len(transformed_children) > 0 else CopyNode(source_node)
+
+        capture_buffer = []
+        for c in children: 
+            if is_aggregate(c):
+                notify_decl = NotifyData.create_decl(self.context, c, ConstantNode(c.node.spelling))
+                capture_buffer.append(self.create_notify(notify_decl))
+
+        template = "".join("{" + f"{i}" + "}; " for i in range(0, len(statement_buffer)))
+        template += "{" + f"{len(statement_buffer)}" + "} " + ", ".join("{" + f"{i + len(statement_buffer) + 1}" + "}" for i in range(0, len(capture_buffer))) + ";"
+        return TemplatedReplaceNode(source_node, template, statement_buffer + [declaration] + capture_buffer)
+
+# Counter visitors count executions of statements with an increment of a static counter, instead of notifying values.
+# Counters are indexed by the id of a stat notification, so they share the metadata and relocation of notifications.
+class PartialTreeVisitor_Counter(PartialTreeVisitor):
+    kinds = ["BinaryOperator", "CompoundAssignmentOperator", "UnaryOperator", "ConditionalOperator", "CallExpr", "DeclRefExpr", "ArraySubscriptExpr", "MemberRefExpr", 
+        "CStyleCastExpr", "UnexposedExpr", "ParenExpr", "IntegerLiteral", "FloatingLiteral", "CharacterLiteral", "StringLiteral"]
+
+    def can_visit(self, source_node: SourceNode):
+        return is_first_expression(source_node)
+
+    def visit(self, source_node: SourceNode):
+        counter_data = NotifyData.create_stat(self.context, source_node)
+        replace_node = get_comma_replace_node(source_node)
+        return replace_node(
+            source_node, 
+            self.create_counter(counter_data),
+            CopyNode(source_node)
+        )
+
+class PartialTreeVisitor_VarDecl_Counter(PartialTreeVisitor):
+    """Counts declarations by their initializer, declarations without one have no effect to count"""
+    kinds = ["VarDecl"]
+
+    def can_visit(self, source_node: SourceNode):
+        children = source_node.get_children()
+        is_first_declaration = source_node.parent is None or source_node.parent.get_children()[0] == source_node
+        return is_first_declaration and len(children) > 0 and children[-1].node_type != "TypeRef" and not is_aggregate(source_node) and not has_static_storage(source_node)
+
+    def visit(self, source_node: SourceNode):
+        children = source_node.get_children()
+        counter_data = NotifyData.create_stat(self.context, source_node)
+        initializer = comma_node_with_parentheses(self.create_counter(counter_data), CopyNode(children[-1]))
+        return ReplaceChildrenNode(
+            source_node,
+            [CopyNode(c) for c in children[:-1]] + [initializer]
+        )
+
 class PartialTreeVisitor_FunctionDecl(PartialTreeVisitor): 
+    kinds = ["FunctionDecl"]
+
     def can_visit(self, source_node: SourceNode):
-        if (SourceNodeResolver.get_type(source_node) != "FunctionDecl"):
-            return False
-        
         children = source_node.get_children()
         return any(children) and SourceNodeResolver.get_type(children[-1]) == "CompoundStmt"
 
     def visit(self, source_node: SourceNode):
         function_body_node = source_node.get_children()[-1]
         variables = self.pop_variables()
-        transformed_children = [(c, self.callback(c)) for c in function_body_node.get_children()]
+        transformed_children = []
+        for c in function_body_node.get_children(): 
+            transformed_children.append((c, (yield c)))
         statements = [copy_replace_node(c[0], c[1]) if c[1] is not None else CopyNode(c[0]) for c in transformed_children]
         
         return compound_replace_node(
@@ -527,8 +823,10 @@ class PartialTreeVisitor_FunctionDecl(PartialTreeVisitor):
         )
     
 class PartialTreeVisitor_TranslationUnit(PartialTreeVisitor): 
+    kinds = ["TranslationUnit"]
+
     def can_visit(self, source_node: SourceNode):
-        return SourceNodeResolver.get_type(source_node) == "TranslationUnit"
+        return True
     
     def visit(self, source_node: SourceNode):
         template = "void notify(char* metadata)" + source_node.value
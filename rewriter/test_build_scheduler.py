@@ -0,0 +1,98 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from build_scheduler import BuildScheduler, build_all, get_default_limits, get_output_directory
+from source_visitors import NotifyMetadataSerializer
+
+try:
+    import clang.cindex
+except ImportError:
+    clang = None
+
+def sleep_command(seconds: float, output = "") -> list[str]:
+    return [sys.executable, "-c", f"import time; time.sleep({seconds}); print({output!r}, end='')"]
+
+class TestBuildScheduler(unittest.IsolatedAsyncioTestCase):
+    def test_default_limits(self):
+        self.assertEqual(get_default_limits(8), { "interactive": 8, "batch": 4 })
+        self.assertEqual(get_default_limits(1), { "interactive": 1, "batch": 1 })
+
+    async def test_starts_interactive_builds_first(self):
+        scheduler = BuildScheduler(cpu_count=1)
+
+        running = scheduler.submit("running", sleep_command(0.2), "batch")
+        batch = scheduler.submit("batch", sleep_command(0), "batch")
+        interactive = scheduler.submit("interactive", sleep_command(0, "built"), "interactive")
+        outputs = await asyncio.gather(running.task, batch.task, interactive.task)
+
+        self.assertEqual(outputs[2], "built")
+        self.assertLessEqual(running.finished_at, interactive.started_at)
+        self.assertLessEqual(interactive.finished_at, batch.started_at)
+        self.assertGreater(batch.queue_wait, interactive.queue_wait)
+
+    async def test_limits_batch_builds(self):
+        scheduler = BuildScheduler(cpu_count=4, limits={ "batch": 2 })
+
+        jobs = [scheduler.submit(f"{i}", sleep_command(0.2), "batch") for i in range(3)]
+        interactive = scheduler.submit("interactive", sleep_command(0), "interactive")
+        await asyncio.gather(*[job.task for job in jobs + [interactive]])
+
+        self.assertGreaterEqual(jobs[2].started_at, min(jobs[0].finished_at, jobs[1].finished_at))
+        self.assertLess(interactive.finished_at, jobs[0].finished_at)
+
+    async def test_newer_build_supersedes_running_one(self):
+        scheduler = BuildScheduler(cpu_count=2)
+
+        start = time.monotonic()
+        older = scheduler.submit("main.c", sleep_command(10, "older"))
+        await asyncio.sleep(0.1)
+        newer = scheduler.submit("main.c", sleep_command(0, "newer"))
+
+        self.assertEqual(await newer.task, "newer")
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(older.task.cancelled())
+        self.assertEqual([m["status"] for m in scheduler.get_metrics()], ["cancelled", "done"])
+        self.assertLess(scheduler.get_metrics()[0]["runTime"], 5)
+
+    async def test_reports_failures(self):
+        scheduler = BuildScheduler(cpu_count=1, timeout=0.5)
+
+        failing = scheduler.submit("failing", [sys.executable, "-c", "import sys; print('error: oops'); sys.exit(1)"])
+        slow = scheduler.submit("slow", sleep_command(10))
+
+        with self.assertRaisesRegex(Exception, "exit code 1(.|\n)*error: oops"):
+            await failing.task
+        with self.assertRaisesRegex(Exception, "did not finish"):
+            await slow.task
+        metrics = scheduler.get_metrics()
+        self.assertEqual([m["status"] for m in metrics], ["failed", "failed"])
+        self.assertGreater(metrics[1]["queueWait"], 0)
+        self.assertGreaterEqual(metrics[1]["runTime"], 0.5)
+
+    @unittest.skipIf(clang is None or shutil.which(os.environ.get("CC", "cc")) is None, "libclang or a C compiler is not installed")
+    async def test_builds_files_of_one_directory_separately(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sources = {}
+            for name in ["first", "second"]:
+                sources[name] = f'#include <stdio.h>\n\nint main() {{\n    printf("{name}\\n");\n    return 0;\n}}\n'
+                with open(os.path.join(directory, f"{name}.c"), "w") as f:
+                    f.write(sources[name])
+
+            metrics = await build_all([os.path.join(directory, f"{name}.c") for name in sources], "batch", ["--native"], cpu_count=2)
+
+            self.assertEqual([m["status"] for m in metrics], ["done", "done"])
+            for name in sources:
+                output_directory = get_output_directory(os.path.join(directory, f"{name}.c"))
+                with open(os.path.join(output_directory, "output.meta"), "rb") as f:
+                    (code, _) = NotifyMetadataSerializer().deserialize(f.read())
+                trace_path = os.path.join(output_directory, "trace.bin")
+                subprocess.run([os.path.join(output_directory, "output")], env={**os.environ, "SIMULATOR_TRACE": trace_path}, check=True, timeout=10)
+                with open(trace_path + ".stdout") as f:
+                    output = f.read()
+                self.assertEqual(code, sources[name])
+                self.assertEqual(output, f"{name}\n")
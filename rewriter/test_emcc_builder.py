@@ -0,0 +1,177 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from emcc_builder import TRACE_BUFFER_PATH, EmccBuilder
+
+try:
+    import rewrite
+except ImportError:
+    rewrite = None
+
+# Stands in for emcc: prints a version, writes the file after -o and logs every compilation
+FAKE_EMCC = """
+import sys
+if "--version" in sys.argv: 
+    print("emcc 1.0")
+else: 
+    open(sys.argv[sys.argv.index("-o") + 1], "w").write("object")
+    open(sys.argv[1], "a").write("compiled\\n")
+"""
+
+# Stands in for library.js: prints the records of each flush of trace_buffer.c
+TRACE_BUFFER_HOST = """
+#include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+
+static const unsigned char* records;
+static int* record_count;
+
+void register_trace_buffer(void* buffer, int* count, int capacity) {
+    records = buffer;
+    record_count = count;
+}
+
+void flush_trace_buffer(void) {
+    printf("flush %d\\n", *record_count);
+    for (int i = 0; i < *record_count; i++) {
+        int32_t id;
+        double value;
+        memcpy(&id, records + 16 * i, 4);
+        memcpy(&value, records + 16 * i + 8, 8);
+        printf("%d %.17g\\n", id, value);
+    }
+    *record_count = 0;
+}
+"""
+
+LOOP_CODE = """int main() {
+    int sum = 0;
+    for (int i = 0; i < 3000; i++) {
+        sum = sum + i;
+    }
+    return 0;
+}
+"""
+
+class TestEmccBuilder(unittest.TestCase):
+    def test_link_command(self):
+        builder = EmccBuilder("optimized")
+
+        command = builder.get_link_command("a.o", ["metadata.js", "a.g.js"], "library.js", "output.js")
+
+        self.assertEqual(command[0:3], ["emcc", "a.o", "-O2"])
+        self.assertEqual(command[-8:], ["--pre-js", "metadata.js", "--pre-js", "a.g.js", "--js-library", "library.js", "-o", "output.js"])
+        self.assertIn("DEFAULT_LIBRARY_FUNCS_TO_INCLUDE=['$simulatorRecordStep']", command)
+
+    def test_asyncify_link_command(self):
+        command = EmccBuilder(asyncify=True).get_link_command("a.o", [], "library.js", "output.js")
+
+        self.assertIn("ASYNCIFY_IMPORTS=['notify','notify_aggregate']", command)
+        self.assertIn("EXPORTED_RUNTIME_METHODS=['HEAPU8','stackSave','stackRestore','ccall']", command)
+        self.assertNotIn("ASYNCIFY=1", EmccBuilder().get_link_command("a.o", [], "library.js", "output.js"))
+
+    def test_link_refuses_to_overwrite_inputs(self):
+        builder = EmccBuilder(emcc=[sys.executable, "-c", FAKE_EMCC, os.devnull])
+
+        with self.assertRaisesRegex(Exception, "would overwrite"):
+            builder.link("a.o", ["metadata.js", "output-capture.js"], "library.js", "./output-capture.js")
+
+    def test_compile_reuses_cached_object(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, "log")
+            c_path = os.path.join(directory, "a.g.c")
+            with open(c_path, "w") as f:
+                f.write("int main() { return 0; }")
+            builder = EmccBuilder(cache_directory=os.path.join(directory, "cache"), emcc=[sys.executable, "-c", FAKE_EMCC, log_path])
+
+            object_path = builder.compile(c_path)
+            cached_object_path = builder.compile(c_path)
+            optimized_object_path = EmccBuilder("optimized", os.path.join(directory, "cache"), emcc=builder.emcc).compile(c_path)
+
+            self.assertEqual(object_path, cached_object_path)
+            self.assertNotEqual(object_path, optimized_object_path)
+            with open(log_path) as f:
+                self.assertEqual(f.read(), "compiled\n" * 2)
+
+    @unittest.skipIf(shutil.which(os.environ.get("CC", "cc")) is None, "a C compiler is not installed")
+    def test_compile_depends_on_local_headers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            c_path = os.path.join(directory, "main.g.c")
+            header_path = os.path.join(directory, "conf.h")
+            with open(c_path, "w") as f:
+                f.write('#include "conf.h"\nint n = N;\n')
+            builder = EmccBuilder(cache_directory=os.path.join(directory, "cache"), emcc=[os.environ.get("CC", "cc")])
+            object_paths = []
+            for value in [3, 99, 3]:
+                with open(header_path, "w") as f:
+                    f.write(f"#define N {value}\n")
+                object_paths.append(builder.compile(c_path))
+            os.remove(header_path)
+            with self.assertRaisesRegex(Exception, "conf.h"):
+                builder.compile(c_path)
+
+        self.assertNotEqual(object_paths[0], object_paths[1])
+        self.assertEqual(object_paths[0], object_paths[2])
+
+    def test_build_project_links_objects_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, "log")
+            c_paths = [os.path.join(directory, f"{name}.g.c") for name in ["main", "list"]]
+            header_path = os.path.join(directory, "list.h")
+            for path in c_paths + [header_path]:
+                with open(path, "w") as f:
+                    f.write(f"// {path}")
+            builder = EmccBuilder(cache_directory=os.path.join(directory, "cache"), emcc=[sys.executable, "-c", FAKE_EMCC, log_path])
+
+            builder.build_project(c_paths, ["a.g.js"], "library.js", os.path.join(directory, "output.js"), [directory], [header_path], jobs=2)
+            object_path = builder.compile(c_paths[0], [directory], [header_path])
+            with open(header_path, "a") as f:
+                f.write("int changed;")
+            changed_object_path = builder.compile(c_paths[0], [directory], [header_path])
+
+            self.assertNotEqual(object_path, changed_object_path)
+            with open(log_path) as f:
+                self.assertEqual(f.read(), "compiled\n" * 4)
+        self.assertEqual(EmccBuilder().get_compile_command("a.g.c", "a.o", ["src"])[0:5], ["emcc", "-c", "a.g.c", "-iquote", "src"])
+        self.assertEqual(EmccBuilder().get_link_command(["a.o", "b.o"], [], "library.js", "output.js")[0:4], ["emcc", "a.o", "b.o", "-O0"])
+
+    def test_run_reports_diagnostics(self):
+        builder = EmccBuilder(emcc=[sys.executable, "-c", "import sys; print('error: oops', file=sys.stderr); sys.exit(1)"])
+
+        with self.assertRaisesRegex(Exception, "exit code 1(.|\n)*error: oops"):
+            builder.run(builder.emcc)
+
+    def test_run_times_out(self):
+        builder = EmccBuilder(timeout=0.1, emcc=[sys.executable, "-c", "import time; time.sleep(5)"])
+
+        with self.assertRaisesRegex(Exception, "did not finish"):
+            builder.run(builder.emcc)
+
+    @unittest.skipIf(rewrite is None or shutil.which(os.environ.get("CC", "cc")) is None, "libclang or a C compiler is not installed")
+    def test_trace_buffer_flushes_full_buffers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            c_path = os.path.join(directory, "main.g.c")
+            host_path = os.path.join(directory, "host.c")
+            rewrite.write_file(source_path, LOOP_CODE)
+            rewrite.write_file(host_path, TRACE_BUFFER_HOST)
+            with contextlib.redirect_stdout(io.StringIO()):
+                rewrite.generate_temp_files(source_path, c_path, os.path.join(directory, "main.g.js"), os.path.join(directory, "output.meta"), native=True)
+            # Built natively, the records have the same layout in linear memory
+            program_path = os.path.join(directory, "output")
+            subprocess.run([os.environ.get("CC", "cc"), c_path, TRACE_BUFFER_PATH, host_path, "-o", program_path], check=True, capture_output=True)
+            output = subprocess.run([program_path], check=True, capture_output=True, text=True, timeout=10).stdout
+
+        lines = output.splitlines()
+        flushes = [int(line.split()[1]) for line in lines if line.startswith("flush")]
+        records = [line.split() for line in lines if not line.startswith("flush")]
+        self.assertEqual(flushes[:-1], [4096] * (len(flushes) - 1))
+        self.assertGreater(len(flushes), 1)
+        self.assertEqual(len(records), sum(flushes))
+        self.assertIn(["4498500"], [r[1:] for r in records])
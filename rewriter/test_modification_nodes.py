@@ -1,5 +1,6 @@
 import unittest
-from modification_nodes import ConstantNode, TemplatedNode, TemplatedReplaceNode, template_replace_node
+from modification_nodes import ConstantNode, TemplatedNode, TemplatedReplaceNode, comma_node_with_parentheses, template_replace_node
+from source_nodes import SourceNode
 
 class TestFunctions(unittest.TestCase):
     def test_template_replace_node_1_args(self):
@@ -10,7 +11,8 @@ class TestFunctions(unittest.TestCase):
         with self.assertRaises(Exception):
             template_replace_node(
                 "{0}, {1}", 
-                ConstantNode("target"), 
+                "{0}, {1}", 
+                SourceNode.create(None, "target", [], []), 
                 *input
             )
 
@@ -22,18 +24,20 @@ class TestFunctions(unittest.TestCase):
         ]
         output = template_replace_node(
             "{0}, {1}", 
-            ConstantNode("target"), 
+            "{0}, {1}", 
+            SourceNode.create(None, "target", [], []), 
             *input
         )
         output_children = output.get_children()
         
         self.assertEqual(type(output), TemplatedReplaceNode)
         self.assertEqual(output.template, "{0}, {1}")
+        self.assertEqual(len(output_children), 2)
         self.assertEqual(output_children[0], input[0])
         self.assertEqual(output_children[1], input[1])
 
     def test_template_replace_node_3_args(self):
-        # f(1, 2, 3) -> ((1, 2), 3)
+        # f(1, 2, 3) -> (1, 2, 3)
         input = [
             ConstantNode("1"),
             ConstantNode("2"),
@@ -41,24 +45,21 @@ class TestFunctions(unittest.TestCase):
         ]
         output = template_replace_node(
             "{0}, {1}", 
-            ConstantNode("target"), 
+            "{0}, {1}", 
+            SourceNode.create(None, "target", [], []), 
             *input
         )
         output_children = output.get_children()
-        output_grandchildren = output_children[0].get_children()
         
         self.assertEqual(type(output), TemplatedReplaceNode)
-        self.assertEqual(type(output_children[0]), TemplatedNode)
-
-        self.assertEqual(output.template, "{0}, {1}")
-        self.assertEqual(output_children[0].template, "{0}, {1}")
-
-        self.assertEqual(output_grandchildren[0], input[0])
-        self.assertEqual(output_grandchildren[1], input[1])
-        self.assertEqual(output_children[1], input[2])
+        self.assertEqual(output.template, "{0}, {1}, {2}")
+        self.assertEqual(len(output_children), 3)
+        self.assertEqual(output_children[0], input[0])
+        self.assertEqual(output_children[1], input[1])
+        self.assertEqual(output_children[2], input[2])
     
     def test_template_replace_node_4_args(self):
-        # f(1, 2, 3, 4) -> (((1, 2), 3), 4)
+        # f(1, 2, 3, 4) -> (1, 2, 3, 4)
         input = [
             ConstantNode("1"),
             ConstantNode("2"),
@@ -67,22 +68,31 @@ class TestFunctions(unittest.TestCase):
         ]
         output = template_replace_node(
             "{0}, {1}", 
-            ConstantNode("target"), 
+            "{0}, {1}", 
+            SourceNode.create(None, "target", [], []), 
             *input
         )
         output_children = output.get_children()
-        output_grandchildren = output_children[0].get_children()
-        output_greatgrandchildren = output_grandchildren[0].get_children()
         
         self.assertEqual(type(output), TemplatedReplaceNode)
-        self.assertEqual(type(output_children[0]), TemplatedNode)
-        self.assertEqual(type(output_grandchildren[0]), TemplatedNode)
-
-        self.assertEqual(output.template, "{0}, {1}")
-        self.assertEqual(output_children[0].template, "{0}, {1}")
-        self.assertEqual(output_grandchildren[0].template, "{0}, {1}")
+        self.assertEqual(output.template, "{0}, {1}, {2}, {3}")
+        self.assertEqual(len(output_children), 4)
+        self.assertEqual(output_children[0], input[0])
+        self.assertEqual(output_children[1], input[1])
+        self.assertEqual(output_children[2], input[2])
+        self.assertEqual(output_children[3], input[3])
 
-        self.assertEqual(output_greatgrandchildren[0], input[0])
-        self.assertEqual(output_greatgrandchildren[1], input[1])
-        self.assertEqual(output_grandchildren[1], input[2])
-        self.assertEqual(output_children[1], input[3])
\ No newline at end of file
+    def test_template_node_with_parentheses_4_args(self):
+        # f(1, 2, 3, 4) -> (1, 2, 3, 4)
+        input = [
+            ConstantNode("1"),
+            ConstantNode("2"),
+            ConstantNode("3"),
+            ConstantNode("4"),
+        ]
+        output = comma_node_with_parentheses(*input)
+        
+        self.assertEqual(type(output), TemplatedNode)
+        self.assertEqual(output.template, "({0}, {1}, {2}, {3})")
+        self.assertEqual(len(output.get_children()), 4)
+        self.assertEqual(f"{output.apply()}", "(1, 2, 3, 4)")
@@ -0,0 +1,116 @@
+import contextlib
+import io
+import os
+import shutil
+import signal
+import struct
+import subprocess
+import tempfile
+import unittest
+from native_builder import NativeBuilder
+
+try:
+    import rewrite
+except ImportError:
+    rewrite = None
+
+CODE = """#include <stdio.h>
+
+int main() {
+    int i = -2;
+    unsigned char c = 200;
+    double d = 0.5;
+    int a[2] = {1, 2};
+    i = i * 3;
+    printf("%d %d\\n", i, c);
+    d = d + i;
+    return 0;
+}
+"""
+
+CRASHING_CODE = """#include <stdio.h>
+
+int main() {
+    int x = 7;
+    int* p = 0;
+    printf("x is %d\\n", x);
+    printf("crashing");
+    x = x + *p;
+    return 0;
+}
+"""
+
+def read_records(trace_path) -> list[tuple[int, int, float]]:
+    with open(trace_path, "rb") as f:
+        trace = f.read()
+    return [struct.unpack_from("<IId", trace, offset) for offset in range(16, len(trace), 16)]
+
+class TestNativeBuilder(unittest.TestCase):
+    def test_link_command(self):
+        command = NativeBuilder("optimized", cc=["gcc"]).get_link_command(["a.o", "b.o"], "output")
+
+        self.assertEqual(command, ["gcc", "a.o", "b.o", "-O2", "-o", "output"])
+
+    @unittest.skipIf(rewrite is None or shutil.which(os.environ.get("CC", "cc")) is None, "libclang or a C compiler is not installed")
+    def test_writes_binary_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            rewrite.write_file(source_path, CODE)
+            traces = []
+            for eliminate_redundant_notifies in [False, True]:
+                c_path = os.path.join(directory, "main.g.c")
+                meta_path = os.path.join(directory, "output.meta")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rewrite.generate_temp_files(source_path, c_path, os.path.join(directory, "main.g.js"), meta_path, eliminate_redundant_notifies=eliminate_redundant_notifies, native=True)
+                program_path = os.path.join(directory, "output")
+                NativeBuilder(cache_directory=os.path.join(directory, "cache")).build(c_path, program_path)
+                trace_path = os.path.join(directory, f"trace{len(traces)}.bin")
+                subprocess.run([program_path], env={**os.environ, "SIMULATOR_TRACE": trace_path}, check=True, timeout=10)
+                traces.append(read_records(trace_path))
+            with open(meta_path, "rb") as f:
+                (_, notifications) = rewrite.NotifyMetadataSerializer().deserialize(f.read())
+            with open(trace_path + ".stdout") as f:
+                output = f.read()
+            with open(trace_path + ".data", "rb") as f:
+                data = f.read()
+
+        # Derived steps are written by the runtime, so both builds have the same steps
+        self.assertEqual([(id, value) for (id, _, value) in traces[0]], [(id, value) for (id, _, value) in traces[1]])
+        self.assertTrue(any(n.get("derivedFrom") is not None for n in notifications))
+        declarations = {notifications[id]["identifier"]: value for (id, _, value) in traces[1] if id < len(notifications) and notifications[id]["action"] == "decl"}
+        self.assertEqual(declarations, {"i": -2, "c": 200, "d": 0.5})
+        assignments = [value for (id, _, value) in traces[1] if id < len(notifications) and notifications[id]["action"] == "assign"]
+        self.assertEqual(assignments, [-6, -5.5])
+        self.assertEqual(output, "-6 200\n")
+        self.assertIn((0xFFFFFFFF, 0, 7.0), traces[1])
+        aggregate_offset = next(int(value) for (id, _, value) in traces[1] if id & 0x80000000 and id < 0xFFFFFFFE)
+        self.assertEqual(struct.unpack_from("<Iii", data, aggregate_offset - 4), (8, 1, 2))
+
+    @unittest.skipIf(rewrite is None or shutil.which(os.environ.get("CC", "cc")) is None, "libclang or a C compiler is not installed")
+    def test_keeps_steps_of_crashing_program(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            rewrite.write_file(source_path, CRASHING_CODE)
+            c_path = os.path.join(directory, "main.g.c")
+            meta_path = os.path.join(directory, "output.meta")
+            with contextlib.redirect_stdout(io.StringIO()):
+                rewrite.generate_temp_files(source_path, c_path, os.path.join(directory, "main.g.js"), meta_path, native=True)
+            program_path = os.path.join(directory, "output")
+            NativeBuilder(cache_directory=os.path.join(directory, "cache")).build(c_path, program_path)
+            trace_path = os.path.join(directory, "trace.bin")
+            process = subprocess.run([program_path], env={**os.environ, "SIMULATOR_TRACE": trace_path}, timeout=10)
+            with open(trace_path, "rb") as f:
+                header = f.read(16)
+            records = read_records(trace_path)
+            with open(meta_path, "rb") as f:
+                (_, notifications) = rewrite.NotifyMetadataSerializer().deserialize(f.read())
+            with open(trace_path + ".stdout") as f:
+                output = f.read()
+
+        self.assertEqual(process.returncode, -signal.SIGSEGV)
+        self.assertEqual(header[:12], b"CSTRACE1" + struct.pack("<I", 16))
+        declarations = {notifications[id]["identifier"]: value for (id, _, value) in records if id < len(notifications) and notifications[id]["action"] == "decl"}
+        self.assertEqual(declarations, {"x": 7, "p": 0})
+        # The line and the output pending at the crash, without a line break
+        self.assertEqual(output, "x is 7\ncrashing")
+        self.assertEqual([value for (id, _, value) in records if id == 0xFFFFFFFF], [7.0, 15.0])
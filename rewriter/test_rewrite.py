@@ -0,0 +1,175 @@
+import contextlib
+import io
+import os
+import re
+import tempfile
+import unittest
+
+try:
+    import rewrite
+except ImportError:
+    rewrite = None
+
+CODE = """#include <stdio.h>
+
+int add(int a, int b) {
+    return a + b;
+}
+
+int twice(int a) {
+    int b = a;
+    b *= 2;
+    return b;
+}
+
+int main() {
+    int x = add(1, 2);
+    x += twice(x);
+    printf("%d\\n", x);
+    return 0;
+}
+"""
+
+AGGREGATE_CODE = """struct point { int x; int y; };
+
+int main() {
+    int i = 1;
+    int a[2][3] = {{0}};
+    struct point p = {i, 2};
+    a[i][0] = p.y;
+    i = a[i][0] + 1;
+    return 0;
+}
+"""
+
+PROJECT_FILES = {
+    "include/list.h": """#ifndef LIST_H
+#define LIST_H
+int sum(int* values, int count);
+extern int calls;
+static inline int twice(int x) { return x * 2; }
+#endif
+""",
+    "src/list.c": """#include "../include/list.h"
+int calls;
+int sum(int* values, int count) {
+    int total = 0;
+    for (int i = 0; i < count; i++) total += values[i];
+    calls++;
+    return total + 0;
+}
+""",
+    "src/main.c": """#include <stdio.h>
+#include "../include/list.h"
+int main() {
+    int values[3] = { 1, 2, 3 };
+    int s = sum(values, 3);
+    printf("%d %d\\n", twice(s), calls);
+    return 0;
+}
+""",
+}
+
+@unittest.skipIf(rewrite is None, "libclang is not installed")
+class TestRewrite(unittest.TestCase):
+    def test_get_partitions(self):
+        self.assertEqual(rewrite.get_partitions([1, 1, 1, 1], 2), [range(0, 2), range(2, 4)])
+        self.assertEqual(rewrite.get_partitions([6, 1, 1, 1], 2), [range(0, 1), range(1, 4)])
+        self.assertEqual(rewrite.get_partitions([1, 1], 4), [range(0, 1), range(1, 2)])
+        self.assertEqual(rewrite.get_partitions([], 4), [])
+
+    def test_partitioned_code_matches_serial_code(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            rewrite.write_file(source_path, CODE)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                (serial_code, serial_notifications) = rewrite.generate_code(source_path, CODE)
+            (partitioned_code, partitioned_notifications) = rewrite.generate_partitioned_code(source_path, CODE, 2)
+
+        serializer = rewrite.NotifyDataSerializer()
+        self.assertEqual(partitioned_code, serial_code)
+        self.assertEqual([n.id for n in partitioned_notifications], list(range(0, len(serial_notifications))))
+        self.assertEqual(serializer.serialize_list(partitioned_notifications), serializer.serialize_list(serial_notifications))
+
+    def test_instruments_deeply_nested_expressions(self):
+        depth = 5000
+        code = "int main() {\n    int x = 1;\n    return " + " + ".join(["x"] * depth) + ";\n}\n"
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            rewrite.write_file(source_path, code)
+
+            # The printed trees are quadratic in depth, every node prints its whole subtree
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                (code, notifications) = rewrite.generate_code(source_path, code)
+
+        # Both statements, the declaration of x, each read of x and each addition
+        self.assertEqual(len(notifications), 2 + 1 + depth + depth - 1)
+        self.assertEqual(code.count("notify("), len(notifications))
+
+    def test_captures_aggregates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            rewrite.write_file(source_path, AGGREGATE_CODE)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                (code, notifications) = rewrite.generate_code(source_path, AGGREGATE_CODE)
+
+        self.assertIn("notify(2, (void*)0); int a[2][3] = {{0}}; notify_aggregate(3, &a, sizeof(a));", code)
+        self.assertIn("struct point p = {(temp1 = i, notify(5, &temp1), temp1), 2}; notify_aggregate(6, &p, sizeof(p));", code)
+        self.assertIn("temp2 = a[i][0] = p.y", code)
+        self.assertIn("temp4 = a[(temp3 = i, notify(11, &temp3), temp3)][0] + 1", code)
+        self.assertEqual([(n.action, n.type, n.identifier) for n in notifications if n.size is not None], [
+            ("decl", "int[2][3]", "a"),
+            ("decl", "struct point", "p"),
+        ])
+
+    def test_counts_statements_in_coverage_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            rewrite.write_file(source_path, CODE)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                (code, notifications) = rewrite.generate_code(source_path, CODE, coverage=True)
+            (partitioned_code, _) = rewrite.generate_partitioned_code(source_path, CODE, 2, coverage=True)
+
+        self.assertEqual(partitioned_code, code)
+        self.assertNotIn("notify(", code)
+        self.assertIn("return simulator_counters[0]++, a + b;", code)
+        self.assertIn("int x = (simulator_counters[4]++, add(1, 2));", code)
+        self.assertEqual([(n.action, n.location[0]) for n in notifications], [("stat", 4), ("stat", 8), ("stat", 9), ("stat", 10), ("stat", 14), ("stat", 15), ("stat", 16), ("stat", 17)])
+        self.assertIn("unsigned long long simulator_counters[8];", rewrite.get_code_prefix(notifications, coverage=True))
+
+    def test_instruments_project_files_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for (path, content) in PROJECT_FILES.items():
+                os.makedirs(os.path.join(directory, os.path.dirname(path)), exist_ok=True)
+                rewrite.write_file(os.path.join(directory, path), content)
+            output_directory = os.path.join(directory, "build")
+            meta_path = os.path.join(output_directory, "output.meta")
+            source_paths = [os.path.join(directory, "src", "main.c"), os.path.join(directory, "src", "list.c")]
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                (c_paths, header_paths) = rewrite.generate_project_files(source_paths, directory, output_directory, os.path.join(output_directory, "output.g.js"), meta_path, 2)
+                (coverage_c_paths, _) = rewrite.generate_project_files(source_paths, directory, os.path.join(directory, "coverage"), os.path.join(directory, "coverage.g.js"), os.path.join(directory, "coverage.meta"), 2, coverage=True)
+            codes = [rewrite.read_file(p) for p in c_paths + header_paths]
+            coverage_codes = [rewrite.read_file(p) for p in coverage_c_paths]
+            with open(meta_path, "rb") as f:
+                (code, notifications) = rewrite.NotifyMetadataSerializer().deserialize(f.read())
+
+        self.assertEqual([os.path.relpath(p, output_directory) for p in c_paths + header_paths], [os.path.join("src", "main.g.c"), os.path.join("src", "list.g.c"), os.path.join("include", "list.h")])
+        # Ids of each file follow those of the previous one
+        ids = [[int(i) for i in re.findall(r"notify(?:_aggregate)?\((\d+),", c)] for c in codes]
+        self.assertEqual(sorted(i for file_ids in ids for i in file_ids), list(range(0, len(notifications))))
+        self.assertLess(max(ids[0]), min(ids[1]))
+        self.assertLess(max(ids[1]), min(ids[2]))
+        # Variables with static storage cannot be initialized by notifications
+        self.assertIn("\nint calls;\n", codes[1])
+        self.assertIn("\nextern int calls;\n", codes[2])
+        self.assertTrue(code.startswith("// src/main.c\n#include <stdio.h>\n"))
+        self.assertIn("\n// src/list.c\n#include", code)
+        (line, column, end_line, end_column) = notifications[ids[2][0]]["location"]
+        self.assertEqual(code.split("\n")[line - 1][column - 1:end_column], "x * 2")
+        self.assertIn("unsigned long long simulator_counters[", coverage_codes[0])
+        self.assertTrue(coverage_codes[1].startswith("extern unsigned long long simulator_counters[];"))
+
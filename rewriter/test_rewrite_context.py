@@ -0,0 +1,68 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from rewrite_context import RewriteContext
+from source_nodes import SourceNode, SourceTreeCreator
+from source_visitors import CompositeTreeVisitor, NotifyDataSerializer, PartialTreeVisitor_BinaryOperator, PartialTreeVisitor_BinaryOperator_Assignment, PartialTreeVisitor_DeclRefExpr, PartialTreeVisitor_FunctionDecl, PartialTreeVisitor_VarDecl, SourceTreeModifier
+
+try:
+    import clang.cindex
+except ImportError:
+    clang = None
+
+CODE = """int main() {
+    int i = 1;
+    int j = i * 2 + i;
+    j += i;
+    return j;
+}
+"""
+
+def rewrite(code):
+    context = RewriteContext()
+    tu = clang.cindex.Index.create().parse("main.c", unsaved_files=[("main.c", code)])
+    tu_filter = lambda n: n.location.file is not None and n.location.file.name == "main.c"
+    source_root = SourceTreeCreator(tu_filter, context).create(code, tu.cursor)
+
+    partial_visitors = [
+        PartialTreeVisitor_FunctionDecl(),
+        PartialTreeVisitor_VarDecl(),
+        PartialTreeVisitor_BinaryOperator_Assignment(),
+        PartialTreeVisitor_BinaryOperator(),
+        PartialTreeVisitor_DeclRefExpr()
+    ]
+    composite_visitor = CompositeTreeVisitor(partial_visitors, context)
+    modification_root = composite_visitor.visit(source_root)
+    modified_source_root = SourceTreeModifier([modification_root]).visit(source_root)
+
+    notifications = composite_visitor.get_notifies()
+    return (f"{modified_source_root}", [n.id for n in notifications], NotifyDataSerializer().serialize_list(notifications))
+
+class TestRewriteContext(unittest.TestCase):
+    def test_node_ids_per_context(self):
+        context1 = RewriteContext()
+        context2 = RewriteContext()
+
+        ids1 = [SourceNode.create(None, "", [], [], context1).id for _ in range(0, 3)]
+        ids2 = [SourceNode.create(None, "", [], [], context2).id for _ in range(0, 3)]
+
+        self.assertEqual(ids1, [1, 2, 3])
+        self.assertEqual(ids2, [1, 2, 3])
+        self.assertLess(SourceNode.create(None, "", [], []).id, 0)
+
+    @unittest.skipIf(clang is None, "libclang is not installed")
+    def test_sequential_rewrites(self):
+        output1 = rewrite(CODE)
+        output2 = rewrite(CODE)
+
+        self.assertEqual(output1[1], list(range(0, len(output1[1]))))
+        self.assertEqual(output1, output2)
+
+    @unittest.skipIf(clang is None, "libclang is not installed")
+    def test_parallel_rewrites(self):
+        expected = rewrite(CODE)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            outputs = list(executor.map(rewrite, [CODE] * 8))
+
+        for output in outputs:
+            self.assertEqual(output, expected)
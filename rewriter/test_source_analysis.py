@@ -0,0 +1,58 @@
+import unittest
+from rewrite_context import RewriteContext
+from source_analysis import RedundantNotifyAnalysis, get_descendants, get_reentrant_functions
+from source_nodes import SourceTreeCreator
+
+try:
+    import clang.cindex
+except ImportError:
+    clang = None
+
+CODE = """int square(int x) {
+    return x * x;
+}
+
+int fact(int k) {
+    return k <= 1 ? 1 : k * fact(k - 1);
+}
+
+int main() {
+    int n = 5;
+    int total = 0;
+    for (int i = 0; i <= n; i++) {
+        total += i + i;
+        total = total + square(total) + total;
+    }
+    int *p = &total;
+    return total + total + n;
+}
+"""
+
+@unittest.skipIf(clang is None, "libclang is not installed")
+class TestRedundantNotifyAnalysis(unittest.TestCase):
+    def setUp(self):
+        tu = clang.cindex.Index.create().parse("main.c", unsaved_files=[("main.c", CODE)])
+        self.tu_filter = lambda n: n.location.file is not None and n.location.file.name == "main.c"
+        self.cursor = tu.cursor
+        self.source_root = SourceTreeCreator(self.tu_filter, RewriteContext()).create(CODE, tu.cursor)
+        self.nodes = { n.id: n for n in get_descendants(self.source_root) }
+
+    def get_derivations(self):
+        reentrant_functions = get_reentrant_functions(self.cursor, self.tu_filter)
+        derivations = RedundantNotifyAnalysis(reentrant_functions).analyze(self.source_root)
+        return sorted((self.describe(self.nodes[k]), self.describe(self.nodes[v])) for (k, v) in derivations.items())
+
+    def describe(self, source_node):
+        location = source_node.node.extent.start
+        return (source_node.node.spelling, location.line, location.column)
+
+    def test_reentrant_functions(self):
+        self.assertEqual(get_reentrant_functions(self.cursor, self.tu_filter), set(["c:@F@fact"]))
+
+    def test_derivations(self):
+        self.assertEqual(self.get_derivations(), [
+            (("i", 13, 22), ("i", 13, 18)),
+            (("n", 12, 26), ("n", 10, 5)),
+            (("n", 17, 28), ("n", 10, 5)),
+            (("x", 2, 16), ("x", 2, 12)),
+        ])
@@ -0,0 +1,83 @@
+import contextlib
+import io
+import time
+import unittest
+from ast_visitors import AstPrinter
+from modification_nodes import CompoundReplaceNode, ConstantNode, CopyReplaceNode, ReplaceNode
+from rewrite_context import RewriteContext
+from source_nodes import SourceNode, SourceTreeCreator, SourceTreePrinter
+from source_visitors import SourceTreeModifier
+
+try:
+    import clang.cindex
+except ImportError:
+    clang = None
+
+# Deep trees must be handled without hitting the recursion limit, within the time budget (in seconds)
+DEPTH = 5000
+TIME_BUDGET = 10
+
+def create_nested_expression(depth):
+    context = RewriteContext()
+    leaf = SourceNode.create(None, "x", [], [], context)
+    node = leaf
+    for _ in range(0, depth):
+        node = SourceNode.create(None, "({0} + 1)", [], [node], context)
+        node.children[0].parent = node
+    return (node, leaf)
+
+class TestDeepSourceTrees(unittest.TestCase):
+    def setUp(self):
+        self.start_time = time.time()
+
+    def tearDown(self):
+        self.assertLess(time.time() - self.start_time, TIME_BUDGET)
+
+    def test_str_nested_expression(self):
+        (root, _) = create_nested_expression(DEPTH)
+
+        self.assertEqual(f"{root}", "(" * DEPTH + "x" + " + 1)" * DEPTH)
+
+    def test_source_tree_modifier_nested_expression(self):
+        (root, leaf) = create_nested_expression(DEPTH)
+
+        output = SourceTreeModifier([ReplaceNode(leaf, ConstantNode("y"))]).visit(root)
+
+        self.assertEqual(f"{output}", "(" * DEPTH + "y" + " + 1)" * DEPTH)
+        self.assertEqual(f"{root}", "(" * DEPTH + "x" + " + 1)" * DEPTH)
+
+    def test_copy_replace_node_nested_expression(self):
+        (root, leaf) = create_nested_expression(DEPTH)
+
+        output = CopyReplaceNode(root, [ReplaceNode(leaf, ConstantNode("y"))]).apply()
+
+        self.assertEqual(f"{output}", "(" * DEPTH + "y" + " + 1)" * DEPTH)
+
+    def test_compound_replace_node_nested_expression(self):
+        (root, leaf) = create_nested_expression(DEPTH)
+
+        self.assertTrue(CompoundReplaceNode.isAnyDescendantApplicable(root, ReplaceNode(leaf, ConstantNode("y"))))
+        self.assertFalse(CompoundReplaceNode.isAnyDescendantApplicable(leaf, ReplaceNode(root, ConstantNode("y"))))
+
+    def test_source_tree_printer_nested_expression(self):
+        (root, _) = create_nested_expression(DEPTH)
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            SourceTreePrinter(True).print(root)
+        lines = output.getvalue().splitlines()
+
+        self.assertEqual(len(lines), DEPTH + 1)
+        self.assertEqual(lines[-1], "  " * DEPTH + "x (#1)")
+
+    @unittest.skipIf(clang is None, "libclang is not installed")
+    def test_source_tree_creator_nested_expression(self):
+        code = "int main() {\n    return " + " + ".join(["1"] * DEPTH) + ";\n}\n"
+        tu = clang.cindex.Index.create().parse("deep.c", unsaved_files=[("deep.c", code)])
+        tu_filter = lambda n: n.location.file is not None and n.location.file.name == "deep.c"
+
+        root = SourceTreeCreator(tu_filter).create(code, tu.cursor)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            AstPrinter(tu_filter).print(code, tu.cursor)
+
+        self.assertEqual(f"{root}", code)
+        self.assertGreater(len(output.getvalue().splitlines()), DEPTH)
@@ -0,0 +1,45 @@
+import json
+import unittest
+from source_visitors import NotifyDataSerializer, NotifyMetadataSerializer
+from test_utils import create_notify_data
+
+NOTIFICATIONS = [
+    create_notify_data(0, "stat", location=[5, 5, 5, 13]),
+    create_notify_data(1, "decl", type="int", identifier="n"),
+    create_notify_data(2, "eval", type="int", location=[8, 25, 8, 25]),
+    create_notify_data(3, "assign", type="double", identifier="n", location=[8, 20, 8, 35]),
+    create_notify_data(4, "eval", type="int", location=[8, 29, 8, 29], derived_from=2),
+]
+
+class TestNotifyMetadataSerializer(unittest.TestCase):
+    def test_round_trip(self):
+        code = "int main() {\n    printf(\"é\");\n}"
+        serializer = NotifyMetadataSerializer()
+
+        (actual_code, actual_notifications) = serializer.deserialize(serializer.serialize(code, NOTIFICATIONS))
+
+        self.assertEqual(actual_code, code)
+        self.assertEqual(actual_notifications, [
+            { "action": "stat", "location": [5, 5, 5, 13] },
+            { "action": "decl", "dataType": "int", "identifier": "n" },
+            { "action": "eval", "dataType": "int", "location": [8, 25, 8, 25] },
+            { "action": "assign", "dataType": "double", "location": [8, 20, 8, 35], "identifier": "n" },
+            { "action": "eval", "dataType": "int", "location": [8, 29, 8, 29], "derivedFrom": 2 },
+        ])
+
+    def test_matches_json_serializer(self):
+        serializer = NotifyMetadataSerializer()
+
+        (_, actual_notifications) = serializer.deserialize(serializer.serialize("", NOTIFICATIONS))
+        expected_notifications = json.loads(NotifyDataSerializer().serialize_list(NOTIFICATIONS))
+
+        self.assertEqual(actual_notifications, expected_notifications)
+
+    def test_interns_strings(self):
+        serializer = NotifyMetadataSerializer()
+        notifications = [create_notify_data(i, "decl", type="int", identifier="i") for i in range(0, 100)]
+
+        buffer = serializer.serialize("", notifications)
+
+        self.assertEqual(buffer.count(b"\"int\""), 1)
+        self.assertEqual(buffer.count(b"\"i\""), 1)
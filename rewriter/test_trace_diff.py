@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from test_utils import create_notify_data, write_metadata, write_trace
+
+try:
+    import numpy
+    from trace_diff import diff_traces
+    from trace_reader import Trace
+except ImportError:
+    numpy = None
+
+NOTIFICATIONS = [
+    create_notify_data(0, "decl", type="int", identifier="i"),
+    create_notify_data(1, "eval", type="int", location=[2, 21, 2, 21]),
+    create_notify_data(2, "assign", type="int", identifier="i", location=[2, 28, 2, 30]),
+    create_notify_data(3, "decl", type="int", identifier="sum"),
+    create_notify_data(4, "assign", type="int", identifier="sum", location=[3, 9, 3, 16]),
+]
+STDOUT = 0xFFFFFFFF
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestDiffTraces(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.metadata_path = os.path.join(self.directory.name, "output.meta")
+        write_metadata(self.metadata_path, NOTIFICATIONS)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_trace(self, name, records, stdout = b"", metadata_path = None):
+        path = os.path.join(self.directory.name, name)
+        write_trace(path, records, stdout)
+        return Trace.open(path, metadata_path if metadata_path is not None else self.metadata_path)
+
+    def test_equal_traces(self):
+        records = [(0, 0), (3, 0), (1, 0), (4, 0), (2, 1), (1, 1), (4, 1), (2, 2), (STDOUT, 1)]
+
+        diff = diff_traces(self.create_trace("a", records, b"1"), self.create_trace("b", records, b"1"), chunk_size=2)
+
+        self.assertTrue(diff.is_equal())
+        self.assertEqual(diff.compared_values, 6)
+
+    def test_first_divergence_across_chunks(self):
+        # The trace evaluates more expressions, so its chunks hold fewer assignments than those of the reference
+        trace = self.create_trace("a", [(0, 0), (1, 0), (1, 0), (1, 0), (2, 1), (1, 1), (1, 1), (2, 5), (3, 0)], b"15")
+        reference = self.create_trace("b", [(0, 0), (2, 1), (2, 2), (3, 0), (STDOUT, 1)], b"12")
+
+        diff = diff_traces(trace, reference, chunk_size=2)
+
+        self.assertEqual([(d.key, d.index, d.step, d.reference_step, d.value, d.reference_value) for d in diff.divergences], [("i", 2, 7, 2, 5, 2)])
+        self.assertEqual((diff.output.index, diff.output.step, diff.output.reference_step), (1, None, None))
+        self.assertEqual(diff.get_first_divergence().key, "i")
+
+    def test_missing_values(self):
+        trace = self.create_trace("a", [(0, 0), (2, 1)])
+        reference = self.create_trace("b", [(0, 0), (2, 1), (2, 2)], b"x")
+
+        diff = diff_traces(trace, reference, match_lines=True)
+
+        self.assertEqual([(d.key, d.index, d.step, d.reference_step) for d in diff.divergences], [("i:2", 1, None, 2)])
+        self.assertEqual((diff.output.index, diff.output.value, diff.output.reference_value), (0, None, float(ord("x"))))
+
+    def test_renamed_identifier(self):
+        metadata_path = os.path.join(self.directory.name, "renamed.meta")
+        renamed = NOTIFICATIONS[0:2] + [create_notify_data(2, "assign", type="int", identifier="k", location=[2, 28, 2, 30])] + NOTIFICATIONS[3:]
+        renamed[0] = create_notify_data(0, "decl", type="int", identifier="k")
+        write_metadata(metadata_path, renamed)
+        records = [(0, 0), (3, 0), (2, 1), (4, 1)] * 4
+
+        diff = diff_traces(self.create_trace("a", records), self.create_trace("b", records, metadata_path=metadata_path), chunk_size=2)
+
+        self.assertEqual([(d.key, d.index, d.step, d.reference_step, d.value, d.reference_value) for d in diff.divergences], [("i", 0, 0, None, 0, None), ("k", 0, None, 0, None, 0)])
+        self.assertEqual(diff.compared_values, 8)
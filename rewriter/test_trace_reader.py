@@ -0,0 +1,60 @@
+import os
+import struct
+import tempfile
+import unittest
+from test_utils import create_notify_data, write_metadata, write_trace
+
+try:
+    import numpy
+    from trace_reader import Trace
+except ImportError:
+    numpy = None
+
+NOTIFICATIONS = [
+    create_notify_data(0, "decl", type="int", identifier="i"),
+    create_notify_data(1, "eval", type="int", location=[2, 21, 2, 21]),
+    create_notify_data(2, "assign", type="int", identifier="i", location=[2, 28, 2, 30]),
+    create_notify_data(3, "decl", type="int [2]", identifier="a"),
+]
+
+# for (int i = 0; i < 3; i++) printf("%d", i); int a[2] = {1, 2};
+# Output steps have id 0xFFFFFFFF, aggregates the flag 0x80000000 set
+RECORDS = [(0, 0), (1, 0), (0xFFFFFFFF, 1), (2, 1), (1, 1), (0xFFFFFFFF, 2), (2, 2), (1, 2), (0xFFFFFFFF, 3), (2, 3), (1, 3), (0x80000000 | 3, 4)]
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "output.trace")
+        write_trace(self.path, RECORDS, b"012", struct.pack("<Iii", 8, 1, 2))
+        metadata_path = os.path.join(self.directory.name, "output.meta")
+        write_metadata(metadata_path, NOTIFICATIONS)
+        self.trace = Trace.open(self.path, metadata_path)
+
+    def tearDown(self):
+        del self.trace
+        self.directory.cleanup()
+
+    def test_identifier_values(self):
+        (steps, values) = self.trace.get_identifier_values("i")
+
+        self.assertEqual(steps.tolist(), [0, 3, 6, 9])
+        self.assertEqual(values.tolist(), [0, 1, 2, 3])
+        self.assertEqual(self.trace.get_value_range("i"), (0, 3))
+        self.assertIsNone(self.trace.get_value_range("j"))
+
+    def test_line_hits_in_chunks(self):
+        chunks = list(self.trace.chunks(5))
+        (lines, counts) = self.trace.get_line_hits()
+
+        self.assertEqual([start for (start, _) in chunks], [0, 5, 10])
+        self.assertEqual(lines.tolist(), [2])
+        self.assertEqual(counts.tolist(), [4])
+
+    def test_output_and_aggregates(self):
+        (steps, ends) = self.trace.get_output_steps()
+
+        self.assertEqual(steps.tolist(), [2, 5, 8])
+        self.assertEqual([self.trace.get_output()[0:end] for end in ends], [b"0", b"01", b"012"])
+        self.assertEqual(self.trace.get_aggregate(11), struct.pack("<ii", 1, 2))
+        self.assertRaises(Exception, lambda: self.trace.get_aggregate(0))
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+try:
+    import clang.cindex
+    from translation_unit_cache import TranslationUnitCache, get_leading_headers, is_main_file_cursor
+except ImportError:
+    clang = None
+
+CODE = """#include <stdio.h>
+// Comment
+#include <stdlib.h>
+
+int main() {
+    printf("%d\\n", abs(-1));
+    return 0;
+}
+"""
+
+@unittest.skipIf(clang is None, "libclang is not installed")
+class TestTranslationUnitCache(unittest.TestCase):
+    def test_get_leading_headers(self):
+        self.assertEqual(get_leading_headers(CODE), ["#include <stdio.h>", "#include <stdlib.h>"])
+        self.assertEqual(get_leading_headers("#define X 1\n#include <stdio.h>\n"), [])
+        self.assertEqual(get_leading_headers("#include \"local.h\"\n"), [])
+
+    def test_parse_with_precompiled_header(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            with open(source_path, "w") as f:
+                f.write(CODE)
+
+            tu = TranslationUnitCache(os.path.join(directory, "cache")).parse(source_path, CODE)
+            cached_tu = TranslationUnitCache(os.path.join(directory, "cache")).parse(source_path, CODE)
+            plain_tu = clang.cindex.Index.create().parse(source_path)
+
+            self.assertEqual(len([f for f in os.listdir(os.path.join(directory, "cache")) if f.endswith(".pch")]), 1)
+            for t in [tu, cached_tu]:
+                self.assertEqual(
+                    [c.spelling for c in t.cursor.get_children() if is_main_file_cursor(c)],
+                    [c.spelling for c in plain_tu.cursor.get_children() if c.location.file.name == source_path]
+                )
+
+    def test_parse_reuses_translation_unit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            with open(source_path, "w") as f:
+                f.write(CODE)
+            cache = TranslationUnitCache(os.path.join(directory, "cache"))
+
+            self.assertIs(cache.parse(source_path, CODE), cache.parse(source_path, CODE))
+
+    def test_precompiled_header_source_is_written_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, "main.c")
+            with open(source_path, "w") as f:
+                f.write(CODE)
+            cache_directory = os.path.join(directory, "cache")
+            header_path = TranslationUnitCache(cache_directory).get_precompiled_header(CODE)
+            header_source_path = header_path[:-len(".pch")] + ".h"
+            os.utime(header_source_path, (0, 0))
+            os.remove(header_path)
+
+            # A header precompiled by a parallel rewrite stays valid, its source is not written again
+            self.assertEqual(TranslationUnitCache(cache_directory).get_precompiled_header(CODE), header_path)
+            self.assertEqual(os.stat(header_source_path).st_mtime, 0)
+            self.assertEqual(sorted(os.listdir(cache_directory)), sorted([os.path.basename(header_path), os.path.basename(header_source_path)]))
+
+            # Removed by a parallel rewrite in the meantime
+            tu = TranslationUnitCache(cache_directory).parse_with_header(source_path, os.path.join(cache_directory, "removed.pch"))
+            self.assertIn("main", [c.spelling for c in tu.cursor.get_children() if is_main_file_cursor(c)])
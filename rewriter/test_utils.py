@@ -0,0 +1,27 @@
+import struct
+from source_visitors import NotifyData, NotifyMetadataSerializer
+
+def create_notify_data(id, action, type = None, identifier = None, location = None, derived_from = None):
+    n = NotifyData(id, "(void*)0")
+    n.action = action
+    n.type = type
+    n.identifier = identifier
+    n.location = location
+    n.derived_from = derived_from
+    return n
+
+def write_metadata(path, notifications, code = "int main() {}"):
+    with open(path, "wb") as f:
+        f.write(NotifyMetadataSerializer().serialize(code, notifications))
+
+def write_trace(path, records, stdout = b"", data = None):
+    """Writes a trace of (id, value) records as the native runtime does, with its stdout and optionally its data sidecar"""
+    with open(path, "wb") as f:
+        f.write(b"CSTRACE1" + struct.pack("<II", 16, 0))
+        for (id, value) in records:
+            f.write(struct.pack("<IId", id, 0, value))
+    with open(path + ".stdout", "wb") as f:
+        f.write(stdout)
+    if data is not None:
+        with open(path + ".data", "wb") as f:
+            f.write(data)
@@ -0,0 +1,44 @@
+// Buffers steps in linear memory for emcc builds of rewrite.py --trace-buffer, so notify does not call into library.js
+// for every step. Records have the layout of binary traces (see wrapper/trace-writer.js):
+//   record: id (int32), address (uint32), value (float64)
+// library.js reads them with HEAP32 and HEAPF64 when the buffer is full, before output and aggregates are captured
+// (notify_aggregate is still implemented by library.js) and when the program exits.
+#include <stddef.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include "notification_values.h"
+
+#define BUFFER_RECORDS 4096
+
+struct simulator_record {
+    int32_t id;
+    uint32_t address;
+    double value;
+};
+
+static struct simulator_record records[BUFFER_RECORDS];
+static int record_count;
+
+// Implemented by library.js, the flush reads the records and resets record_count
+void register_trace_buffer(struct simulator_record* records, int* count, int capacity);
+void flush_trace_buffer(void);
+
+static void flush_at_exit(void) {
+    flush_trace_buffer();
+}
+
+__attribute__((constructor(101))) static void open_trace_buffer(void) {
+    register_trace_buffer(records, &record_count, BUFFER_RECORDS);
+    atexit(flush_at_exit);
+}
+
+void notify(int id, void* address) {
+    double value = 0;
+    if (address != NULL && id >= 0 && id < notification_count) value = read_value(&notifications[id], address);
+    if (record_count == BUFFER_RECORDS) flush_trace_buffer();
+
+    struct simulator_record* record = &records[record_count++];
+    record->id = id;
+    record->address = (uint32_t)(uintptr_t)address;
+    record->value = value;
+}
@@ -0,0 +1,212 @@
+import argparse
+import collections
+import itertools
+import json
+import os
+import numpy as np
+from trace_reader import CHUNK_SIZE, STDERR_ID, AGGREGATE_FLAG, Trace
+
+class Divergence():
+    """First value of a sequence which differs between a trace and its reference, steps and values are None past the end of a trace"""
+    def __init__(self, key: str, index: int, step: int|None, reference_step: int|None, value: float|None, reference_value: float|None):
+        self.key = key
+        self.index = index
+        self.step = step
+        self.reference_step = reference_step
+        self.value = value
+        self.reference_value = reference_value
+
+    def to_dict(self) -> dict:
+        return { "key": self.key, "index": self.index, "step": self.step, "referenceStep": self.reference_step, "value": self.value, "referenceValue": self.reference_value }
+
+class TraceDiff():
+    """Divergences per identifier in the order of their steps, and of stdout, where index is the first differing byte"""
+    def __init__(self, divergences: list[Divergence], output: Divergence|None, compared_values: int):
+        self.divergences = sorted(divergences, key=lambda d: (d.step is None, d.step, d.reference_step))
+        self.output = output
+        self.compared_values = compared_values
+
+    def is_equal(self) -> bool:
+        return len(self.divergences) == 0 and self.output is None
+
+    def get_first_divergence(self) -> Divergence|None:
+        """Returns the divergence at the earliest step of the trace, output included"""
+        candidates = self.divergences[0:1] + ([self.output] if self.output is not None else [])
+        return min(candidates, key=lambda d: (d.step is None, d.step), default=None)
+
+    def to_dict(self) -> dict:
+        first = self.get_first_divergence()
+        return {
+            "equal": self.is_equal(),
+            "comparedValues": self.compared_values,
+            "first": first.to_dict() if first is not None else None,
+            "output": self.output.to_dict() if self.output is not None else None,
+            "divergences": [d.to_dict() for d in self.divergences],
+        }
+
+class KeyedValueStream():
+    """Yields the values of declarations and assignments of a trace chunk by chunk, grouped by identifier, or by identifier and line.
+    Aggregates are left out, their values are offsets into the data file of their trace.
+    """
+    def __init__(self, trace: Trace, keys: dict[str, int], match_lines: bool, chunk_size: int):
+        self.trace = trace
+        self.chunk_size = chunk_size
+        metadata = trace.metadata
+        is_changing = np.isin(metadata.actions, [metadata.get_action("decl"), metadata.get_action("assign")])
+        self.notification_keys = np.full(len(metadata.actions), -1, dtype=np.int64)
+        for id in np.nonzero(is_changing)[0]:
+            key = metadata.strings[metadata.identifiers[id]]
+            if match_lines:
+                key = f"{key}:{metadata.locations[id][0]}" if metadata.locations[id][0] != -1 else key
+            self.notification_keys[id] = keys.setdefault(key, len(keys))
+        # Keys the trace may have values of, known before reading any of them
+        self.keys = set(int(k) for k in self.notification_keys if k >= 0)
+
+    def __iter__(self):
+        for (start, records) in self.trace.chunks(self.chunk_size):
+            step_keys = self.trace.lookup(self.notification_keys, records)
+            ids = records["id"]
+            step_keys[(ids < STDERR_ID) & ((ids & np.uint32(AGGREGATE_FLAG)) != 0)] = -1
+            indexes = np.nonzero(step_keys >= 0)[0]
+            # Stable, so values of a key stay in the order of their steps
+            order = np.argsort(step_keys[indexes], kind="stable")
+            indexes = indexes[order]
+            keys = step_keys[indexes]
+            (unique_keys, key_starts) = np.unique(keys, return_index=True)
+            key_ends = np.append(key_starts[1:], len(keys))
+            values = records["value"][indexes]
+            yield { int(key): (indexes[s:e] + start, values[s:e]) for (key, s, e) in zip(unique_keys, key_starts, key_ends) }
+
+class PendingValues():
+    """Values of one key not yet compared with the other trace, kept in the slices of the chunks they were read from"""
+    def __init__(self):
+        self.segments: collections.deque[tuple[np.ndarray, np.ndarray]] = collections.deque()
+        self.length = 0
+        self.compared = 0
+
+    def append(self, steps: np.ndarray, values: np.ndarray):
+        if len(values) > 0:
+            self.segments.append((steps, values))
+            self.length += len(values)
+
+    def take(self, count: int) -> tuple[np.ndarray, np.ndarray]:
+        """Removes the first count values, only those are concatenated"""
+        (steps, values) = ([], [])
+        self.length -= count
+        while count > 0:
+            (segment_steps, segment_values) = self.segments.popleft()
+            if len(segment_values) > count:
+                self.segments.appendleft((segment_steps[count:], segment_values[count:]))
+                (segment_steps, segment_values) = (segment_steps[0:count], segment_values[0:count])
+            steps.append(segment_steps)
+            values.append(segment_values)
+            count -= len(segment_values)
+        return (np.concatenate(steps) if steps else np.empty(0, dtype=np.int64), np.concatenate(values) if values else np.empty(0, dtype=np.float64))
+
+    def first(self) -> tuple[int, float]:
+        (steps, values) = self.segments[0]
+        return (int(steps[0]), float(values[0]))
+
+def get_missing_divergence(key: str, index: int, side: int, step: int, value: float) -> Divergence:
+    """Returns the divergence of a value only the trace of side (0 for the trace, 1 for the reference) has"""
+    return Divergence(key, index, step if side == 0 else None, step if side == 1 else None, value if side == 0 else None, value if side == 1 else None)
+
+def compare_pending(key: str, pending: PendingValues, reference_pending: PendingValues, is_complete: tuple[bool, bool]) -> tuple[Divergence|None, int]:
+    """Compares the values both traces have for a key, keeping the rest for later chunks.
+    Once a trace is complete, values only the other one has are a divergence too.
+    """
+    count = min(pending.length, reference_pending.length)
+    (steps, a) = pending.take(count)
+    (reference_steps, b) = reference_pending.take(count)
+    differing = np.nonzero((a != b) & ~(np.isnan(a) & np.isnan(b)))[0]
+    if len(differing) > 0:
+        i = int(differing[0])
+        return (Divergence(key, pending.compared + i, int(steps[i]), int(reference_steps[i]), float(a[i]), float(b[i])), i)
+
+    index = pending.compared + count
+    pending.compared = reference_pending.compared = index
+    if is_complete[1] and pending.length > 0:
+        return (get_missing_divergence(key, index, 0, *pending.first()), count)
+    if is_complete[0] and reference_pending.length > 0:
+        return (get_missing_divergence(key, index, 1, *reference_pending.first()), count)
+    return (None, count)
+
+def read_blocks(path: str, block_size: int):
+    """Yields the blocks of a file, nothing if it does not exist"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            yield block
+
+def diff_outputs(trace: Trace, reference: Trace, block_size: int) -> Divergence|None:
+    """Returns where stdout of two traces first differs, compared block by block"""
+    offset = 0
+    blocks = itertools.zip_longest(read_blocks(trace.path + ".stdout", block_size), read_blocks(reference.path + ".stdout", block_size), fillvalue=b"")
+    for (block, reference_block) in blocks:
+        length = min(len(block), len(reference_block))
+        a = np.frombuffer(block, dtype=np.uint8, count=length)
+        b = np.frombuffer(reference_block, dtype=np.uint8, count=length)
+        differing = np.nonzero(a != b)[0]
+        if len(differing) > 0 or len(block) != len(reference_block):
+            position = int(differing[0]) if len(differing) > 0 else length
+            return Divergence("stdout", offset + position,
+                get_output_step(trace, offset + position), get_output_step(reference, offset + position),
+                float(block[position]) if position < len(block) else None, float(reference_block[position]) if position < len(reference_block) else None)
+        offset += length
+    return None
+
+def get_output_step(trace: Trace, offset: int) -> int|None:
+    """Returns the step writing the byte at an offset of stdout, None past its end"""
+    (steps, ends) = trace.get_output_steps()
+    position = int(np.searchsorted(ends, offset, side="right"))
+    return int(steps[position]) if position < len(steps) else None
+
+def diff_traces(trace: Trace, reference: Trace, match_lines: bool = False, chunk_size: int = CHUNK_SIZE) -> TraceDiff:
+    """Compares the values each identifier takes in a trace with those in a reference trace, and their stdout.
+    Both traces are read chunk by chunk, in step, so only values one trace is ahead by are held in memory, until it ends.
+    With match_lines, assignments are only compared with assignments on the same line.
+    """
+    keys: dict[str, int] = {}
+    streams = [KeyedValueStream(trace, keys, match_lines, chunk_size), KeyedValueStream(reference, keys, match_lines, chunk_size)]
+    key_names = {index: key for (key, index) in keys.items()}
+    # Keys only one trace has, f.e. of a renamed variable, diverge at their first value, they are never held in memory
+    one_sided_keys = streams[0].keys ^ streams[1].keys
+    chunk_iterators = [iter(s) for s in streams]
+    is_complete = [False, False]
+    pending: dict[int, tuple[PendingValues, PendingValues]] = {}
+    diverged: dict[int, Divergence] = {}
+    compared_values = 0
+
+    while not all(is_complete):
+        for (side, chunk_iterator) in enumerate(chunk_iterators):
+            chunk = next(chunk_iterator, None) if not is_complete[side] else None
+            if chunk is None:
+                is_complete[side] = True
+                continue
+            for (key, (steps, values)) in chunk.items():
+                if key in diverged:
+                    continue
+                if key in one_sided_keys:
+                    diverged[key] = get_missing_divergence(key_names[key], 0, side, int(steps[0]), float(values[0]))
+                    continue
+                pending.setdefault(key, (PendingValues(), PendingValues()))[side].append(steps, values)
+        for (key, (values, reference_values)) in list(pending.items()):
+            (divergence, count) = compare_pending(key_names[key], values, reference_values, (is_complete[0], is_complete[1]))
+            compared_values += count
+            if divergence is not None:
+                diverged[key] = divergence
+                del pending[key]
+    return TraceDiff(list(diverged.values()), diff_outputs(trace, reference, chunk_size), compared_values)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares a binary trace with the trace of a reference solution")
+    parser.add_argument("trace")
+    parser.add_argument("metadata")
+    parser.add_argument("reference_trace")
+    parser.add_argument("reference_metadata")
+    parser.add_argument("--match-lines", action="store_true", help="only compare assignments on the same line, for runs of the same program")
+    args = parser.parse_args()
+
+    diff = diff_traces(Trace.open(args.trace, args.metadata), Trace.open(args.reference_trace, args.reference_metadata), args.match_lines)
+    print(json.dumps(diff.to_dict(), indent=2))
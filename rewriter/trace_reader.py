@@ -0,0 +1,142 @@
+import os
+import numpy as np
+from source_visitors import NotifyMetadataSerializer
+
+TRACE_MAGIC = b"CSTRACE1"
+HEADER_SIZE = 16
+STDOUT_ID = 0xFFFFFFFF
+STDERR_ID = 0xFFFFFFFE
+AGGREGATE_FLAG = 0x80000000
+
+# One record per step, see wrapper/trace-writer.js
+RECORD_DTYPE = np.dtype([("id", "<u4"), ("address", "<u4"), ("value", "<f8")])
+
+# Records processed at once, bounds the size of temporary arrays of queries on large traces
+CHUNK_SIZE = 1 << 22
+
+class TraceMetadata():
+    """Notification metadata as arrays indexed by notification id, absent values are -1"""
+    def __init__(self, code: str, strings: list[str], columns: dict):
+        self.code = code
+        self.strings = strings
+        self.actions = np.array(columns["actions"], dtype=np.int32)
+        self.types = np.array(columns["types"], dtype=np.int32)
+        self.identifiers = np.array(columns["identifiers"], dtype=np.int32)
+        self.locations = np.array(columns["locations"], dtype=np.int32).reshape(-1, 4)
+        self.derived_from = np.array(columns["derived_from"], dtype=np.int32)
+
+    @staticmethod
+    def read(path: str) -> "TraceMetadata":
+        with open(path, "rb") as f:
+            return TraceMetadata(*NotifyMetadataSerializer().deserialize_columns(f.read()))
+
+    def get_action(self, action: str) -> int:
+        return NotifyMetadataSerializer.actions.index(action)
+
+    def get_string(self, value: str) -> int:
+        """Returns the index of a type or identifier, -1 if no notification uses it"""
+        return self.strings.index(value) if value in self.strings else -1
+
+class Trace():
+    """Binary trace written by the batch runner, memory-mapped and joined with the notification metadata of its program.
+    Step indexes are record indexes. Queries run over chunks of records, so traces larger than memory can be queried.
+    """
+    def __init__(self, path: str, metadata: TraceMetadata):
+        self.path = path
+        self.metadata = metadata
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[0:8] != TRACE_MAGIC:
+            raise Exception("Not a binary trace")
+        record_size = int.from_bytes(header[8:12], "little")
+        if record_size != RECORD_DTYPE.itemsize:
+            raise Exception(f"Unsupported trace record size {record_size}")
+        # memmap cannot map empty files
+        if os.path.getsize(path) > HEADER_SIZE:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE)
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    @staticmethod
+    def open(path: str, metadata_path: str) -> "Trace":
+        return Trace(path, TraceMetadata.read(metadata_path))
+
+    def __len__(self):
+        return len(self.records)
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE):
+        """Yields the index of the first step and the records of consecutive chunks"""
+        for start in range(0, len(self.records), chunk_size):
+            yield (start, self.records[start:start + chunk_size])
+
+    def get_notification_ids(self, records: np.ndarray) -> np.ndarray:
+        """Returns notification ids of records, -1 for output steps"""
+        ids = records["id"]
+        return np.where(ids < STDERR_ID, (ids & np.uint32(~AGGREGATE_FLAG & 0xFFFFFFFF)).astype(np.int64), -1)
+
+    def get_identifier_values(self, identifier: str, actions: tuple[str, ...] = ("decl", "assign")) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the steps declaring or assigning an identifier and the values they hold"""
+        identifier_index = self.metadata.get_string(identifier)
+        is_matching_notification = np.isin(self.metadata.actions, [self.metadata.get_action(a) for a in actions]) & (self.metadata.identifiers == identifier_index)
+        return self.select(is_matching_notification)
+
+    def get_line_hits(self, action: str = "eval") -> tuple[np.ndarray, np.ndarray]:
+        """Returns the lines notifications of an action start on, in ascending order, and the number of steps per line"""
+        lines = np.where(self.metadata.actions == self.metadata.get_action(action), self.metadata.locations[:, 0], -1)
+        counts = np.zeros(max(int(lines.max(initial=-1)) + 1, 0), dtype=np.int64)
+        for (_, records) in self.chunks():
+            step_lines = self.lookup(lines, records)
+            counts += np.bincount(step_lines[step_lines >= 0], minlength=len(counts))
+        hit_lines = np.nonzero(counts)[0]
+        return (hit_lines, counts[hit_lines])
+
+    def get_value_range(self, identifier: str) -> tuple[float, float]|None:
+        """Returns the smallest and largest value of an identifier, None if it never held one"""
+        (_, values) = self.get_identifier_values(identifier)
+        return (float(values.min()), float(values.max())) if len(values) > 0 else None
+
+    def get_output(self, stream: str = "stdout") -> bytes:
+        """Returns the output of a stream, output steps hold the byte offset their output ends at"""
+        path = f"{self.path}.{stream}"
+        if not os.path.exists(path):
+            return b""
+        with open(path, "rb") as f:
+            return f.read()
+
+    def get_output_steps(self, stream: str = "stdout") -> tuple[np.ndarray, np.ndarray]:
+        """Returns output steps of a stream and the byte offsets their output ends at"""
+        stream_id = STDOUT_ID if stream == "stdout" else STDERR_ID
+        steps = []
+        ends = []
+        for (start, records) in self.chunks():
+            indexes = np.nonzero(records["id"] == stream_id)[0]
+            steps.append(indexes + start)
+            ends.append(records["value"][indexes].astype(np.int64))
+        return (np.concatenate(steps or [np.empty(0, dtype=np.int64)]), np.concatenate(ends or [np.empty(0, dtype=np.int64)]))
+
+    def get_aggregate(self, step: int) -> bytes:
+        """Returns the bytes captured by an array or struct step"""
+        record = self.records[step]
+        if record["id"] >= STDERR_ID or not record["id"] & AGGREGATE_FLAG:
+            raise Exception(f"Step {step} is not an aggregate")
+        offset = int(record["value"])
+        with open(self.path + ".data", "rb") as f:
+            f.seek(offset - 4)
+            length = int.from_bytes(f.read(4), "little")
+            return f.read(length)
+
+    def lookup(self, column: np.ndarray, records: np.ndarray) -> np.ndarray:
+        """Returns a metadata column per step, -1 for output steps"""
+        notification_ids = self.get_notification_ids(records)
+        return np.where(notification_ids >= 0, column[np.maximum(notification_ids, 0)], -1)
+
+    def select(self, is_matching_notification: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the steps of notifications a mask over notification ids selects and their values"""
+        steps = []
+        values = []
+        for (start, records) in self.chunks():
+            is_matching = self.lookup(is_matching_notification.astype(np.int8), records) == 1
+            indexes = np.nonzero(is_matching)[0]
+            steps.append(indexes + start)
+            values.append(records["value"][indexes])
+        return (np.concatenate(steps or [np.empty(0, dtype=np.int64)]), np.concatenate(values or [np.empty(0, dtype=np.float64)]))
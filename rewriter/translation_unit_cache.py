@@ -0,0 +1,118 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import clang.cindex
+from ctypes import c_uint
+
+# Leading lines of a source file which can be moved into a precompiled header without changing its meaning
+header_pattern = re.compile(r"\s*#\s*include\s*<[^<>]+>\s*")
+skipped_line_pattern = re.compile(r"\s*(//.*)?")
+
+def is_main_file_cursor(cursor) -> bool:
+    """Checks whether a cursor is located in the main file, without resolving its file name"""
+    is_from_main_file = clang.cindex.conf.lib.clang_Location_isFromMainFile
+    if is_from_main_file.argtypes is None:
+        is_from_main_file.argtypes = [clang.cindex.SourceLocation]
+        is_from_main_file.restype = c_uint
+    return is_from_main_file(cursor.location) != 0
+
+def get_clang_version() -> str:
+    get_version = clang.cindex.conf.lib.clang_getClangVersion
+    get_version.restype = clang.cindex._CXString
+    return clang.cindex._CXString.from_result(get_version())
+
+def get_leading_headers(source_content) -> list[str]:
+    """Returns the standard include lines a source file starts with"""
+    headers = []
+    for line in source_content.split("\n"):
+        if header_pattern.fullmatch(line):
+            headers.append(line.strip())
+        elif not skipped_line_pattern.fullmatch(line):
+            break
+    return headers
+
+def write_header_source(path, headers: list[str]):
+    """Writes the source of a precompiled header unless it exists
+
+    Its content only depends on its name, so it is never rewritten: clang rejects headers precompiled from a source
+    whose modification time or size changed, f.e. while a parallel rewrite parses with them.
+    """
+    if os.path.exists(path):
+        return
+    (file_descriptor, temp_path) = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".h")
+    try:
+        with os.fdopen(file_descriptor, "w") as f:
+            f.write("\n".join(headers) + "\n")
+        os.replace(temp_path, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+
+class TranslationUnitCache:
+    """Parses source files, precompiling the standard headers they start with once per clang version and flags
+
+    Precompiled headers are stored in cache_directory and shared between processes. Translation units are kept per
+    process, so parsing the same unchanged file again (e.g. in each partition of a worker) returns the parsed unit.
+    """
+    def __init__(self, cache_directory = None, args: list[str]|None = None) -> None:
+        self.cache_directory = cache_directory if cache_directory is not None else os.path.join(tempfile.gettempdir(), "c-simulator-pch")
+        self.args = args if args is not None else []
+        self.index = clang.cindex.Index.create()
+        self.translation_units = dict()
+
+    def parse(self, source_path, source_content):
+        key = (source_path, source_content)
+        if key not in self.translation_units:
+            self.translation_units = { key: self.parse_with_header(source_path, self.get_precompiled_header(source_content)) }
+        return self.translation_units[key]
+
+    def parse_with_header(self, source_path, header_path):
+        if header_path is None:
+            return self.index.parse(source_path, args=self.args)
+
+        try:
+            tu = self.index.parse(source_path, args=self.args + ["-include-pch", header_path])
+        except clang.cindex.TranslationUnitLoadError:
+            # Removed by a parallel rewrite since it was found
+            return self.index.parse(source_path, args=self.args)
+        if all(d.severity < clang.cindex.Diagnostic.Fatal for d in tu.diagnostics):
+            return tu
+
+        # Headers changed since they were precompiled, a parallel rewrite may have removed it already
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(header_path)
+        return self.index.parse(source_path, args=self.args)
+
+    def get_precompiled_header(self, source_content) -> str|None:
+        """Returns path of the precompiled header for the leading includes of source content, building it when missing"""
+        headers = get_leading_headers(source_content)
+        if len(headers) == 0:
+            return None
+
+        key = json.dumps([get_clang_version(), self.args, headers])
+        header_name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        header_path = os.path.join(self.cache_directory, header_name + ".pch")
+        if os.path.exists(header_path):
+            return header_path
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        (file_descriptor, temp_path) = tempfile.mkstemp(dir=self.cache_directory)
+        os.close(file_descriptor)
+        try:
+            # Precompiled headers refer to their source, so it is kept next to them
+            header_source_path = os.path.join(self.cache_directory, header_name + ".h")
+            write_header_source(header_source_path, headers)
+            # Diagnostics of the headers are kept, the source file would report them without a precompiled header as well
+            tu = self.index.parse(header_source_path, args=self.args + ["-x", "c-header"], options=clang.cindex.TranslationUnit.PARSE_INCOMPLETE)
+            tu.save(temp_path)
+            # Replaced atomically, so parallel rewrites never read a partially written header
+            os.replace(temp_path, header_path)
+            return header_path
+        except clang.cindex.TranslationUnitSaveError:
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
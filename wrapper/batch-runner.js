@@ -0,0 +1,182 @@
+/**
+ * Runs many instrumented programs headless under Node, writing a trace file per run (see trace-writer.js).
+ * Runs are spread over a pool of worker_threads workers, each limited in time and memory.
+ *
+ * Usage: node wrapper/batch-runner.js [--format ndjson|binary] [--workers n] [--timeout ms] [--max-memory mb]
+ *                                     [--max-steps n] [--stdin file] [--out directory] [--coverage file] output.js...
+ * Traces are written next to each output.js, or numbered in --out. One result per line is printed as JSON.
+ * --coverage writes the statement counts of coverage builds, merged over all runs (see coverage.js).
+ */
+import { Worker } from 'worker_threads'
+import { availableParallelism } from 'os'
+import { readFileSync, mkdirSync, writeFileSync } from 'fs'
+import { basename, dirname, join, resolve as resolvePath } from 'path'
+import { fileURLToPath } from 'url'
+import { parseArgs } from 'util'
+import { mergeCoverage } from './coverage.js'
+
+const DEFAULT_TIMEOUT = 10000;
+const DEFAULT_MAX_MEMORY = 256;
+const DEFAULT_MAX_STEPS = 10000000;
+const TRACE_EXTENSIONS = { ndjson: ".ndjson", binary: ".trace" };
+
+/**
+ * @typedef BatchJob
+ * @property {string} moduleUrl path of the Emscripten output
+ * @property {string} tracePath
+ * @property {string|Uint8Array} [stdin]
+ */
+
+/**
+ * @typedef BatchResult
+ * @property {BatchJob} job
+ * @property {"done"|"error"|"timeout"|"memory"} status
+ * @property {number} [exitCode]
+ * @property {number} [stepCount] steps written, traces of failed runs hold the steps up to the failure
+ * @property {string} [error]
+ * @property {{ counters: number[], lines: Object<number, number> }} [coverage] statement counts of coverage builds
+ * @property {number} duration milliseconds
+ */
+
+/**
+ * Returns where the trace of an Emscripten output is written, next to it or numbered in a directory
+ * @param {string} moduleUrl
+ * @param {"ndjson"|"binary"} format
+ * @param {string} [directory]
+ * @param {number} [index]
+ */
+export function getTracePath(moduleUrl, format, directory, index) {
+    const extension = TRACE_EXTENSIONS[format];
+    if (directory !== undefined) return join(directory, `${index}${extension}`);
+    return join(dirname(moduleUrl), basename(moduleUrl, ".js") + extension);
+}
+
+function createWorker(maxMemory) {
+    const worker = new Worker(new URL("./trace-worker.js", import.meta.url), {
+        resourceLimits: { maxOldGenerationSizeMb: maxMemory },
+        stdout: true,
+        stderr: true
+    });
+    // Console output of programs is discarded, so it does not mix with the results
+    worker.stdout.resume();
+    worker.stderr.resume();
+    return worker;
+}
+
+/**
+ * Runs one job on a worker, settling with its result. Workers which did not report a result are terminated.
+ * @returns {Promise<{ result: BatchResult, isWorkerUsable: boolean }>}
+ */
+function runJob(worker, job, options) {
+    const start = Date.now();
+    return new Promise(resolve => {
+        const finish = (result, isWorkerUsable) => {
+            clearTimeout(watchdog);
+            worker.removeAllListeners("message");
+            worker.removeAllListeners("error");
+            worker.removeAllListeners("exit");
+            if (!isWorkerUsable) worker.terminate();
+            resolve({ result: { job, ...result, duration: Date.now() - start }, isWorkerUsable });
+        };
+        const watchdog = setTimeout(() => finish({ status: "timeout", error: `Program did not finish within ${options.timeout} ms` }, false), options.timeout);
+
+        worker.on("message", message => {
+            const counts = { stepCount: message.stepCount, coverage: message.coverage };
+            if (message.type === "done") finish({ status: "done", exitCode: message.exitCode, ...counts }, true);
+            else finish({ status: message.message.startsWith("Memory limit") ? "memory" : "error", error: message.message, ...counts }, true);
+        });
+        worker.on("error", e => finish({ status: e.code === "ERR_WORKER_OUT_OF_MEMORY" ? "memory" : "error", error: e.message }, false));
+        worker.on("exit", code => finish({ status: "error", error: `Worker exited with code ${code}` }, false));
+
+        const stdin = typeof job.stdin === "string" ? new TextEncoder().encode(job.stdin) : job.stdin;
+        worker.postMessage({
+            type: "run",
+            moduleUrl: resolvePath(job.moduleUrl),
+            tracePath: job.tracePath,
+            format: options.format,
+            stdin,
+            maxSteps: options.maxSteps,
+            maxMemory: options.maxMemory * 1024 * 1024
+        });
+    });
+}
+
+/**
+ * Runs jobs on a pool of workers, reusing workers between runs unless a run had to be terminated
+ * @param {BatchJob[]} jobs
+ * @param {{ format?: "ndjson"|"binary", workers?: number, timeout?: number, maxMemory?: number, maxSteps?: number, onResult?: function(BatchResult): void }} options
+ * timeout is the wall-clock limit per run in milliseconds, maxMemory the limit of the heap and of linear memory in MB
+ * @returns {Promise<BatchResult[]>} results in the order of jobs
+ */
+export async function runBatch(jobs, options = {}) {
+    const runOptions = {
+        format: options.format ?? "binary",
+        timeout: options.timeout ?? DEFAULT_TIMEOUT,
+        maxMemory: options.maxMemory ?? DEFAULT_MAX_MEMORY,
+        maxSteps: options.maxSteps ?? DEFAULT_MAX_STEPS
+    };
+    const results = new Array(jobs.length);
+    let nextJob = 0;
+
+    const runWorker = async () => {
+        let worker;
+        while (nextJob < jobs.length) {
+            const index = nextJob++;
+            worker ??= createWorker(runOptions.maxMemory);
+            const { result, isWorkerUsable } = await runJob(worker, jobs[index], runOptions);
+            if (!isWorkerUsable) worker = undefined;
+            results[index] = result;
+            options.onResult?.(result);
+        }
+        await worker?.terminate();
+    };
+    const workerCount = Math.min(options.workers ?? availableParallelism(), jobs.length);
+    await Promise.all(Array.from({ length: workerCount }, runWorker));
+    return results;
+}
+
+async function main(args) {
+    const { values, positionals } = parseArgs({
+        args,
+        allowPositionals: true,
+        options: {
+            "format": { type: "string", default: "binary" },
+            "workers": { type: "string" },
+            "timeout": { type: "string" },
+            "max-memory": { type: "string" },
+            "max-steps": { type: "string" },
+            "stdin": { type: "string" },
+            "out": { type: "string" },
+            "coverage": { type: "string" }
+        }
+    });
+    if (TRACE_EXTENSIONS[values.format] === undefined) throw new Error(`Unknown trace format ${values.format}`);
+    if (values.out !== undefined) mkdirSync(values.out, { recursive: true });
+
+    const stdin = values.stdin !== undefined ? readFileSync(values.stdin) : undefined;
+    const jobs = positionals.map((moduleUrl, index) => ({ moduleUrl, tracePath: getTracePath(moduleUrl, values.format, values.out, index), stdin }));
+    const toNumber = value => value !== undefined ? Number(value) : undefined;
+    const results = await runBatch(jobs, {
+        format: values.format,
+        workers: toNumber(values.workers),
+        timeout: toNumber(values.timeout),
+        maxMemory: toNumber(values["max-memory"]),
+        maxSteps: toNumber(values["max-steps"]),
+        onResult: result => {
+            const { job, coverage, ...summary } = result;
+            console.log(JSON.stringify({ module: job.moduleUrl, trace: job.tracePath, ...summary }));
+        }
+    });
+    if (values.coverage !== undefined) {
+        const coverage = mergeCoverage(results.map(r => r.coverage).filter(c => c !== undefined));
+        writeFileSync(values.coverage, JSON.stringify(coverage));
+    }
+    process.exitCode = results.every(r => r.status === "done") ? 0 : 1;
+}
+
+if (process.argv[1] !== undefined && resolvePath(process.argv[1]) === fileURLToPath(import.meta.url)) {
+    main(process.argv.slice(2)).catch(e => {
+        console.error(e.message);
+        process.exitCode = 2;
+    });
+}
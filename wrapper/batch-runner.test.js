@@ -0,0 +1,63 @@
+import assert from 'assert';
+import { mkdtempSync, readFileSync } from 'fs';
+import { tmpdir } from 'os';
+import { join } from 'path';
+import { fileURLToPath } from 'url';
+import { runBatch, getTracePath } from './batch-runner.js';
+import { HEADER_SIZE, RECORD_SIZE, STDOUT_ID } from './trace-writer.js';
+
+const countingModulePath = fileURLToPath(new URL('./fixtures/counting-module.js', import.meta.url));
+const printingModulePath = fileURLToPath(new URL('./fixtures/printing-module.js', import.meta.url));
+const endlessModulePath = fileURLToPath(new URL('./fixtures/endless-module.js', import.meta.url));
+const coverageModulePath = fileURLToPath(new URL('./fixtures/coverage-module.js', import.meta.url));
+
+describe('runBatch', function() {
+  it('writes NDJSON traces with derived steps and output', async function() {
+    const directory = mkdtempSync(join(tmpdir(), 'traces-'));
+    const jobs = [countingModulePath, printingModulePath].map((moduleUrl, i) => ({ moduleUrl, tracePath: getTracePath(moduleUrl, "ndjson", directory, i) }));
+
+    const results = await runBatch(jobs, { format: "ndjson", workers: 2 });
+
+    assert.deepEqual(results.map(r => [r.status, r.stepCount]), [["done", 50], ["done", 10]]);
+    const countingSteps = readFileSync(jobs[0].tracePath, "utf8").trim().split("\n").map(line => JSON.parse(line));
+    assert.deepEqual(countingSteps.slice(0, 2).map(s => [s.id, s.dataValue]), [[0, 0], [1, 0]]);
+    const printingSteps = readFileSync(jobs[1].tracePath, "utf8").trim().split("\n").map(line => JSON.parse(line));
+    assert.deepEqual(printingSteps.filter(s => s.action === "stdout").map(s => s.text), ["0 ", "1 ", "2 ", "3 ", "4 "]);
+  });
+  it('writes binary traces with fixed-size records', async function() {
+    const directory = mkdtempSync(join(tmpdir(), 'traces-'));
+    const tracePath = join(directory, "printing.trace");
+
+    const [result] = await runBatch([{ moduleUrl: printingModulePath, tracePath }]);
+
+    const trace = readFileSync(tracePath);
+    assert.equal(result.status, "done");
+    assert.equal(trace.subarray(0, 8).toString(), "CSTRACE1");
+    assert.equal(trace.length, HEADER_SIZE + 10 * RECORD_SIZE);
+    const view = new DataView(trace.buffer, trace.byteOffset + HEADER_SIZE);
+    assert.deepEqual([view.getUint32(RECORD_SIZE, true), view.getFloat64(RECORD_SIZE + 8, true)], [STDOUT_ID, 2]);
+    assert.equal(readFileSync(tracePath + ".stdout", "utf8"), "0 1 2 3 4 ");
+  });
+  it('enforces time and step limits per run and keeps running the batch', async function() {
+    const directory = mkdtempSync(join(tmpdir(), 'traces-'));
+    const jobs = [endlessModulePath, countingModulePath, countingModulePath].map((moduleUrl, i) => ({ moduleUrl, tracePath: getTracePath(moduleUrl, "binary", directory, i) }));
+
+    const results = await runBatch(jobs, { workers: 1, timeout: 500, maxSteps: 10 });
+
+    assert.deepEqual(results.map(r => r.status), ["timeout", "error", "error"]);
+    assert.equal(results[1].error, "Too many steps (possible infinite loop)");
+    assert.equal(results[1].stepCount, 20);
+  });
+  it('reports statement counts of coverage builds', async function() {
+    const directory = mkdtempSync(join(tmpdir(), 'traces-'));
+    const jobs = ["12", "345"].map((stdin, i) => ({ moduleUrl: coverageModulePath, tracePath: getTracePath(coverageModulePath, "binary", directory, i), stdin }));
+
+    const results = await runBatch(jobs, { workers: 1 });
+
+    assert.deepEqual(results.map(r => r.coverage), [
+      { counters: [1, 3, 2], lines: { 2: 4, 3: 2 } },
+      { counters: [1, 4, 3], lines: { 2: 5, 3: 3 } }
+    ]);
+    assert.equal(results[0].stepCount, 0);
+  });
+});
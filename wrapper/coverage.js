@@ -0,0 +1,58 @@
+/**
+ * Statement counts of coverage builds (see rewrite.py --coverage). Counters are 64-bit integers in linear memory,
+ * indexed by the id of the stat notification of their statement, so the metadata of the build maps them to lines.
+ */
+
+/**
+ * Returns the counters of a coverage build, undefined for tracing builds
+ * @param {object} module
+ * @returns {number[]|undefined}
+ */
+export function readCounters(module) {
+    const registration = module.simulatorCounters;
+    if (registration === undefined) return undefined;
+
+    const words = new Uint32Array(module.HEAPU8.buffer, registration.address, 2 * registration.count);
+    const counters = new Array(registration.count);
+    for (let i = 0; i < registration.count; i++) counters[i] = words[2 * i] + words[2 * i + 1] * 0x100000000;
+    return counters;
+}
+
+/**
+ * Returns executions per line, summed over the statements starting on it
+ * @param {number[]} counters
+ * @param {function(number): object} getNotification
+ * @returns {Object<number, number>}
+ */
+export function getLineHits(counters, getNotification) {
+    const lines = {};
+    counters.forEach((count, id) => {
+        const line = getNotification(id)?.location?.[0];
+        if (line !== undefined) lines[line] = (lines[line] ?? 0) + count;
+    });
+    return lines;
+}
+
+/**
+ * Returns the counters and line hits of a run, undefined for tracing builds
+ * @param {object} module
+ * @returns {{ counters: number[], lines: Object<number, number> }|undefined}
+ */
+export function getCoverage(module) {
+    const counters = readCounters(module);
+    if (counters === undefined) return undefined;
+    return { counters, lines: getLineHits(counters, id => module.getSimulatorNotification?.(id)) };
+}
+
+/**
+ * Sums the coverage of runs of the same build
+ * @param {{ counters: number[], lines: Object<number, number> }[]} coverages
+ */
+export function mergeCoverage(coverages) {
+    const merged = { counters: [], lines: {} };
+    for (const coverage of coverages) {
+        coverage.counters.forEach((count, id) => merged.counters[id] = (merged.counters[id] ?? 0) + count);
+        for (const [line, count] of Object.entries(coverage.lines)) merged.lines[line] = (merged.lines[line] ?? 0) + count;
+    }
+    return merged;
+}
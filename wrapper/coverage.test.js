@@ -0,0 +1,22 @@
+import assert from 'assert';
+import { readCounters, getLineHits, mergeCoverage } from './coverage.js';
+
+describe('coverage', function() {
+  it('reads 64-bit counters from memory', function() {
+    const module = { HEAPU8: new Uint8Array(32), simulatorCounters: { address: 8, count: 2 } };
+    const words = new Uint32Array(module.HEAPU8.buffer);
+    words[2] = 3;
+    words[4] = 1;
+    words[5] = 1;
+
+    assert.deepEqual(readCounters(module), [3, 0x100000001]);
+    assert.equal(readCounters({}), undefined);
+  });
+  it('sums counters per line and over runs', function() {
+    const notifications = [{ location: [2, 1, 2, 5] }, { location: [2, 7, 2, 9] }, { location: [4, 1, 4, 3] }];
+    const lines = getLineHits([1, 5, 2], id => notifications[id]);
+
+    assert.deepEqual(lines, { 2: 6, 4: 2 });
+    assert.deepEqual(mergeCoverage([{ counters: [1, 5, 2], lines }, { counters: [1, 0, 0], lines: { 2: 1 } }]), { counters: [2, 5, 2], lines: { 2: 7, 4: 2 } });
+  });
+});
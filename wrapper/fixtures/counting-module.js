@@ -0,0 +1,20 @@
+// Stands in for Emscripten output in tests: counts to 25, notifying every value
+var Module = typeof Module != 'undefined' ? Module : {};
+Module.simulatorCode = "int main() {\n    for (int i = 0; i < 25; i++);\n}";
+Module.getSimulatorNotification = function(id) {
+    return [{ action: "eval", dataType: "int" }, { action: "eval", dataType: "int", derivedFrom: 0 }][id];
+};
+Module._main = function() {
+    Module.simulatorSteps = Module.simulatorSteps || [];
+    for (var i = 0; i < 25; i++) {
+        // Same limit as library.js
+        if (Module.simulatorSteps.length >= (Module.simulatorMaxSteps || 10000)) 
+            throw new Error("Too many steps (possible infinite loop)");
+        Module.simulatorSteps.push({ action: "eval", dataType: "int", id: 0, dataValue: i });
+    }
+    return 0;
+};
+setTimeout(function() {
+    Module.onRuntimeInitialized();
+    if (!Module.noInitialRun) Module._main();
+});
@@ -0,0 +1,17 @@
+// Stands in for a coverage build in tests: counts the statements of a loop over the digits on stdin
+var Module = typeof Module != 'undefined' ? Module : {};
+Module.simulatorCode = "int main() {\n    for (int c; (c = getchar()) != EOF;)\n        putchar(c);\n}";
+Module.getSimulatorNotification = function(id) {
+    return [{ action: "stat", location: [2, 10, 2, 20] }, { action: "stat", location: [2, 21, 2, 40] }, { action: "stat", location: [3, 9, 3, 19] }][id];
+};
+var HEAPU8 = Module.HEAPU8 = new Uint8Array(64);
+var counters = new Uint32Array(HEAPU8.buffer, 8, 6);
+Module.simulatorCounters = { address: 8, count: 3 };
+Module._main = function() {
+    counters[0]++;
+    for (var c; counters[2]++, (c = Module.stdin ? Module.stdin() : null) !== null;) counters[4]++;
+    return 0;
+};
+setTimeout(function() {
+    Module.onRuntimeInitialized();
+});
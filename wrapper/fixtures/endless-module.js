@@ -0,0 +1,9 @@
+// Stands in for Emscripten output in tests: never returns from main
+var Module = typeof Module != 'undefined' ? Module : {};
+Module.simulatorCode = "int main() {\n    while (1);\n}";
+Module._main = function() {
+    while (true);
+};
+setTimeout(function() {
+    Module.onRuntimeInitialized();
+});
@@ -0,0 +1,22 @@
+// Stands in for Emscripten output in tests: instantiates its wasm through instantiateWasm and sums the digits on stdin into memory
+var Module = typeof Module != 'undefined' ? Module : {};
+Module.simulatorCode = "int sum;\nint main() {\n    for (int c; (c = getchar()) != EOF;) sum += c - '0';\n    return sum;\n}";
+globalThis.pooledModuleInstances = (globalThis.pooledModuleInstances || 0) + 1;
+var HEAPU8 = Module.HEAPU8 = new Uint8Array(64);
+var stackPointer = 64;
+Module.stackSave = function() { return stackPointer; };
+Module.stackRestore = function(value) { stackPointer = value; };
+Module._main = function() {
+    if (stackPointer !== 64 || HEAPU8[0] !== 0) throw new Error("stale state");
+    stackPointer -= 16;
+    for (var c; (c = Module.stdin()) !== null;) {
+        HEAPU8[0] += c - 48;
+        Module.simulatorSteps.push({ action: "assign", identifier: "sum", dataType: "int", dataValue: HEAPU8[0] });
+    }
+    if (HEAPU8[0] > 20) throw new Error("sum too large");
+    return HEAPU8[0];
+};
+Module.instantiateWasm({}, function(instance, module) {
+    Module.wasmModule = module;
+    Module.onRuntimeInitialized();
+});
@@ -0,0 +1,17 @@
+// Stands in for Emscripten output in tests: prints the numbers up to 5, writing output like output-capture.js
+var Module = typeof Module != 'undefined' ? Module : {};
+Module.simulatorCode = "int main() {\n    for (int i = 0; i < 5; i++) printf(\"%d \", i);\n}";
+Module.simulatorOutput = { stdout: "", stderr: "" };
+Module._main = function() {
+    Module.simulatorSteps = Module.simulatorSteps || [];
+    for (var i = 0; i < 5; i++) {
+        Module.simulatorSteps.push({ action: "eval", dataType: "int", dataValue: i });
+        Module.simulatorOutput.stdout += i + " ";
+        Module.simulatorSteps.push({ action: "stdout", end: Module.simulatorOutput.stdout.length });
+    }
+    return 0;
+};
+setTimeout(function() {
+    Module.onRuntimeInitialized();
+    if (!Module.noInitialRun) Module._main();
+});
@@ -1,3 +1,5 @@
 import Simulation from "./wrapper.js";
+import SimulationViewer from "./viewer.js";
 
-window.Simulation = Simulation;
\ No newline at end of file
+window.Simulation = Simulation;
+window.SimulationViewer = SimulationViewer;
\ No newline at end of file
@@ -0,0 +1,213 @@
+/**
+ * Checkpoints of wasm linear memory, storing only the pages changed since the previous checkpoint.
+ * Changed pages are stored as the XOR with their previous content, run-length encoded as
+ * repeated (number of unchanged bytes, number of changed bytes, changed bytes), with LEB128 counts.
+ */
+export const PAGE_SIZE = 65536;
+
+// Worst case of a delta, alternating single changed and unchanged bytes
+const MAX_DELTA_SIZE = 3 * PAGE_SIZE;
+
+function writeCount(buffer, offset, count) {
+    while (count >= 0x80) {
+        buffer[offset++] = (count & 0x7f) | 0x80;
+        count >>>= 7;
+    }
+    buffer[offset++] = count;
+    return offset;
+}
+
+function readCount(buffer, offset) {
+    let count = 0;
+    let shift = 0;
+    let byte;
+    do {
+        byte = buffer[offset++];
+        count |= (byte & 0x7f) << shift;
+        shift += 7;
+    } while (byte & 0x80);
+    return [count, offset];
+}
+
+/**
+ * Returns the run-length encoded XOR of two pages of the same size
+ * @param {Uint8Array} previous
+ * @param {Uint8Array} current
+ * @returns {Uint8Array}
+ */
+export function encodePageDelta(previous, current) {
+    const delta = new Uint8Array(MAX_DELTA_SIZE);
+    let offset = 0;
+    let i = 0;
+    while (i < current.length) {
+        const unchangedStart = i;
+        while (i < current.length && previous[i] === current[i]) i++;
+        const changedStart = i;
+        while (i < current.length && previous[i] !== current[i]) i++;
+
+        offset = writeCount(delta, offset, changedStart - unchangedStart);
+        offset = writeCount(delta, offset, i - changedStart);
+        for (let j = changedStart; j < i; j++) delta[offset++] = previous[j] ^ current[j];
+    }
+    return delta.slice(0, offset);
+}
+
+/**
+ * Applies a delta to a page in place, XOR makes this turn either of both pages into the other
+ * @param {Uint8Array} page
+ * @param {Uint8Array} delta
+ */
+export function applyPageDelta(page, delta) {
+    let offset = 0;
+    let i = 0;
+    while (offset < delta.length) {
+        let unchangedLength, changedLength;
+        [unchangedLength, offset] = readCount(delta, offset);
+        [changedLength, offset] = readCount(delta, offset);
+        i += unchangedLength;
+        for (let j = 0; j < changedLength; j++) page[i++] ^= delta[offset++];
+    }
+}
+
+// DataView setters of the C types notified by assignments, wasm32 is little endian with 32 bit pointers
+const VALUE_SETTERS = {
+    "char": "setInt8",
+    "signed char": "setInt8",
+    "unsigned char": "setUint8",
+    "short": "setInt16",
+    "unsigned short": "setUint16",
+    "int": "setInt32",
+    "long": "setInt32",
+    "unsigned int": "setUint32",
+    "unsigned long": "setUint32",
+    "float": "setFloat32",
+    "double": "setFloat64"
+};
+
+/**
+ * Writes the values of assignment steps from start up to end (exclusive) to memory at their address
+ * @param {Uint8Array} memory
+ * @param {SimulationStep[]} steps
+ */
+export function applyAssignments(memory, steps, start, end) {
+    const view = new DataView(memory.buffer, memory.byteOffset, memory.byteLength);
+    for (let i = start; i < end; i++) {
+        const step = steps[i];
+        if (step.action !== "assign" || step.address === undefined) continue;
+
+        // Arrays and structs are notified as a copy of their bytes (see notify_aggregate in library.js)
+        if (step.dataValue instanceof Uint8Array) {
+            memory.set(step.dataValue, step.address);
+            continue;
+        }
+        const setter = step.dataType?.endsWith("*") ? "setUint32" : VALUE_SETTERS[step.dataType];
+        if (setter !== undefined) view[setter](step.address, step.dataValue, true);
+    }
+    return memory;
+}
+
+function isPageEqual(previous, current, start, end) {
+    // Pages start at multiples of PAGE_SIZE, so they can be compared in words
+    const previousWords = new Uint32Array(previous.buffer, previous.byteOffset + start, (end - start) >>> 2);
+    const currentWords = new Uint32Array(current.buffer, current.byteOffset + start, (end - start) >>> 2);
+    for (let i = 0; i < currentWords.length; i++) {
+        if (previousWords[i] !== currentWords[i]) return false;
+    }
+    return true;
+}
+
+export class MemoryCheckpoints {
+    constructor() {
+        /** @type {{ stepCount: number, length: number, pages: Map<number, Uint8Array>, size: number }[]} */
+        this.checkpoints = [];
+        this.base = undefined;
+        this.latest = undefined;
+    }
+
+    /**
+     * Records memory after stepCount steps, returning the memory overhead of the checkpoint
+     * @param {number} stepCount
+     * @param {Uint8Array} memory
+     * @returns {{ stepCount: number, changedPages: number, size: number }}
+     */
+    record(stepCount, memory) {
+        if (this.latest === undefined) {
+            this.base = memory.slice();
+            this.latest = memory.slice();
+            this.checkpoints.push({ stepCount: stepCount, length: memory.length, pages: new Map(), size: memory.length });
+            return { stepCount: stepCount, changedPages: Math.ceil(memory.length / PAGE_SIZE), size: memory.length };
+        }
+
+        if (memory.length > this.latest.length) {
+            const grown = new Uint8Array(memory.length);
+            grown.set(this.latest);
+            this.latest = grown;
+        }
+
+        const pages = new Map();
+        let size = 0;
+        for (let start = 0; start < memory.length; start += PAGE_SIZE) {
+            const end = Math.min(start + PAGE_SIZE, memory.length);
+            if (isPageEqual(this.latest, memory, start, end)) continue;
+
+            const delta = encodePageDelta(this.latest.subarray(start, end), memory.subarray(start, end));
+            pages.set(start / PAGE_SIZE, delta);
+            size += delta.length;
+            this.latest.set(memory.subarray(start, end), start);
+        }
+        this.checkpoints.push({ stepCount: stepCount, length: memory.length, pages: pages, size: size });
+        return { stepCount: stepCount, changedPages: pages.size, size: size };
+    }
+
+    /**
+     * Returns the latest checkpoint at or before stepCount, undefined before the first one
+     * @param {number} stepCount
+     */
+    findCheckpoint(stepCount) {
+        let low = 0;
+        let high = this.checkpoints.length;
+        while (low < high) {
+            const middle = (low + high) >>> 1;
+            if (this.checkpoints[middle].stepCount <= stepCount) low = middle + 1;
+            else high = middle;
+        }
+        return low - 1;
+    }
+
+    /**
+     * Reconstructs memory of a checkpoint, from the first or the latest one, whichever has fewer checkpoints in between
+     * @param {number} index
+     * @returns {Uint8Array}
+     */
+    getMemory(index) {
+        const checkpoint = this.checkpoints[index];
+        const lastIndex = this.checkpoints.length - 1;
+        let memory;
+        if (index <= lastIndex - index) {
+            memory = new Uint8Array(checkpoint.length);
+            memory.set(this.base.subarray(0, Math.min(this.base.length, checkpoint.length)));
+            for (let i = 1; i <= index; i++) this.applyCheckpoint(memory, this.checkpoints[i]);
+        }
+        else {
+            memory = this.latest.slice();
+            for (let i = lastIndex; i > index; i--) this.applyCheckpoint(memory, this.checkpoints[i]);
+            memory = memory.slice(0, checkpoint.length);
+        }
+        return memory;
+    }
+
+    applyCheckpoint(memory, checkpoint) {
+        for (const [page, delta] of checkpoint.pages) {
+            const start = page * PAGE_SIZE;
+            if (start < memory.length) applyPageDelta(memory.subarray(start, Math.min(start + PAGE_SIZE, memory.length)), delta);
+        }
+    }
+
+    /**
+     * Returns memory overhead of every checkpoint, in bytes
+     * @returns {{ stepCount: number, changedPages: number, size: number }[]}
+     */
+    getStatistics() {
+        return this.checkpoints.map(c => ({ stepCount: c.stepCount, changedPages: c.pages.size, size: c.size }));
+    }
+}
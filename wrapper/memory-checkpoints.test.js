@@ -0,0 +1,75 @@
+import assert from 'assert';
+import { PAGE_SIZE, MemoryCheckpoints, applyAssignments, applyPageDelta, encodePageDelta } from './memory-checkpoints.js';
+
+describe('encodePageDelta', function() {
+  it('turns either page into the other', function() {
+    const previous = new Uint8Array(1000);
+    const current = previous.slice();
+    current[3] = 7;
+    current.fill(9, 200, 600);
+
+    const delta = encodePageDelta(previous, current);
+    const restored = previous.slice();
+    applyPageDelta(restored, delta);
+    applyPageDelta(current, delta);
+
+    assert.ok(delta.length < 420);
+    assert.deepEqual(restored, previous.slice().fill(9, 200, 600).fill(7, 3, 4));
+    assert.deepEqual(current, previous);
+  });
+});
+
+describe('MemoryCheckpoints', function() {
+  it('only stores changed pages', function() {
+    const checkpoints = new MemoryCheckpoints();
+    const memory = new Uint8Array(4 * PAGE_SIZE);
+    checkpoints.record(10, memory);
+    memory[PAGE_SIZE + 5] = 1;
+    const statistics = checkpoints.record(20, memory);
+
+    assert.deepEqual([statistics.stepCount, statistics.changedPages], [20, 1]);
+    assert.ok(statistics.size < 8);
+  });
+  it('restores memory of any checkpoint', function() {
+    const checkpoints = new MemoryCheckpoints();
+    const memory = new Uint8Array(2 * PAGE_SIZE);
+    const snapshots = [];
+    for (let i = 0; i < 6; i++) {
+      memory[(i * 7919) % memory.length] = i + 1;
+      checkpoints.record(10 * i, memory);
+      snapshots.push(memory.slice());
+    }
+
+    assert.equal(checkpoints.findCheckpoint(35), 3);
+    assert.equal(checkpoints.findCheckpoint(5), 0);
+    assert.equal(checkpoints.findCheckpoint(-1), -1);
+    snapshots.forEach((snapshot, i) => assert.deepEqual(checkpoints.getMemory(i), snapshot));
+  });
+  it('restores memory after it grew', function() {
+    const checkpoints = new MemoryCheckpoints();
+    checkpoints.record(0, new Uint8Array(PAGE_SIZE).fill(1));
+    checkpoints.record(1, new Uint8Array(2 * PAGE_SIZE).fill(2));
+
+    assert.deepEqual(checkpoints.getMemory(0), new Uint8Array(PAGE_SIZE).fill(1));
+    assert.deepEqual(checkpoints.getMemory(1), new Uint8Array(2 * PAGE_SIZE).fill(2));
+  });
+});
+
+describe('applyAssignments', function() {
+  it('writes assigned values at their address', function() {
+    const memory = new Uint8Array(16);
+    const steps = [
+      { action: 'assign', dataType: 'int', address: 0, dataValue: -2 },
+      { action: 'eval', dataType: 'int', dataValue: 5 },
+      { action: 'assign', dataType: 'double', address: 8, dataValue: 0.5 },
+      { action: 'assign', dataType: 'struct point', address: 4, dataValue: new Uint8Array([1, 2, 3, 4]) }
+    ];
+
+    applyAssignments(memory, steps, 0, 4);
+
+    const view = new DataView(memory.buffer);
+    assert.equal(view.getInt32(0, true), -2);
+    assert.equal(view.getFloat64(8, true), 0.5);
+    assert.deepEqual(Array.from(memory.subarray(4, 8)), [1, 2, 3, 4]);
+  });
+});
@@ -0,0 +1,67 @@
+/**
+ * Evaluates Emscripten output, a classic script, with a Module object of its own,
+ * so the same output can be instantiated several times (see simulation-worker.js and module-pool.js)
+ */
+const isNode = typeof process === "object" && process.versions?.node !== undefined;
+
+/**
+ * Returns the URL of the Emscripten output, resolving paths relative to the working directory under Node
+ * and relative URLs in browsers
+ * @param {string} moduleUrl
+ * @returns {Promise<URL>}
+ */
+export async function toModuleUrl(moduleUrl) {
+    if (!isNode) return new URL(moduleUrl, globalThis.location?.href);
+    if (moduleUrl.startsWith("file:")) return new URL(moduleUrl);
+
+    const [{ pathToFileURL }, { resolve }] = await Promise.all([
+        import(/* webpackIgnore: true */ "url"),
+        import(/* webpackIgnore: true */ "path")
+    ]);
+    return pathToFileURL(resolve(moduleUrl));
+}
+
+/**
+ * Reads a file next to the Emscripten output, f.e. its wasm
+ * @param {URL} url
+ * @returns {Promise<ArrayBuffer>}
+ */
+export async function readBinary(url) {
+    if (!isNode) return (await fetch(url)).arrayBuffer();
+
+    const [{ readFile }, { fileURLToPath }] = await Promise.all([
+        import(/* webpackIgnore: true */ "fs/promises"),
+        import(/* webpackIgnore: true */ "url")
+    ]);
+    const data = await readFile(fileURLToPath(url));
+    return data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength);
+}
+
+/**
+ * Returns a function evaluating the Emscripten output with a given Module, so its source is only read and parsed once
+ * @param {string} moduleUrl
+ * @returns {Promise<function(object): void>}
+ */
+export async function loadModule(moduleUrl) {
+    const url = await toModuleUrl(moduleUrl);
+    if (!isNode) {
+        const source = await (await fetch(url)).text();
+        return new Function("Module", source);
+    }
+
+    // Evaluated with the globals Emscripten output expects from CommonJS
+    const [{ createRequire }, { readFileSync }, { fileURLToPath }, { dirname }, vm] = await Promise.all([
+        import(/* webpackIgnore: true */ "module"),
+        import(/* webpackIgnore: true */ "fs"),
+        import(/* webpackIgnore: true */ "url"),
+        import(/* webpackIgnore: true */ "path"),
+        import(/* webpackIgnore: true */ "vm")
+    ]);
+    const path = fileURLToPath(url);
+    const source = readFileSync(path, "utf8");
+    const evaluate = vm.runInThisContext(`(function(Module, require, __filename, __dirname, module, exports) {${source}\n})`, { filename: path });
+    return module => {
+        const commonJsModule = { exports: {} };
+        evaluate(module, createRequire(path), path, dirname(path), commonJsModule, commonJsModule.exports);
+    };
+}
@@ -0,0 +1,149 @@
+/**
+ * Runs one Emscripten output on many inputs, f.e. the test cases of an exercise.
+ * The output is parsed and its wasm compiled once. Instances are kept after a run and
+ * reset to a snapshot of their memory taken before main, so a run costs a memory copy
+ * instead of an instantiation. Needs HEAPU8, stackSave and stackRestore exported (see emcc_builder.py).
+ */
+import Simulation from './wrapper.js'
+import { loadModule, readBinary, toModuleUrl } from './module-loader.js'
+
+const DEFAULT_POOL_SIZE = 4;
+
+/**
+ * @typedef PooledInstance
+ * @property {object} module
+ * @property {Uint8Array} memory linear memory before main
+ * @property {number} stack stack pointer before main
+ * @property {Uint8Array} input stdin of the current run
+ * @property {number} inputOffset
+ * @property {boolean} isAborted
+ */
+
+/**
+ * @typedef PooledRun
+ * @property {Simulation} simulation
+ * @property {Error} [error] what main threw, the simulation holds the steps up to it
+ */
+
+export class ModulePool {
+    /**
+     * DO NOT USE DIRECTLY, see ModulePool.create
+     */
+    constructor(url, evaluate, wasmModule, options) {
+        this.url = url;
+        this.evaluate = evaluate;
+        this.wasmModule = wasmModule;
+        this.maxSteps = options.maxSteps;
+        this.size = options.size ?? DEFAULT_POOL_SIZE;
+        // Metadata is read by the first instance and shared by the others (see metadata.js)
+        this.metadataCache = {};
+        /** @type {PooledInstance[]} */
+        this.instances = [];
+        this.instanceCount = 0;
+    }
+
+    /**
+     * @param {string} moduleUrl URL of the Emscripten output, or its path under Node
+     * @param {{ size?: number, maxSteps?: number, wasmUrl?: string, wasmBinary?: ArrayBuffer|Uint8Array }} options
+     * size is the number of idle instances kept, wasmUrl defaults to the output with a .wasm extension
+     * @returns {Promise<ModulePool>}
+     */
+    static async create(moduleUrl, options = {}) {
+        const url = await toModuleUrl(moduleUrl);
+        const [evaluate, wasmBinary] = await Promise.all([
+            loadModule(moduleUrl),
+            options.wasmBinary ?? readBinary(options.wasmUrl !== undefined ? await toModuleUrl(options.wasmUrl) : new URL(url.href.replace(/\.js$/, ".wasm")))
+        ]);
+        return new ModulePool(url, evaluate, await WebAssembly.compile(wasmBinary), options);
+    }
+
+    /**
+     * Runs main on an idle instance, or a new one if there is none
+     * @param {{ stdin?: string|Uint8Array }} options
+     * @returns {Promise<PooledRun>}
+     */
+    async run(options = {}) {
+        const instance = this.instances.pop() ?? await this.createInstance();
+        this.reset(instance, options.stdin);
+
+        const simulation = Simulation.create(instance.module);
+        let error;
+        try {
+            simulation.run();
+        }
+        catch (e) {
+            error = e;
+        }
+        // Aborted runtimes cannot run main again
+        if (!instance.isAborted && this.instances.length < this.size) this.instances.push(instance);
+        return { simulation, error };
+    }
+
+    /**
+     * Runs main once per input, one after the other
+     * @param {(string|Uint8Array)[]} inputs
+     * @returns {Promise<PooledRun[]>}
+     */
+    async runAll(inputs) {
+        const runs = [];
+        for (const stdin of inputs) runs.push(await this.run({ stdin }));
+        return runs;
+    }
+
+    /**
+     * @returns {Promise<PooledInstance>}
+     */
+    async createInstance() {
+        const instance = { module: undefined, memory: undefined, stack: undefined, input: new Uint8Array(), inputOffset: 0, isAborted: false };
+        await new Promise((resolve, reject) => {
+            instance.module = {
+                noInitialRun: true,
+                simulatorMaxSteps: this.maxSteps,
+                simulatorMetadataCache: this.metadataCache,
+                locateFile: path => new URL(path, this.url).href,
+                instantiateWasm: (imports, receiveInstance) => {
+                    WebAssembly.instantiate(this.wasmModule, imports)
+                        .then(wasmInstance => receiveInstance(wasmInstance, this.wasmModule), reject);
+                    return {};
+                },
+                // Emscripten reads stdin a byte at a time, null marks its end
+                stdin: () => instance.inputOffset < instance.input.length ? instance.input[instance.inputOffset++] : null,
+                onAbort: reason => {
+                    instance.isAborted = true;
+                    reject(new Error(`Module aborted: ${reason}`));
+                },
+                onRuntimeInitialized: resolve
+            };
+            this.evaluate(instance.module);
+        });
+
+        const module = instance.module;
+        if (module.HEAPU8 === undefined || module.stackSave === undefined)
+            throw new Error("Module does not export HEAPU8 and stackSave, rebuild it to run it in a pool");
+        instance.memory = module.HEAPU8.slice();
+        instance.stack = module.stackSave();
+        this.instanceCount++;
+        return instance;
+    }
+
+    /**
+     * Restores the memory and stack of an instance from before main and clears what the previous run recorded
+     * @param {PooledInstance} instance
+     * @param {string|Uint8Array} [stdin]
+     */
+    reset(instance, stdin) {
+        const module = instance.module;
+        // Memory may have grown during a run, bytes past the snapshot are zeroed as on growth
+        module.HEAPU8.set(instance.memory);
+        module.HEAPU8.fill(0, instance.memory.length);
+        module.stackRestore(instance.stack);
+
+        instance.input = typeof stdin === "string" ? new TextEncoder().encode(stdin) : stdin ?? new Uint8Array();
+        instance.inputOffset = 0;
+        module.simulatorSteps = [];
+        module.simulatorOutput = { stdout: "", stderr: "" };
+        module.simulatorCaptures = undefined;
+    }
+}
+
+export default ModulePool;
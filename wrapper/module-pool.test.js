@@ -0,0 +1,42 @@
+import assert from 'assert';
+import { relative } from 'path';
+import { fileURLToPath } from 'url';
+import { ModulePool } from './module-pool.js';
+
+const pooledModulePath = fileURLToPath(new URL('./fixtures/pooled-module.js', import.meta.url));
+// The smallest valid wasm module, the fixture does not use its exports
+const emptyWasm = new Uint8Array([0x00, 0x61, 0x73, 0x6d, 0x01, 0x00, 0x00, 0x00]);
+
+describe('ModulePool', function() {
+  it('reuses an instance with reset memory for each input', async function() {
+    const instancesBefore = globalThis.pooledModuleInstances ?? 0;
+    const pool = await ModulePool.create(pooledModulePath, { wasmBinary: emptyWasm });
+
+    const runs = await pool.runAll(["12", "345", ""]);
+
+    assert.deepEqual(runs.map(r => r.simulation.exitCode), [3, 12, 0]);
+    assert.deepEqual(runs[1].simulation.allSteps.map(s => s.dataValue), [3, 7, 12]);
+    assert.equal(globalThis.pooledModuleInstances - instancesBefore, 1);
+    assert.deepEqual(runs.map(r => r.error), [undefined, undefined, undefined]);
+  });
+  it('keeps the steps of failing runs', async function() {
+    const pool = await ModulePool.create(pooledModulePath, { wasmBinary: emptyWasm });
+
+    const failed = await pool.run({ stdin: "999" });
+    const passed = await pool.run({ stdin: new TextEncoder().encode("9") });
+
+    assert.equal(failed.error.message, "sum too large");
+    assert.equal(failed.simulation.allSteps.length, 3);
+    assert.equal(passed.error, undefined);
+    assert.equal(passed.simulation.exitCode, 9);
+    assert.equal(pool.instanceCount, 1);
+  });
+  it('resolves relative paths from the working directory', async function() {
+    const pool = await ModulePool.create(relative(process.cwd(), pooledModulePath), { wasmBinary: emptyWasm });
+
+    const run = await pool.run({ stdin: "12" });
+
+    assert.equal(fileURLToPath(pool.url), pooledModulePath);
+    assert.equal(run.simulation.exitCode, 3);
+  });
+});
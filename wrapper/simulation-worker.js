@@ -0,0 +1,95 @@
+/**
+ * Runs an instrumented program off the main thread, posting its steps back in batches while it runs.
+ * Loaded as a Web Worker in browsers and as a worker_threads worker under Node.
+ *
+ * Messages to the worker: { type: "run", moduleUrl, batchSize, maxSteps }
+ * Messages from the worker: { type: "code", code }, { type: "steps", steps, output }, { type: "done" }, { type: "error", message }
+ */
+import { expandDerivedSteps } from './wrapper-functions.js'
+import { loadModule as loadNodeModule, toModuleUrl } from './module-loader.js'
+
+const isNode = typeof importScripts !== "function";
+
+/**
+ * Collects the steps pushed by library.js, posting them whenever a batch is full
+ */
+class StepStream {
+    constructor(module, batchSize, post) {
+        this.module = module;
+        this.batchSize = batchSize;
+        this.post = post;
+        this.batch = [];
+        this.length = 0;
+        this.lastValues = new Map();
+        this.postedOutput = { stdout: 0, stderr: 0 };
+    }
+
+    push(step) {
+        this.batch.push(step);
+        this.length++;
+        if (this.batch.length >= this.batchSize) this.flush();
+    }
+
+    flush() {
+        if (this.batch.length === 0) return;
+        const getNotification = id => this.module.getSimulatorNotification?.(id);
+        const message = { type: "steps", steps: expandDerivedSteps(this.batch, getNotification, this.lastValues) };
+        // Output steps only store where their text ends, so the text written since the last batch is posted along
+        const output = this.module.simulatorOutput;
+        if (output !== undefined) {
+            message.output = { stdout: output.stdout.slice(this.postedOutput.stdout), stderr: output.stderr.slice(this.postedOutput.stderr) };
+            this.postedOutput = { stdout: output.stdout.length, stderr: output.stderr.length };
+        }
+        this.post(message);
+        this.batch = [];
+    }
+}
+
+async function run(message, post) {
+    const moduleUrl = await toModuleUrl(message.moduleUrl);
+    const module = {
+        noInitialRun: true,
+        simulatorMaxSteps: message.maxSteps,
+        locateFile: path => new URL(path, moduleUrl).href
+    };
+    const steps = new StepStream(module, message.batchSize, post);
+    module.simulatorSteps = steps;
+    module.onRuntimeInitialized = function() {
+        post({ type: "code", code: module.simulatorCode });
+        try {
+            module._main();
+            steps.flush();
+            post({ type: "done" });
+        }
+        catch (e) {
+            module.flushSimulatorSteps?.();
+            steps.flush();
+            post({ type: "error", message: e.message ?? `${e}` });
+        }
+    };
+    return loadModule(message.moduleUrl, module);
+}
+
+async function loadModule(moduleUrl, module) {
+    if (!isNode) {
+        self.Module = module;
+        importScripts(moduleUrl);
+        return;
+    }
+    (await loadNodeModule(moduleUrl))(module);
+}
+
+if (isNode) {
+    import(/* webpackIgnore: true */ "worker_threads").then(({ parentPort }) => {
+        const post = message => parentPort.postMessage(message);
+        parentPort.on("message", message => {
+            if (message.type === "run") run(message, post).catch(e => post({ type: "error", message: e.message }));
+        });
+    });
+}
+else {
+    const post = message => self.postMessage(message);
+    self.onmessage = event => {
+        if (event.data.type === "run") run(event.data, post).catch(e => post({ type: "error", message: e.message }));
+    };
+}
@@ -0,0 +1,95 @@
+/**
+ * Ascending step indexes per action, per line of expression steps, per changed identifier and of notified steps.
+ * Steps are only ever appended, so each update only indexes the steps added since the previous one.
+ */
+import { findLastIndexAtOrBefore } from './wrapper-functions.js'
+
+function addIndex(map, key, index) {
+    let indexes = map.get(key);
+    if (indexes === undefined) map.set(key, indexes = []);
+    indexes.push(index);
+}
+
+/**
+ * Returns the first of ascending indexes after index, or the last one before it, undefined if there is none
+ * @param {number[]} indexes
+ * @param {number} index
+ * @param {"forward"|"backward"} direction
+ */
+export function findAdjacentIndex(indexes, index, direction) {
+    const position = direction === "backward"
+        ? findLastIndexAtOrBefore(indexes, index - 1)
+        : findLastIndexAtOrBefore(indexes, index) + 1;
+    return indexes[position];
+}
+
+export class StepIndex {
+    constructor() {
+        this.stepCount = 0;
+        /** @type {Map<string, number[]>} */
+        this.actions = new Map();
+        /** @type {Map<number, number[]>} */
+        this.lines = new Map();
+        /** @type {Map<string, number[]>} */
+        this.identifiers = new Map();
+        /** @type {number[]} steps the program notified, the others were derived by the wrapper */
+        this.notifiedSteps = [];
+    }
+
+    /**
+     * @param {SimulationStep[]} steps
+     */
+    update(steps) {
+        for (; this.stepCount < steps.length; this.stepCount++) {
+            const step = steps[this.stepCount];
+            addIndex(this.actions, step.action, this.stepCount);
+            if (step.action === "eval" && step.location !== undefined) addIndex(this.lines, step.location[0], this.stepCount);
+            if (step.action === "decl" || step.action === "assign") addIndex(this.identifiers, step.identifier, this.stepCount);
+            if (step.derivedFrom === undefined) this.notifiedSteps.push(this.stepCount);
+        }
+        return this;
+    }
+
+    getActionSteps(action) {
+        return this.actions.get(action) ?? [];
+    }
+
+    /**
+     * Returns expression steps starting on a line
+     * @param {number} line
+     */
+    getLineSteps(line) {
+        return this.lines.get(line) ?? [];
+    }
+
+    /**
+     * Returns declarations and assignments of an identifier
+     * @param {string} identifier
+     */
+    getIdentifierSteps(identifier) {
+        return this.identifiers.get(identifier) ?? [];
+    }
+
+    /**
+     * Returns how many of the steps up to index (inclusive) the program notified, memory checkpoints count those
+     * @param {number} index
+     */
+    getNotifiedStepCount(index) {
+        return findLastIndexAtOrBefore(this.notifiedSteps, index) + 1;
+    }
+
+    /**
+     * Returns the index of the step following the first count notified steps
+     * @param {number} count
+     */
+    getStepAfterNotified(count) {
+        return count > 0 ? this.notifiedSteps[count - 1] + 1 : 0;
+    }
+
+    /**
+     * Returns lines with expression steps in ascending order, f.e. to mark where breakpoints can be set
+     */
+    getLines() {
+        return [...this.lines.keys()].sort((a, b) => a - b);
+    }
+}
@@ -0,0 +1,46 @@
+import assert from 'assert';
+import { StepIndex, findAdjacentIndex } from './step-index.js';
+
+describe('StepIndex', function() {
+  it('indexes steps added since the previous update', function() {
+    const steps = [
+      { action: 'stat', location: [1, 1, 1, 5] },
+      { action: 'eval', location: [2, 1, 2, 5] },
+      { action: 'decl', identifier: 'i' }
+    ];
+    const index = new StepIndex().update(steps);
+    steps.push({ action: 'eval', location: [1, 3, 1, 4] }, { action: 'assign', identifier: 'i', location: [2, 1, 2, 5] });
+    index.update(steps);
+
+    assert.deepEqual(index.getActionSteps('eval'), [1, 3]);
+    assert.deepEqual(index.getLineSteps(2), [1]);
+    assert.deepEqual(index.getIdentifierSteps('i'), [2, 4]);
+    assert.deepEqual(index.getIdentifierSteps('j'), []);
+    assert.deepEqual(index.getLines(), [1, 2]);
+  });
+});
+
+describe('StepIndex notified steps', function() {
+  it('counts the steps the program notified', function() {
+    const steps = [
+      { action: 'assign', identifier: 'i' },
+      { action: 'eval', derivedFrom: 0 },
+      { action: 'assign', identifier: 'j' }
+    ];
+    const index = new StepIndex().update(steps);
+    steps.push({ action: 'eval', derivedFrom: 2 }, { action: 'stat' });
+    index.update(steps);
+
+    assert.deepEqual([0, 1, 2, 3, 4].map(i => index.getNotifiedStepCount(i)), [1, 1, 2, 2, 3]);
+    assert.deepEqual([0, 1, 2, 3].map(count => index.getStepAfterNotified(count)), [0, 1, 3, 5]);
+  });
+});
+
+describe('findAdjacentIndex', function() {
+  it('finds the next or previous index', function() {
+    assert.equal(findAdjacentIndex([2, 5, 9], 5, 'forward'), 9);
+    assert.equal(findAdjacentIndex([2, 5, 9], 5, 'backward'), 2);
+    assert.equal(findAdjacentIndex([2, 5, 9], 9, 'forward'), undefined);
+    assert.equal(findAdjacentIndex([2, 5, 9], 2, 'backward'), undefined);
+  });
+});
@@ -0,0 +1,78 @@
+/**
+ * Loads a binary trace (see trace-writer.js) as a module a Simulation can run, f.e. the trace of a native build
+ * (see rewriter/native_runtime.c), so traces generated without a JS engine can be explored like any other run.
+ * Records are already expanded, so the steps are not expanded again. Only available under Node.
+ */
+import { existsSync, readFileSync } from 'fs'
+import { AGGREGATE_FLAG, BINARY_TRACE_MAGIC, HEADER_SIZE, RECORD_SIZE, STDERR_ID, STDOUT_ID } from './trace-writer.js'
+
+// Notification metadata is decoded by the same script Emscripten builds include
+const METADATA_SCRIPT_URL = new URL("../rewriter/metadata.js", import.meta.url);
+
+function readOptional(path) {
+    return existsSync(path) ? readFileSync(path) : Buffer.alloc(0);
+}
+
+/**
+ * Returns a module holding the code and notifications of a metadata file written by rewrite.py
+ * @param {string} metadataPath
+ */
+export function loadMetadata(metadataPath) {
+    const module = {};
+    new Function("Module", readFileSync(METADATA_SCRIPT_URL, "utf8"))(module);
+    const data = readFileSync(metadataPath);
+    module.decodeSimulatorMetadata(data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength));
+    return module;
+}
+
+/**
+ * @param {string} tracePath
+ * @param {string} metadataPath
+ * @param {{ exitCode?: number }} options exitCode of the traced run, which _main of the module returns
+ */
+export function loadTrace(tracePath, metadataPath, options = {}) {
+    const metadata = loadMetadata(metadataPath);
+    const trace = readFileSync(tracePath);
+    const view = new DataView(trace.buffer, trace.byteOffset, trace.byteLength);
+    if (trace.subarray(0, 8).toString("latin1") !== BINARY_TRACE_MAGIC) throw new Error("Not a binary trace");
+    if (view.getUint32(8, true) !== RECORD_SIZE) throw new Error(`Unsupported trace record size ${view.getUint32(8, true)}`);
+
+    const data = readOptional(tracePath + ".data");
+    const outputBytes = { stdout: readOptional(tracePath + ".stdout"), stderr: readOptional(tracePath + ".stderr") };
+    const output = { stdout: "", stderr: "" };
+    const outputByteEnds = { stdout: 0, stderr: 0 };
+    const decoders = { stdout: new TextDecoder("utf-8"), stderr: new TextDecoder("utf-8") };
+
+    const steps = [];
+    for (let offset = HEADER_SIZE; offset + RECORD_SIZE <= trace.length; offset += RECORD_SIZE) {
+        const id = view.getUint32(offset, true);
+        const address = view.getUint32(offset + 4, true);
+        const value = view.getFloat64(offset + 8, true);
+        if (id === STDOUT_ID || id === STDERR_ID) {
+            // Output steps hold the byte offset their output ends at, Simulation expects the offset in the text
+            const stream = id === STDOUT_ID ? "stdout" : "stderr";
+            output[stream] += decoders[stream].decode(outputBytes[stream].subarray(outputByteEnds[stream], value), { stream: true });
+            outputByteEnds[stream] = value;
+            steps.push({ action: stream, end: output[stream].length });
+            continue;
+        }
+
+        const isAggregate = (id & AGGREGATE_FLAG) !== 0;
+        const notificationId = isAggregate ? (id & ~AGGREGATE_FLAG) >>> 0 : id;
+        const dataValue = isAggregate
+            ? new Uint8Array(data.subarray(value, value + data.readUInt32LE(value - 4)))
+            : value;
+        const step = { ...metadata.getSimulatorNotification(notificationId), id: notificationId, dataValue };
+        if (step.action === "assign") step.address = address;
+        steps.push(step);
+    }
+
+    return {
+        simulatorCode: metadata.simulatorCode,
+        simulatorOutput: output,
+        simulatorSteps: steps,
+        _main: () => options.exitCode ?? 0
+    };
+}
+
+export default loadTrace;
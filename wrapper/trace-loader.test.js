@@ -0,0 +1,67 @@
+import assert from 'assert';
+import { mkdtempSync, writeFileSync } from 'fs';
+import { tmpdir } from 'os';
+import { join } from 'path';
+import { loadTrace } from './trace-loader.js';
+import { BinaryTraceWriter } from './trace-writer.js';
+import Simulation from './wrapper.js';
+
+// Same layout as NotifyMetadataSerializer in rewriter/source_visitors.py
+function encodeMetadata(code, strings, columns) {
+    const encoder = new TextEncoder();
+    const stringBytes = encoder.encode(JSON.stringify(strings));
+    const codeBytes = encoder.encode(code);
+    const count = columns.actions.length;
+    let length = 16 + stringBytes.length + 4 + codeBytes.length;
+    length += (4 - length % 4) % 4;
+    const buffer = new Uint8Array(length + 32 * count);
+    const view = new DataView(buffer.buffer);
+    buffer.set(encoder.encode("CSIM"));
+    view.setUint32(4, 2, true);
+    view.setUint32(8, count, true);
+    view.setUint32(12, stringBytes.length, true);
+    buffer.set(stringBytes, 16);
+    view.setUint32(16 + stringBytes.length, codeBytes.length, true);
+    buffer.set(codeBytes, 20 + stringBytes.length);
+    const values = [columns.actions, columns.types, columns.identifiers, columns.locations, columns.derivedFrom].flat();
+    values.forEach((value, i) => view.setInt32(length + 4 * i, value, true));
+    return buffer;
+}
+
+describe('loadTrace', function() {
+  it('loads binary traces as steps of a simulation', function() {
+    const directory = mkdtempSync(join(tmpdir(), 'traces-'));
+    const code = "int main() {\n    int x = 1;\n    int a[2] = {1, 2};\n    printf(\"é!\\n\");\n    x = 2;\n}";
+    writeFileSync(join(directory, "output.meta"), encodeMetadata(code, ["int", "x", "int[2]", "a"], {
+        actions: [0, 1, 1, 3],
+        types: [-1, 0, 2, 0],
+        identifiers: [-1, 1, 3, 1],
+        locations: [[2, 5, 2, 14], [-1, -1, -1, -1], [-1, -1, -1, -1], [5, 5, 5, 9]].flat(),
+        derivedFrom: [-1, -1, -1, -1]
+    }));
+    const notifications = [{ action: "stat", location: [2, 5, 2, 14] }, { action: "decl", dataType: "int", identifier: "x" }];
+    const module = { getSimulatorNotification: id => notifications[id], simulatorOutput: { stdout: "é!\n", stderr: "" } };
+    const writer = new BinaryTraceWriter(join(directory, "trace.bin"), module);
+    writer.push({ ...notifications[0], id: 0, dataValue: 0 });
+    writer.push({ ...notifications[1], id: 1, dataValue: 1 });
+    writer.push({ action: "decl", id: 2, dataValue: new Uint8Array([1, 0, 0, 0, 2, 0, 0, 0]) });
+    writer.push({ action: "stdout", end: 3 });
+    writer.push({ action: "assign", id: 3, dataValue: 2, address: 64 });
+    writer.close();
+
+    const simulation = Simulation.create(loadTrace(join(directory, "trace.bin"), join(directory, "output.meta"), { exitCode: 3 }));
+    simulation.run();
+
+    assert.equal(simulation.exitCode, 3);
+    assert.equal(simulation.getCode(), code);
+    assert.deepEqual(simulation.allSteps.map(s => [s.action, s.id, s.identifier]), [
+        ["stat", 0, undefined], ["decl", 1, "x"], ["decl", 2, "a"], ["stdout", undefined, undefined], ["assign", 3, "x"]
+    ]);
+    assert.deepEqual(simulation.allSteps[2].dataValue, new Uint8Array([1, 0, 0, 0, 2, 0, 0, 0]));
+    assert.equal(simulation.allSteps[3].end, 3);
+    assert.equal(simulation.allSteps[4].address, 64);
+    simulation.moveToStep(4);
+    assert.equal(simulation.getOutput(), "> program.exe\né!\n");
+    assert.deepEqual(simulation.getVariables().find(v => v.identifier === "x").dataValue, 2);
+  });
+});
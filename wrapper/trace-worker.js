@@ -0,0 +1,75 @@
+/**
+ * Runs instrumented programs for batch-runner.js, writing their steps to a trace file instead of keeping them.
+ * Loaded as a worker_threads worker, runs one job at a time.
+ *
+ * Messages to the worker: { type: "run", moduleUrl, tracePath, format, stdin, maxSteps, maxMemory }
+ * Messages from the worker: { type: "done", exitCode, stepCount, coverage }, { type: "error", message, stepCount, coverage }
+ * coverage is only set for coverage builds (see coverage.js)
+ */
+import { parentPort } from 'worker_threads'
+import { loadModule, toModuleUrl } from './module-loader.js'
+import { createTraceWriter } from './trace-writer.js'
+import { getCoverage } from './coverage.js'
+
+// Emscripten output is parsed once per worker
+const loadedModules = new Map();
+
+function getModule(moduleUrl) {
+    if (!loadedModules.has(moduleUrl)) loadedModules.set(moduleUrl, loadModule(moduleUrl));
+    return loadedModules.get(moduleUrl);
+}
+
+async function run(message, post) {
+    const input = message.stdin ?? new Uint8Array();
+    let inputOffset = 0;
+    const moduleUrl = await toModuleUrl(message.moduleUrl);
+    const module = {
+        noInitialRun: true,
+        simulatorMaxSteps: message.maxSteps,
+        locateFile: path => new URL(path, moduleUrl).href,
+        stdin: () => inputOffset < input.length ? input[inputOffset++] : null
+    };
+    // Linear memory is outside the worker's heap limit, so its size is checked whenever the trace is written
+    const checkMemory = () => {
+        if (message.maxMemory !== undefined && module.HEAPU8 !== undefined && module.HEAPU8.length > message.maxMemory)
+            throw new Error(`Memory limit of ${message.maxMemory} bytes exceeded`);
+    };
+    const trace = createTraceWriter(message.format, message.tracePath, module, { onFlush: checkMemory });
+    module.simulatorSteps = trace;
+
+    await new Promise((resolve, reject) => {
+        module.onRuntimeInitialized = () => {
+            let result;
+            try {
+                result = { type: "done", exitCode: module._main() };
+                checkMemory();
+            }
+            catch (e) {
+                // exit() unwinds main with the exit status
+                result = e?.name === "ExitStatus"
+                    ? { type: "done", exitCode: e.status }
+                    : { type: "error", message: e?.message ?? `${e}` };
+            }
+            try {
+                // Trace buffer builds hold the steps since their last flush when main failed
+                module.flushSimulatorSteps?.();
+                trace.close();
+            }
+            catch (e) {
+                result = { type: "error", message: e.message };
+            }
+            post({ ...result, stepCount: trace.stepCount, coverage: getCoverage(module) });
+            resolve();
+        };
+        module.onAbort = reason => {
+            trace.close();
+            reject(new Error(`Module aborted: ${reason}`));
+        };
+        getModule(message.moduleUrl).then(evaluate => evaluate(module), reject);
+    });
+}
+
+const post = message => parentPort.postMessage(message);
+parentPort.on("message", message => {
+    if (message.type === "run") run(message, post).catch(e => post({ type: "error", message: e.message, stepCount: 0 }));
+});
@@ -0,0 +1,187 @@
+/**
+ * Writes the steps of a run to disk as they are pushed by library.js, instead of keeping them in Module.simulatorSteps.
+ * Writers stand in for the steps array: they count steps in length, so the step limit of library.js still applies.
+ *
+ * NDJSON traces hold one step per line, as Simulation stores them, with the text of output steps.
+ * Binary traces hold a header followed by fixed-size little-endian records, one per step, so they can be memory-mapped:
+ *   header: magic "CSTRACE1", record size (uint32), reserved (uint32)
+ *   record: id (uint32), address (uint32), value (float64)
+ * id is the notification id (see NotifyDataSerializer), or STDOUT_ID/STDERR_ID with the byte offset where the output ends as value.
+ * Aggregates have AGGREGATE_FLAG set in id and the offset of their bytes in <trace>.data as value, stored after their length (uint32).
+ * The output text is written to <trace>.stdout and <trace>.stderr when the writer is closed.
+ * Derived steps are written as separate records, so record indexes are step indexes.
+ * Only available under Node.
+ */
+import { closeSync, openSync, writeSync } from 'fs'
+import { expandDerivedSteps } from './wrapper-functions.js'
+
+export const BINARY_TRACE_MAGIC = "CSTRACE1";
+export const HEADER_SIZE = 16;
+export const RECORD_SIZE = 16;
+export const STDOUT_ID = 0xffffffff;
+export const STDERR_ID = 0xfffffffe;
+export const AGGREGATE_FLAG = 0x80000000;
+
+// Records buffered before a write
+const BUFFER_RECORDS = 4096;
+const NDJSON_BUFFER_SIZE = 1 << 20;
+
+class TraceWriter {
+    /**
+     * @param {string} path
+     * @param {object} module the module whose steps are written, for its notifications and output
+     * @param {{ onFlush?: function(): void }} options onFlush is called after each write, f.e. to check limits
+     */
+    constructor(path, module, options = {}) {
+        this.path = path;
+        this.module = module;
+        this.onFlush = options.onFlush;
+        this.length = 0;
+        this.stepCount = 0;
+        this.lastValues = new Map();
+        this.file = openSync(path, "w");
+    }
+
+    push(step) {
+        this.length++;
+        const getNotification = id => this.module.getSimulatorNotification?.(id);
+        for (const s of expandDerivedSteps([step], getNotification, this.lastValues)) {
+            this.write(s);
+            this.stepCount++;
+        }
+    }
+
+    close() {
+        try {
+            this.flush();
+        }
+        finally {
+            closeSync(this.file);
+        }
+    }
+}
+
+export class NdjsonTraceWriter extends TraceWriter {
+    constructor(path, module, options = {}) {
+        super(path, module, options);
+        this.lines = [];
+        this.bufferedSize = 0;
+        this.outputEnds = { stdout: 0, stderr: 0 };
+    }
+
+    write(step) {
+        let line;
+        if (step.action === "stdout" || step.action === "stderr") {
+            const text = this.module.simulatorOutput[step.action].slice(this.outputEnds[step.action], step.end);
+            this.outputEnds[step.action] = step.end;
+            line = JSON.stringify({ ...step, text });
+        }
+        else if (step.dataValue instanceof Uint8Array) {
+            line = JSON.stringify({ ...step, dataValue: Array.from(step.dataValue) });
+        }
+        else {
+            line = JSON.stringify(step);
+        }
+        this.lines.push(line);
+        this.bufferedSize += line.length;
+        if (this.bufferedSize >= NDJSON_BUFFER_SIZE) this.flush();
+    }
+
+    flush() {
+        if (this.lines.length === 0) return;
+        writeSync(this.file, this.lines.join("\n") + "\n");
+        this.lines = [];
+        this.bufferedSize = 0;
+        this.onFlush?.();
+    }
+}
+
+export class BinaryTraceWriter extends TraceWriter {
+    constructor(path, module, options = {}) {
+        super(path, module, options);
+        this.buffer = new Uint8Array(BUFFER_RECORDS * RECORD_SIZE);
+        this.view = new DataView(this.buffer.buffer);
+        this.offset = 0;
+        this.data = undefined;
+        this.dataOffset = 0;
+        this.outputEnds = { stdout: { end: 0, byteEnd: 0 }, stderr: { end: 0, byteEnd: 0 } };
+
+        const header = new Uint8Array(HEADER_SIZE);
+        header.set(new TextEncoder().encode(BINARY_TRACE_MAGIC));
+        new DataView(header.buffer).setUint32(8, RECORD_SIZE, true);
+        writeSync(this.file, header);
+    }
+
+    write(step) {
+        let id = step.id;
+        let value = step.dataValue;
+        if (step.action === "stdout" || step.action === "stderr") {
+            id = step.action === "stdout" ? STDOUT_ID : STDERR_ID;
+            value = this.getOutputByteEnd(step.action, step.end);
+        }
+        else if (value instanceof Uint8Array) {
+            id = (id | AGGREGATE_FLAG) >>> 0;
+            value = this.writeData(value);
+        }
+        this.view.setUint32(this.offset, id, true);
+        this.view.setUint32(this.offset + 4, step.address ?? 0, true);
+        this.view.setFloat64(this.offset + 8, Number(value), true);
+        this.offset += RECORD_SIZE;
+        if (this.offset === this.buffer.length) this.flush();
+    }
+
+    // Output files are UTF-8, so the end offsets of output steps are converted from string offsets
+    getOutputByteEnd(stream, end) {
+        const text = this.module.simulatorOutput[stream].slice(this.outputEnds[stream].end, end);
+        this.outputEnds[stream] = { end, byteEnd: this.outputEnds[stream].byteEnd + Buffer.byteLength(text) };
+        return this.outputEnds[stream].byteEnd;
+    }
+
+    writeData(bytes) {
+        if (this.data === undefined) this.data = openSync(this.path + ".data", "w");
+        const length = new Uint8Array(4);
+        new DataView(length.buffer).setUint32(0, bytes.length, true);
+        writeSync(this.data, length);
+        writeSync(this.data, bytes);
+        const offset = this.dataOffset + 4;
+        this.dataOffset = offset + bytes.length;
+        return offset;
+    }
+
+    flush() {
+        if (this.offset === 0) return;
+        writeSync(this.file, this.buffer, 0, this.offset);
+        this.offset = 0;
+        this.onFlush?.();
+    }
+
+    close() {
+        try {
+            super.close();
+        }
+        finally {
+            if (this.data !== undefined) closeSync(this.data);
+        }
+        const output = this.module.simulatorOutput ?? { stdout: "", stderr: "" };
+        for (const stream of ["stdout", "stderr"]) {
+            const file = openSync(`${this.path}.${stream}`, "w");
+            writeSync(file, output[stream]);
+            closeSync(file);
+        }
+    }
+}
+
+/**
+ * @param {"ndjson"|"binary"} format
+ * @param {string} path
+ * @param {object} module
+ * @param {{ onFlush?: function(): void }} options
+ * @returns {NdjsonTraceWriter|BinaryTraceWriter}
+ */
+export function createTraceWriter(format, path, module, options = {}) {
+    switch (format) {
+        case "ndjson": return new NdjsonTraceWriter(path, module, options);
+        case "binary": return new BinaryTraceWriter(path, module, options);
+        default: throw new Error(`Unknown trace format ${format}`);
+    }
+}
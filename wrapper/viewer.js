@@ -0,0 +1,245 @@
+/**
+ * Renders a simulation into existing elements, patching only what changed since the previous step:
+ * lines of evaluated code, the highlighted statement, the tail of the output and rows of changed variables.
+ * Code is highlighted as a whole when it changes, stepping highlights only the lines of evaluated expressions,
+ * extended to whole comments, literals and continued lines so the highlighter sees them from their start.
+ */
+const LINE_CLASS = "simulation-line";
+const HIGHLIGHTED_CLASS = "simulation-highlighted";
+// Highlighted blocks of lines kept, the cache is cleared when it grows past this
+const MAX_CACHED_BLOCKS = 10000;
+
+export function escapeHtml(text) {
+    return text
+        .replace(/&/g, "&amp;")
+        .replace(/</g, "&lt;")
+        .replace(/>/g, "&gt;")
+        .replace(/"/g, "&quot;")
+        .replace(/'/g, "&#039;");
+}
+
+/**
+ * Splits highlighted HTML into the HTML of each line, elements spanning line breaks are closed at the end of
+ * each line and opened again at the start of the next one
+ * @param {string} html
+ * @returns {string[]}
+ */
+export function splitHtmlLines(html) {
+    const lines = [];
+    const openTags = [];
+    let line = "";
+    let index = 0;
+    for (const match of html.matchAll(/<(\/?)([A-Za-z][\w-]*)[^>]*>|\n/g)) {
+        line += html.slice(index, match.index);
+        index = match.index + match[0].length;
+        if (match[0] === "\n") {
+            lines.push(line + openTags.map(([name]) => `</${name}>`).reverse().join(""));
+            line = openTags.map(([, tag]) => tag).join("");
+            continue;
+        }
+        if (match[1]) openTags.pop();
+        else if (!match[0].endsWith("/>")) openTags.push([match[2], match[0]]);
+        line += match[0];
+    }
+    lines.push(line + html.slice(index));
+    return lines;
+}
+
+/**
+ * Returns for each line of C code whether it starts outside of comments, literals and continued lines,
+ * so highlighting it does not depend on the lines before it
+ * @param {string[]} lines
+ * @returns {boolean[]}
+ */
+export function getTokenBoundaries(lines) {
+    const boundaries = [];
+    // "code", "block" or "line" comment, or the quote of a literal
+    let state = "code";
+    let continued = false;
+    for (const line of lines) {
+        boundaries.push(state === "code" && !continued);
+        for (let i = 0; i < line.length && state !== "line"; i++) {
+            const c = line[i];
+            if (state === "block") {
+                if (c === "*" && line[i + 1] === "/") {
+                    state = "code";
+                    i++;
+                }
+            }
+            else if (state === "code") {
+                if (c === "/" && (line[i + 1] === "*" || line[i + 1] === "/")) {
+                    state = line[i + 1] === "*" ? "block" : "line";
+                    i++;
+                }
+                else if (c === '"' || c === "'") state = c;
+            }
+            else if (c === "\\") i++;
+            else if (c === state) state = "code";
+        }
+        continued = line.endsWith("\\");
+        if (!continued && state !== "block") state = "code";
+    }
+    return boundaries;
+}
+
+// Pads lines with empty ones or joins the last ones, so they replace count lines of code
+function fitLines(lines, count) {
+    if (lines.length > count) return [...lines.slice(0, count - 1), lines.slice(count - 1).join("")];
+    return [...lines, ...Array(count - lines.length).fill("")];
+}
+
+export class SimulationViewer {
+    /**
+     * @param {{ code: Element, output?: Element, variables?: Element }} elements
+     * code receives a span per line, variables is a table body receiving a row per variable
+     * @param {{ highlight?: function(string): string }} options
+     * highlight returns the HTML of lines of code, f.e. code => hljs.highlight(code, { language: "c" }).value
+     */
+    constructor(elements, options = {}) {
+        this.elements = elements;
+        this.document = elements.code.ownerDocument;
+        this.highlight = options.highlight ?? escapeHtml;
+        this.highlightCache = new Map();
+        this.code = undefined;
+        this.codeLines = [];
+        this.codeHtml = [];
+        this.boundaries = [];
+        this.lineElements = [];
+        this.lineHtml = [];
+        // Lines (1-based) showing evaluated code instead of codeHtml
+        this.patch = undefined;
+        this.highlightedLines = [];
+        this.outputText = undefined;
+        this.outputNode = undefined;
+        /** @type {Map<string, { row: Element, cells: Element[], values: string[] }>} */
+        this.variableRows = new Map();
+    }
+
+    /**
+     * @param {import('./wrapper.js').default} simulation
+     */
+    render(simulation) {
+        this.renderCode(simulation.getCode(), simulation.getEvaluatedLines());
+        this.renderHighlight(simulation.getHighlightedLocation());
+        if (this.elements.output) this.renderOutput(simulation.getOutput());
+        if (this.elements.variables) this.renderVariables(simulation.getVariables());
+    }
+
+    getBlockHtml(code) {
+        let html = this.highlightCache.get(code);
+        if (html === undefined) {
+            if (this.highlightCache.size >= MAX_CACHED_BLOCKS) this.highlightCache.clear();
+            html = this.highlight(code);
+            this.highlightCache.set(code, html);
+        }
+        return html;
+    }
+
+    /**
+     * @param {string} code
+     * @param {{ firstLine: number, lastLine: number, lines: string[] }|undefined} evaluated lines of code replaced by evaluated ones
+     */
+    renderCode(code, evaluated) {
+        if (code !== this.code) {
+            this.code = code;
+            this.codeLines = code.split("\n");
+            this.codeHtml = splitHtmlLines(this.highlight(code));
+            this.boundaries = getTokenBoundaries(this.codeLines);
+            this.highlightCache.clear();
+            this.resizeLines(this.codeLines.length);
+            // Every line is written from codeHtml
+            this.patch = { firstLine: 1, lastLine: this.codeLines.length };
+        }
+
+        let patch = undefined;
+        if (evaluated !== undefined) {
+            let firstLine = evaluated.firstLine;
+            while (firstLine > 1 && !this.boundaries[firstLine - 1]) firstLine--;
+            let lastLine = evaluated.lastLine;
+            while (lastLine < this.codeLines.length && !this.boundaries[lastLine]) lastLine++;
+            const lines = [...this.codeLines.slice(firstLine - 1, evaluated.firstLine - 1), ...evaluated.lines, ...this.codeLines.slice(evaluated.lastLine, lastLine)];
+            patch = { firstLine, lastLine, html: fitLines(splitHtmlLines(this.getBlockHtml(lines.join("\n"))), lastLine - firstLine + 1) };
+        }
+
+        if (this.patch !== undefined) {
+            for (let line = this.patch.firstLine; line <= this.patch.lastLine; line++) {
+                if (patch === undefined || line < patch.firstLine || line > patch.lastLine) this.writeLine(line - 1, this.codeHtml[line - 1] ?? "");
+            }
+        }
+        patch?.html.forEach((html, i) => this.writeLine(patch.firstLine - 1 + i, html));
+        this.patch = patch;
+    }
+
+    resizeLines(count) {
+        const code = this.elements.code;
+        while (this.lineElements.length < count) {
+            if (this.lineElements.length > 0) code.appendChild(this.document.createTextNode("\n"));
+            const element = this.document.createElement("span");
+            element.className = LINE_CLASS;
+            code.appendChild(element);
+            this.lineElements.push(element);
+            this.lineHtml.push(undefined);
+        }
+        while (this.lineElements.length > count) {
+            code.removeChild(this.lineElements.pop());
+            this.lineHtml.pop();
+            if (this.lineElements.length > 0) code.removeChild(code.lastChild);
+        }
+    }
+
+    writeLine(index, html) {
+        if (this.lineHtml[index] === html) return;
+        this.lineElements[index].innerHTML = html;
+        this.lineHtml[index] = html;
+    }
+
+    renderHighlight(location) {
+        const lines = [];
+        if (location !== undefined) {
+            for (let line = location[0]; line <= location[2]; line++) lines.push(line - 1);
+        }
+        for (const line of this.highlightedLines) this.lineElements[line]?.classList.remove(HIGHLIGHTED_CLASS);
+        for (const line of lines) this.lineElements[line]?.classList.add(HIGHLIGHTED_CLASS);
+        this.highlightedLines = lines;
+    }
+
+    renderOutput(text) {
+        // Output only grows while stepping forward, so only its tail is appended
+        if (this.outputNode !== undefined && text.startsWith(this.outputText)) {
+            if (text.length > this.outputText.length) this.outputNode.appendData(text.slice(this.outputText.length));
+        }
+        else {
+            this.elements.output.textContent = "";
+            this.outputNode = this.elements.output.appendChild(this.document.createTextNode(text));
+        }
+        this.outputText = text;
+    }
+
+    renderVariables(variables) {
+        const body = this.elements.variables;
+        const identifiers = new Set();
+        for (const variable of variables) {
+            identifiers.add(variable.identifier);
+            const values = [variable.identifier, variable.dataType, `${variable.dataValue}`];
+            let row = this.variableRows.get(variable.identifier);
+            if (row === undefined) {
+                const element = this.document.createElement("tr");
+                row = { row: element, cells: values.map(() => element.appendChild(this.document.createElement("td"))), values: [] };
+                this.variableRows.set(variable.identifier, row);
+                body.appendChild(element);
+            }
+            values.forEach((value, i) => {
+                if (row.values[i] === value) return;
+                row.cells[i].textContent = value;
+                row.values[i] = value;
+            });
+        }
+        for (const [identifier, row] of this.variableRows) {
+            if (identifiers.has(identifier)) continue;
+            body.removeChild(row.row);
+            this.variableRows.delete(identifier);
+        }
+    }
+}
+
+export default SimulationViewer;
@@ -0,0 +1,121 @@
+import assert from 'assert';
+import { SimulationViewer, getTokenBoundaries, splitHtmlLines } from './viewer.js';
+
+// Just enough of the DOM for the viewer, recording which nodes were written
+class FakeNode {
+  constructor(document, tagName) {
+    this.ownerDocument = document;
+    this.tagName = tagName;
+    this.childNodes = [];
+    this.className = "";
+    this.classes = new Set();
+    this.classList = { add: c => this.classes.add(c), remove: c => this.classes.delete(c) };
+    this.writes = 0;
+  }
+  get lastChild() { return this.childNodes[this.childNodes.length - 1]; }
+  appendChild(node) { this.childNodes.push(node); return node; }
+  removeChild(node) { this.childNodes.splice(this.childNodes.indexOf(node), 1); return node; }
+  set innerHTML(html) { this.html = html; this.writes++; }
+  get innerHTML() { return this.html; }
+  set textContent(text) { this.childNodes = []; this.text = text; this.writes++; }
+  get textContent() { return this.childNodes.length ? this.childNodes.map(n => n.textContent).join("") : this.text ?? ""; }
+}
+class FakeText {
+  constructor(data) { this.data = data; }
+  appendData(data) { this.data += data; }
+  get textContent() { return this.data; }
+}
+class FakeDocument {
+  createElement(tagName) { return new FakeNode(this, tagName); }
+  createTextNode(data) { return new FakeText(data); }
+}
+
+// Marks block comments in italics and wraps the rest in bold, like a highlighter keeping its state across lines
+function highlight(code) {
+  return `<b>${code.replace(/\/\*[\s\S]*?\*\//g, "<i>$&</i>")}</b>`;
+}
+
+function createViewer() {
+  const document = new FakeDocument();
+  const elements = { code: document.createElement("code"), output: document.createElement("pre"), variables: document.createElement("tbody") };
+  const highlighted = [];
+  const viewer = new SimulationViewer(elements, { highlight: code => { highlighted.push(code); return highlight(code); } });
+  return { viewer, elements, highlighted };
+}
+
+function createSimulation(states) {
+  return {
+    step: 0,
+    getCode() { return states[this.step].code; },
+    getEvaluatedLines() { return states[this.step].evaluated; },
+    getHighlightedLocation() { return states[this.step].location; },
+    getOutput() { return states[this.step].output; },
+    getVariables() { return states[this.step].variables; }
+  };
+}
+
+describe('SimulationViewer', function() {
+  it('only patches changed lines, output and variables', function() {
+    const { viewer, elements, highlighted } = createViewer();
+    const simulation = createSimulation([
+      { code: "int x = 1;\nx = 2;\nreturn x;", location: [1, 1, 1, 10], output: "> a\n", variables: [{ identifier: "x", dataType: "int", dataValue: 1 }] },
+      { code: "int x = 1;\nx = 2;\nreturn x;", evaluated: { firstLine: 3, lastLine: 3, lines: ["return 2;"] }, location: [3, 1, 3, 8], output: "> a\n2", variables: [{ identifier: "x", dataType: "int", dataValue: 2 }] },
+      { code: "int x = 1;\nx = 2;\nreturn x;", location: [2, 1, 2, 6], output: "> b\n", variables: [] }
+    ]);
+
+    viewer.render(simulation);
+    const [xRow] = elements.variables.childNodes;
+    simulation.step = 1;
+    viewer.render(simulation);
+
+    const lines = elements.code.childNodes.filter(n => n instanceof FakeNode);
+    assert.deepEqual(lines.map(l => [l.html, l.writes]), [["<b>int x = 1;</b>", 1], ["<b>x = 2;</b>", 1], ["<b>return 2;</b>", 2]]);
+    assert.deepEqual(lines.map(l => l.classes.has("simulation-highlighted")), [false, false, true]);
+    assert.equal(elements.output.textContent, "> a\n2");
+    assert.equal(elements.output.writes, 1);
+    assert.deepEqual(xRow.childNodes.map(c => [c.text, c.writes]), [["x", 1], ["int", 1], ["2", 2]]);
+
+    simulation.step = 2;
+    viewer.render(simulation);
+
+    assert.deepEqual(highlighted, ["int x = 1;\nx = 2;\nreturn x;", "return 2;"]);
+    assert.deepEqual(lines.map(l => [l.html, l.writes]), [["<b>int x = 1;</b>", 1], ["<b>x = 2;</b>", 1], ["<b>return x;</b>", 3]]);
+    assert.equal(elements.output.textContent, "> b\n");
+    assert.equal(elements.variables.childNodes.length, 0);
+  });
+  it('adds and removes lines as the code changes length', function() {
+    const { viewer, elements } = createViewer();
+    const simulation = createSimulation([{ code: "a\nb\nc", output: "", variables: [] }, { code: "a", output: "", variables: [] }, { code: "a\nd", output: "", variables: [] }]);
+
+    for (const step of [0, 1, 2]) {
+      simulation.step = step;
+      viewer.render(simulation);
+    }
+
+    assert.deepEqual(elements.code.childNodes.map(n => n instanceof FakeNode ? n.html : n.data), ["<b>a</b>", "\n", "<b>d</b>"]);
+  });
+  it('highlights evaluated lines from the start of the comment they continue', function() {
+    const { viewer, elements, highlighted } = createViewer();
+    const code = "int x = 1; /* first\nsecond */ x = x + 1;\nreturn x;";
+    const simulation = createSimulation([
+      { code, output: "", variables: [] },
+      { code, evaluated: { firstLine: 2, lastLine: 2, lines: ["second */ x = 2;"] }, output: "", variables: [] }
+    ]);
+
+    viewer.render(simulation);
+    simulation.step = 1;
+    viewer.render(simulation);
+
+    const lines = elements.code.childNodes.filter(n => n instanceof FakeNode);
+    assert.deepEqual(highlighted, [code, "int x = 1; /* first\nsecond */ x = 2;"]);
+    assert.deepEqual(lines.map(l => [l.html, l.writes]), [
+      ["<b>int x = 1; <i>/* first</i></b>", 1], ["<b><i>second */</i> x = 2;</b>", 2], ["<b>return x;</b>", 1]
+    ]);
+  });
+  it('finds lines starting outside of comments, literals and continued lines', function() {
+    const lines = ["#define A \\", "  1", "/* a", " b */ char* s = \"//\";", "x = '\"'; // c \\", "  d", "y = 1;"];
+
+    assert.deepEqual(getTokenBoundaries(lines), [true, false, true, false, true, false, true]);
+    assert.deepEqual(splitHtmlLines("<b>a\n<i>b\nc</i></b>\nd"), ["<b>a</b>", "<b><i>b</i></b>", "<b><i>c</i></b>", "d"]);
+  });
+});
@@ -15,14 +15,6 @@ function findLastIndex(array, predicate) {
     return -1;
 }
 
-// Based on https://stackoverflow.com/questions/14446511/most-efficient-method-to-groupby-on-an-array-of-objects
-var groupBy = function(xs, key) {
-    return xs.reduce(function(rv, x) {
-      (rv[x[key]] = rv[x[key]] || []).push(x);
-      return rv;
-    }, {});
-  };
-
 /**
  * 
  * @param {SimulationStep[]} steps 
@@ -73,6 +65,31 @@ export function stepBackward(steps, currentStep, mode) {
  * @param {SimulationStep[]} steps 
  */
 export function getEvaluatedCode(code, steps) {
+    const activeExpressionSteps = getActiveExpressionSteps(steps);
+    return activeExpressionSteps.length ? getEvaluatedCodeInternal(code, activeExpressionSteps) : code;
+}
+
+/**
+ * Returns the only lines in which evaluated code differs from code, those of the evaluated expressions
+ * @param {string[]} lines lines of code
+ * @param {SimulationStep[]} steps
+ * @returns {{ firstLine: number, lastLine: number, lines: string[] }|undefined} evaluated lines replacing lines firstLine to lastLine (1-based),
+ * undefined when no expression is evaluated
+ */
+export function getEvaluatedLines(lines, steps) {
+    const activeExpressionSteps = getActiveExpressionSteps(steps);
+    if (!activeExpressionSteps.length) return undefined;
+
+    // Expressions are evaluated within the lines, so only they are passed on
+    const firstLine = Math.min(...activeExpressionSteps.map(s => s.location[0]));
+    const lastLine = Math.max(...activeExpressionSteps.map(s => s.location[2]));
+    const shiftedSteps = activeExpressionSteps.map(s => ({ ...s, location: [s.location[0] - firstLine + 1, s.location[1], s.location[2] - firstLine + 1, s.location[3]] }));
+    const code = lines.slice(firstLine - 1, lastLine).join("\n");
+    return { firstLine, lastLine, lines: getEvaluatedCodeInternal(code, shiftedSteps).split("\n") };
+}
+
+// Returns the expression steps of the last statement not encompassed by later ones, in order of their location
+function getActiveExpressionSteps(steps) {
     // Filters out steps with encompased by other steps
     const lastStatementIndex = steps.findLastIndex(s => s.action === "stat");
     const lastStatementSteps = lastStatementIndex !== -1 ? steps.slice(lastStatementIndex) : steps;
@@ -85,8 +102,7 @@ export function getEvaluatedCode(code, steps) {
     activeExpressionSteps.sort(
         (s1, s2) => (s1.location[0] == s2.location[0]) ?  s1.location[1] - s2.location[1] : s1.location[0] - s2.location[0]
     );
-
-    return activeExpressionSteps.length ? getEvaluatedCodeInternal(code, activeExpressionSteps) : code;
+    return activeExpressionSteps;
 }
 
 // Calculates evaluated code from a list of ordered non-overlapping steps
@@ -173,7 +189,7 @@ export function getHighlightedCode(code, steps) {
 }
 
 /**
- * Returns 
+ * Returns output of steps storing their text, see getIndexedOutput for steps storing the end of their text
  * @param {SimulationStep[]} steps 
  */
 export function getOutput(steps) {
@@ -183,24 +199,77 @@ export function getOutput(steps) {
         .join("");
 }
 
+/**
+ * Returns output up to and including a step, from the text of all output and the ascending indexes of output steps
+ * @param {SimulationStep[]} steps 
+ * @param {number[]} outputIndexes 
+ * @param {string} text 
+ * @param {number} step 
+ */
+export function getIndexedOutput(steps, outputIndexes, text, step) {
+    const position = findLastIndexAtOrBefore(outputIndexes, step);
+    return position < 0 ? "" : text.substring(0, steps[outputIndexes[position]].end);
+}
+
+/**
+ * Returns position of the last of ascending indexes at or before index, -1 if there is none
+ * @param {number[]} indexes 
+ * @param {number} index 
+ */
+export function findLastIndexAtOrBefore(indexes, index) {
+    let low = 0;
+    let high = indexes.length;
+    while (low < high) {
+        const middle = (low + high) >>> 1;
+        if (indexes[middle] <= index) low = middle + 1;
+        else high = middle;
+    }
+    return low - 1;
+}
+
 /**
  * Returns list of declared variables with current value
  * @param {SimulationStep[]} steps 
  * @returns { identifier: string,  dataType: string, dataValue: object }
  */
 export function getVariables(steps) {
-    const declarations = steps.filter(s => s.action == 'decl');
-    const assignments = steps.filter(s => s.action == "assign");
+    return getStateVariables(applyVariableSteps(createVariableState(), steps));
+}
 
-    const groupedDeclarations = groupBy(declarations, 'identifier');
-    const lastDeclarations = Object.keys(groupedDeclarations).map(k => {
-        const value = groupedDeclarations[k];
-        return value[value.length - 1];
-    });
-    
-    return lastDeclarations.map(d => {
-        const lastAssignment = [...assignments].reverse().find(s => s.identifier == d.identifier);
-        const currentValue = lastAssignment ?? d;
+/**
+ * Returns variable state before the first step, which applyVariableSteps advances 
+ * @returns {{ declarations: Map<string, SimulationStep>, assignments: Map<string, SimulationStep> }}
+ */
+export function createVariableState() {
+    return { declarations: new Map(), assignments: new Map() };
+}
+
+export function copyVariableState(state) {
+    return { declarations: new Map(state.declarations), assignments: new Map(state.assignments) };
+}
+
+/**
+ * Advances variable state by steps from start up to end (exclusive)
+ * @param {{ declarations: Map<string, SimulationStep>, assignments: Map<string, SimulationStep> }} state 
+ * @param {SimulationStep[]} steps 
+ */
+export function applyVariableSteps(state, steps, start = 0, end = steps.length) {
+    for (let i = start; i < end; i++) {
+        const step = steps[i];
+        if (step.action == 'decl') state.declarations.set(step.identifier, step);
+        else if (step.action == 'assign') state.assignments.set(step.identifier, step);
+    }
+    return state;
+}
+
+/**
+ * Returns list of declared variables with current value, in the order of their first declaration
+ * @param {{ declarations: Map<string, SimulationStep>, assignments: Map<string, SimulationStep> }} state 
+ * @returns { identifier: string,  dataType: string, dataValue: object }
+ */
+export function getStateVariables(state) {
+    return [...state.declarations.values()].map(d => {
+        const currentValue = state.assignments.get(d.identifier) ?? d;
 
         return {
             identifier: d.identifier,
@@ -208,6 +277,33 @@ export function getVariables(steps) {
             dataValue: currentValue.dataValue
         };
     });
-}   
+}
+
+/**
+ * Returns steps with the notifications the rewriter eliminated as redundant, 
+ * each inserted after the step preceding it, with the value of the notification it is derived from
+ * @param {SimulationStep[]} steps 
+ * @param {function(number): object|undefined} getNotification returns notification metadata by id
+ * @param {Map<number, object>} lastValues latest value per notification id, kept when steps arrive in batches
+ * @returns {SimulationStep[]}
+ */
+export function expandDerivedSteps(steps, getNotification, lastValues = new Map()) {
+    const expandedSteps = [];
+    for (const step of steps) {
+        expandedSteps.push(step);
+        if (step.id === undefined) continue;
+
+        lastValues.set(step.id, step.dataValue);
+        for (let id = step.id + 1; ; id++) {
+            const notification = getNotification(id);
+            if (notification === undefined || notification.derivedFrom === undefined) break;
+
+            const dataValue = lastValues.get(notification.derivedFrom);
+            expandedSteps.push({ ...notification, id: id, dataValue: dataValue });
+            lastValues.set(id, dataValue);
+        }
+    }
+    return expandedSteps;
+}
 
-export default { stepForward, stepBackward, getFirstStep, getEvaluatedCode, getHighlightedCode, getOutput, getVariables }
\ No newline at end of file
+export default { stepForward, stepBackward, getFirstStep, getEvaluatedCode, getEvaluatedLines, getHighlightedCode, getOutput, getIndexedOutput, findLastIndexAtOrBefore, getVariables, createVariableState, copyVariableState, applyVariableSteps, getStateVariables, expandDerivedSteps }
\ No newline at end of file
@@ -1,5 +1,5 @@
 import assert from 'assert';
-import { stepForward, stepBackward, getEvaluatedCode, getFirstStep, getVariables, getHighlightedCode } from './wrapper-functions.js';
+import { stepForward, stepBackward, getEvaluatedCode, getEvaluatedLines, getFirstStep, getVariables, getHighlightedCode, expandDerivedSteps, findLastIndexAtOrBefore } from './wrapper-functions.js';
 
 describe("getFirstStep", function() {
   it ('returns undefined when all steps are non-expression', function() {
@@ -293,6 +293,24 @@ describe('getEvaluatedCode', function () {
   });
 });
 
+describe('getEvaluatedLines', function () {
+  it('returns only the lines of evaluated expressions', function () {
+    const lines = ["int main() {", "  int i = 3 * 3;", "  return i +", "    i;", "}"];
+    const steps = [
+      { action: 'stat', location: [3, 3, 4, 5] },
+      { action: 'eval', dataType: "int", dataValue: 9, location: [3, 10, 3, 10] },
+      { action: 'eval', dataType: "int", dataValue: 9, location: [4, 5, 4, 5] }
+    ];
+
+    const actual = getEvaluatedLines(lines, steps);
+    assert.deepEqual(actual, { firstLine: 3, lastLine: 4, lines: ["  return 9 +", "    9;"] });
+    assert.equal(getEvaluatedCode(lines.join("\n"), steps), [...lines.slice(0, 2), ...actual.lines, ...lines.slice(4)].join("\n"));
+  });
+  it('returns undefined without evaluated expressions', function () {
+    assert.equal(getEvaluatedLines(["x = 1;"], [{ action: 'stat', location: [1, 1, 1, 6] }]), undefined);
+  });
+});
+
 describe('getHighlightedCode', function () {
   it('highlights expression in middle (multi-line)', function () {
     const code = "int main() {\n  return 5 * 7 + 6;\n}";
@@ -432,4 +450,55 @@ describe('getVariables', function() {
 
     assert.deepEqual(actual, expected);
   });
-});
\ No newline at end of file
+});
+
+describe('expandDerivedSteps', function() {
+  const notifications = [
+    { action: 'stat' },
+    { action: 'eval', dataType: 'int' },
+    { action: 'eval', dataType: 'int', derivedFrom: 1 },
+    { action: 'eval', dataType: 'int', derivedFrom: 2 },
+    { action: 'eval', dataType: 'int' }
+  ];
+  const getNotification = id => notifications[id];
+
+  it('inserts derived steps after the step preceding them', function() {
+    const steps = [
+      { action: 'stat', id: 0, dataValue: 0 },
+      { action: 'eval', dataType: 'int', id: 1, dataValue: 7 },
+      { action: 'eval', dataType: 'int', id: 4, dataValue: 14 }
+    ];
+    const actual = expandDerivedSteps(steps, getNotification);
+
+    assert.deepEqual(actual.map(s => [s.id, s.dataValue]), [[0, 0], [1, 7], [2, 7], [3, 7], [4, 14]]);
+  });
+  it('uses the latest value of the notification it is derived from', function() {
+    const steps = [
+      { action: 'eval', dataType: 'int', id: 1, dataValue: 7 },
+      { action: 'eval', dataType: 'int', id: 4, dataValue: 14 },
+      { action: 'eval', dataType: 'int', id: 1, dataValue: 8 }
+    ];
+    const actual = expandDerivedSteps(steps, getNotification);
+
+    assert.deepEqual(actual.map(s => s.dataValue), [7, 7, 7, 14, 8, 8, 8]);
+  });
+  it('keeps steps without notification', function() {
+    const steps = [
+      { action: 'stdout', value: 'a' }
+    ];
+    const actual = expandDerivedSteps(steps, getNotification);
+
+    assert.deepEqual(actual, steps);
+  });
+});
+describe('findLastIndexAtOrBefore', function() {
+  it('returns position of the last index at or before index', function() {
+    const indexes = [2, 5, 9];
+
+    assert.equal(findLastIndexAtOrBefore(indexes, 1), -1);
+    assert.equal(findLastIndexAtOrBefore(indexes, 2), 0);
+    assert.equal(findLastIndexAtOrBefore(indexes, 8), 1);
+    assert.equal(findLastIndexAtOrBefore(indexes, 100), 2);
+    assert.equal(findLastIndexAtOrBefore([], 0), -1);
+  });
+});
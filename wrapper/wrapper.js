@@ -5,6 +5,35 @@
  * @property {SimulationStep[]} simulatorSteps
  */
 import functions from './wrapper-functions.js'
+import { MemoryCheckpoints, applyAssignments } from './memory-checkpoints.js'
+import { StepIndex, findAdjacentIndex } from './step-index.js'
+import { getCoverage } from './coverage.js'
+
+const DEFAULT_BATCH_SIZE = 500;
+const DEFAULT_MAX_STEPS = 1000000;
+const DEFAULT_TIMEOUT = 10000;
+const DEFAULT_CHUNK_SIZE = 100;
+// Variable state is kept every CHECKPOINT_INTERVAL steps, so no query replays more steps than that
+const CHECKPOINT_INTERVAL = 1000;
+
+async function createWorker() {
+    if (typeof Worker === "function") 
+        return new Worker(new URL("./simulation-worker.js", import.meta.url));
+
+    const { Worker: NodeWorker } = await import(/* webpackIgnore: true */ "worker_threads");
+    return new NodeWorker(new URL("./simulation-worker.js", import.meta.url));
+}
+
+function onWorkerMessage(worker, listener) {
+    if (typeof worker.on === "function") {
+        worker.on("message", listener);
+        worker.on("error", e => listener({ type: "error", message: e.message }));
+    }
+    else {
+        worker.onmessage = event => listener(event.data);
+        worker.onerror = event => listener({ type: "error", message: event.message });
+    }
+}
 
 class Simulation {
     /**
@@ -16,18 +45,186 @@ class Simulation {
         this.allSteps = [];
         this.currentStep = undefined;
         this.isRunning = false; 
+        this.isComplete = false;
+        this.exitCode = undefined;
         this.module = module;
+        this.checkpoints = [];
+        this.memoryCheckpoints = undefined;
+        // Text of all output per stream, steps store where their output ends (see rewriter/output-capture.js)
+        this.output = undefined;
+        this.stepIndex = new StepIndex();
+        this.execution = undefined;
+        this.resumption = undefined;
+    }
+
+    /**
+     * Checkpoints linear memory every interval steps of the following run or runOnDemand, see getMemory
+     * @param {number} interval
+     */
+    recordMemory(interval) {
+        this.memoryCheckpoints = new MemoryCheckpoints();
+        this.module.simulatorCheckpointInterval = interval;
+        this.module.onSimulatorCheckpoint = (stepCount, memory) => this.memoryCheckpoints.record(stepCount, memory);
     }
 
     run() {
         if (!this.isRunning) {
             this.isRunning = true;
-            this.module._main();
-            
-            this.code = this.module.simulatorCode;
-            this.allSteps = this.module.simulatorSteps;
-            this.currentStep = 0;
+            try {
+                this.exitCode = this.module._main();
+            }
+            finally {
+                // Steps up to a failure are kept, so failing runs can be explored too,
+                // including those trace buffer builds still hold in linear memory (see library.js)
+                this.module.flushSimulatorSteps?.();
+                this.code = this.module.simulatorCode;
+                this.output = this.module.simulatorOutput;
+                this.allSteps = this.module.getSimulatorNotification !== undefined
+                    ? functions.expandDerivedSteps(this.module.simulatorSteps ?? [], id => this.module.getSimulatorNotification(id))
+                    : this.module.simulatorSteps ?? [];
+                this.currentStep = 0;
+                this.isComplete = true;
+                this.stepIndex.update(this.allSteps);
+            }
+        }
+    }
+
+    /**
+     * Runs the program in a worker, so steps can be explored while later batches are still running
+     * @param {string} moduleUrl URL of the Emscripten output, or its path under Node
+     * @param {{ batchSize?: number, maxSteps?: number, timeout?: number, onSteps?: function(Simulation): void }} options
+     * timeout is the wall-clock limit in milliseconds, after which the worker is terminated
+     * @returns {Promise<void>} resolves when the program finished, rejects when it failed or timed out
+     */
+    async runInWorker(moduleUrl, options = {}) {
+        if (this.isRunning) return;
+        this.isRunning = true;
+        this.allSteps = [];
+        this.currentStep = 0;
+        this.output = { stdout: "", stderr: "" };
+
+        const timeout = options.timeout ?? DEFAULT_TIMEOUT;
+        const worker = await createWorker();
+        return new Promise((resolve, reject) => {
+            const finish = error => {
+                clearTimeout(watchdog);
+                worker.terminate();
+                this.isComplete = true;
+                if (error) reject(error);
+                else resolve();
+            };
+            const watchdog = setTimeout(() => finish(new Error(`Program did not finish within ${timeout} ms`)), timeout);
+
+            onWorkerMessage(worker, message => {
+                if (this.isComplete) return;
+                switch (message.type) {
+                    case "code":
+                        this.code = message.code;
+                        break;
+                    case "steps":
+                        for (const step of message.steps) this.allSteps.push(step);
+                        this.output.stdout += message.output?.stdout ?? "";
+                        this.output.stderr += message.output?.stderr ?? "";
+                        options.onSteps?.(this);
+                        break;
+                    case "done":
+                        finish();
+                        break;
+                    case "error":
+                        finish(new Error(message.message));
+                        break;
+                }
+            });
+            worker.postMessage({
+                type: "run",
+                moduleUrl: moduleUrl,
+                batchSize: options.batchSize ?? DEFAULT_BATCH_SIZE,
+                maxSteps: options.maxSteps ?? DEFAULT_MAX_STEPS
+            });
+        });
+    }
+
+    /**
+     * Starts the program of an Asyncify build (see rewrite.py --pause-on-demand), which pauses in notify
+     * every chunkSize steps, so it only runs as far as stepping forward requires
+     * @param {{ chunkSize?: number, maxSteps?: number }} options
+     */
+    async runOnDemand(options = {}) {
+        if (this.isRunning) return;
+        this.isRunning = true;
+        this.chunkSize = options.chunkSize ?? DEFAULT_CHUNK_SIZE;
+        this.module.simulatorMaxSteps = options.maxSteps ?? DEFAULT_MAX_STEPS;
+        this.code = this.module.simulatorCode;
+        this.output = this.module.simulatorOutput;
+        this.allSteps = [];
+        this.currentStep = 0;
+
+        const simulation = this;
+        const lastValues = new Map();
+        const getNotification = id => this.module.getSimulatorNotification?.(id);
+        this.module.simulatorSteps = {
+            length: 0,
+            push(step) {
+                this.length++;
+                for (const s of functions.expandDerivedSteps([step], getNotification, lastValues)) simulation.allSteps.push(s);
+            }
+        };
+        await this.resume();
+    }
+
+    /**
+     * Runs the paused program for another chunk of steps
+     * @returns {Promise<void>} resolves when the program paused again or finished
+     */
+    resume() {
+        if (this.isComplete) return Promise.resolve();
+        if (this.resumption !== undefined) return this.resumption.promise;
+
+        const resumption = {};
+        resumption.promise = new Promise((resolve, reject) => {
+            resumption.resolve = resolve;
+            resumption.reject = reject;
+        });
+        this.resumption = resumption;
+
+        this.module.simulatorPauseAt = this.module.simulatorSteps.length + this.chunkSize;
+        this.module.onSimulatorPause = () => this.settleResumption();
+        try {
+            if (this.execution === undefined) {
+                this.execution = Promise.resolve(this.module.ccall("main", "number", [], [], { async: true }));
+                this.execution.then(() => this.settleResumption(undefined, true), e => this.settleResumption(e, true));
+            }
+            else {
+                this.module.simulatorResume();
+            }
+        }
+        catch (e) {
+            this.settleResumption(e, true);
+        }
+        return resumption.promise;
+    }
+
+    settleResumption(error, isComplete = false) {
+        const resumption = this.resumption;
+        this.resumption = undefined;
+        this.isComplete = this.isComplete || isComplete;
+        if (resumption === undefined) return;
+        if (error) resumption.reject(error);
+        else resumption.resolve();
+    }
+
+    /**
+     * Steps forward like stepForward, resuming a program started with runOnDemand until the next step exists
+     * @returns {Promise<boolean>}
+     */
+    async stepForwardOnDemand(mode) {
+        let nextStep = functions.stepForward(this.allSteps, this.currentStep, mode || "expression");
+        while (nextStep === undefined && this.execution !== undefined && !this.isComplete) {
+            await this.resume();
+            nextStep = functions.stepForward(this.allSteps, this.currentStep, mode || "expression");
         }
+        if (nextStep !== undefined) this.currentStep = nextStep;
+        return !!nextStep;
     }
 
     stepForward(mode) {
@@ -47,20 +244,179 @@ class Simulation {
     }
 
     getEvaluatedCode() {
-        return functions.getEvaluatedCode(this.code, this.allSteps.slice(0, this.currentStep + 1));
+        return functions.getEvaluatedCode(this.code, this.getStatementSteps());
+    }
+
+    /**
+     * Returns only the lines of evaluated code differing from code, see getEvaluatedLines of wrapper-functions.js
+     * @returns {{ firstLine: number, lastLine: number, lines: string[] }|undefined}
+     */
+    getEvaluatedLines() {
+        if (this.codeLines?.code !== this.code) this.codeLines = { code: this.code, lines: this.code.split("\n") };
+        return functions.getEvaluatedLines(this.codeLines.lines, this.getStatementSteps());
     }
 
     getHighlightedCode() {
-        return functions.getHighlightedCode(this.code, this.allSteps.slice(0, this.currentStep + 1)); 
+        return functions.getHighlightedCode(this.code, this.getStatementSteps()); 
+    }
+
+    /**
+     * Returns the location of the current statement, undefined before the first one
+     * @returns {number[]|undefined}
+     */
+    getHighlightedLocation() {
+        const steps = this.getStatementSteps();
+        return steps[0]?.action === "stat" ? steps[0].location : undefined;
+    }
+
+    /**
+     * Returns steps from the current statement up to the current step, the only ones evaluated code depends on
+     */
+    getStatementSteps() {
+        const statements = this.getStepIndex().getActionSteps("stat");
+        const start = statements[functions.findLastIndexAtOrBefore(statements, this.currentStep)] ?? 0;
+        return this.allSteps.slice(start, this.currentStep + 1);
     }
 
     getOutput() {
         const prefix = "> program.exe\n";
-        return prefix + functions.getOutput(this.allSteps.slice(0, this.currentStep + 1))
+        if (this.output === undefined) return prefix + functions.getOutput(this.allSteps.slice(0, this.currentStep + 1));
+
+        const outputIndexes = this.getStepIndex().getActionSteps("stdout");
+        return prefix + functions.getIndexedOutput(this.allSteps, outputIndexes, this.output.stdout, this.currentStep);
+    }
+
+    /**
+     * Returns the index of steps, indexing the steps added since the previous call
+     * @returns {StepIndex}
+     */
+    getStepIndex() {
+        return this.stepIndex.update(this.allSteps);
+    }
+
+    /**
+     * Returns lines with expression steps, f.e. to mark where runToLine can stop
+     * @returns {number[]}
+     */
+    getExecutedLines() {
+        return this.getStepIndex().getLines();
+    }
+
+    /**
+     * Moves to the next or previous expression step on a line
+     * @param {number} line
+     * @param {"forward"|"backward"} direction
+     * @returns {boolean} whether there is such a step
+     */
+    runToLine(line, direction = "forward") {
+        return this.moveToStep(findAdjacentIndex(this.getStepIndex().getLineSteps(line), this.currentStep, direction));
+    }
+
+    /**
+     * Moves to the next or previous declaration of an identifier, or assignment changing its value
+     * @param {string} identifier
+     * @param {"forward"|"backward"} direction
+     * @returns {boolean} whether there is such a step
+     */
+    runUntilChanged(identifier, direction = "forward") {
+        const indexes = this.getStepIndex().getIdentifierSteps(identifier);
+        const isChange = position => {
+            const step = this.allSteps[indexes[position]];
+            return position === 0 || step.action === "decl" || !Object.is(step.dataValue, this.allSteps[indexes[position - 1]].dataValue);
+        };
+        return this.moveToStep(this.findIndexedStep(indexes, direction, isChange));
+    }
+
+    /**
+     * Moves to the next or previous step satisfying predicate. Only the steps of identifier or line are tested when given, 
+     * expression steps otherwise, f.e. runUntil(s => s.dataValue === 5, { identifier: "i" }) finds where i becomes 5
+     * @param {function(SimulationStep): boolean} predicate
+     * @param {{ direction?: "forward"|"backward", identifier?: string, line?: number }} options
+     * @returns {boolean} whether there is such a step
+     */
+    runUntil(predicate, options = {}) {
+        const stepIndex = this.getStepIndex();
+        const indexes = options.identifier !== undefined ? stepIndex.getIdentifierSteps(options.identifier)
+            : options.line !== undefined ? stepIndex.getLineSteps(options.line)
+            : stepIndex.getActionSteps("eval");
+        return this.moveToStep(this.findIndexedStep(indexes, options.direction ?? "forward", position => predicate(this.allSteps[indexes[position]])));
+    }
+
+    /**
+     * Returns the first of indexes after the current step (or the last one before it) at a position satisfying predicate
+     */
+    findIndexedStep(indexes, direction, predicate) {
+        const first = functions.findLastIndexAtOrBefore(indexes, direction === "backward" ? this.currentStep - 1 : this.currentStep);
+        if (direction === "backward") {
+            for (let position = first; position >= 0; position--) {
+                if (predicate(position)) return indexes[position];
+            }
+        }
+        else {
+            for (let position = first + 1; position < indexes.length; position++) {
+                if (predicate(position)) return indexes[position];
+            }
+        }
+        return undefined;
+    }
+
+    moveToStep(index) {
+        if (index === undefined) return false;
+        this.currentStep = index;
+        return true;
+    }
+
+    /**
+     * Returns linear memory at the current step, restored from the nearest checkpoint and the assignments after it.
+     * Memory changed by other means (e.g. library functions) is only exact at checkpoints.
+     * @returns {Uint8Array|undefined} undefined before the first checkpoint
+     */
+    getMemory() {
+        if (this.memoryCheckpoints === undefined) return undefined;
+
+        // Checkpoints count notified steps, derived steps are only inserted by the wrapper
+        const stepIndex = this.getStepIndex();
+        const index = this.memoryCheckpoints.findCheckpoint(stepIndex.getNotifiedStepCount(this.currentStep));
+        if (index < 0) return undefined;
+
+        const start = stepIndex.getStepAfterNotified(this.memoryCheckpoints.checkpoints[index].stepCount);
+        return applyAssignments(this.memoryCheckpoints.getMemory(index), this.allSteps, start, this.currentStep + 1);
+    }
+
+    /**
+     * Returns memory overhead of every checkpoint, in bytes
+     */
+    getMemoryStatistics() {
+        return this.memoryCheckpoints?.getStatistics() ?? [];
+    }
+
+    /**
+     * Returns statement counts and hits per line of a coverage build, undefined for tracing builds
+     */
+    getCoverage() {
+        return getCoverage(this.module);
     }
 
     getVariables() {
-        return functions.getVariables(this.allSteps.slice(0, this.currentStep + 1))
+        return functions.getStateVariables(this.getVariableState(this.currentStep + 1));
+    }
+
+    /**
+     * Returns variable state after stepCount steps, starting from the nearest checkpoint before it.
+     * Steps are only ever appended, so checkpoints stay valid while a program is still running.
+     * @param {number} stepCount
+     */
+    getVariableState(stepCount) {
+        if (this.checkpoints.length === 0) this.checkpoints.push(functions.createVariableState());
+
+        const index = Math.floor(stepCount / CHECKPOINT_INTERVAL);
+        while (this.checkpoints.length <= index) {
+            const last = this.checkpoints.length - 1;
+            const state = functions.copyVariableState(this.checkpoints[last]);
+            this.checkpoints.push(functions.applyVariableSteps(state, this.allSteps, last * CHECKPOINT_INTERVAL, (last + 1) * CHECKPOINT_INTERVAL));
+        }
+        const state = functions.copyVariableState(this.checkpoints[index]);
+        return functions.applyVariableSteps(state, this.allSteps, index * CHECKPOINT_INTERVAL, stepCount);
     }
 
     /**
@@ -0,0 +1,229 @@
+import assert from 'assert';
+import { fileURLToPath } from 'url';
+import Simulation from './wrapper.js';
+import { getVariables } from './wrapper-functions.js';
+
+const countingModulePath = fileURLToPath(new URL('./fixtures/counting-module.js', import.meta.url));
+const printingModulePath = fileURLToPath(new URL('./fixtures/printing-module.js', import.meta.url));
+const endlessModulePath = fileURLToPath(new URL('./fixtures/endless-module.js', import.meta.url));
+
+describe('Simulation.runInWorker', function() {
+  it('streams steps in batches', async function() {
+    const simulation = Simulation.create();
+    const batchSizes = [];
+    await simulation.runInWorker(countingModulePath, { batchSize: 10, onSteps: s => batchSizes.push(s.allSteps.length) });
+
+    assert.equal(simulation.getCode(), "int main() {\n    for (int i = 0; i < 25; i++);\n}");
+    assert.deepEqual(batchSizes, [20, 40, 50]);
+    assert.deepEqual(simulation.allSteps.slice(0, 4).map(s => [s.id, s.dataValue]), [[0, 0], [1, 0], [0, 1], [1, 1]]);
+    assert.ok(simulation.isComplete);
+  });
+  it('streams output along with its steps', async function() {
+    const simulation = Simulation.create();
+    await simulation.runInWorker(printingModulePath, { batchSize: 3 });
+
+    simulation.currentStep = 4;
+    assert.equal(simulation.getOutput(), "> program.exe\n0 1 ");
+    simulation.currentStep = 9;
+    assert.equal(simulation.getOutput(), "> program.exe\n0 1 2 3 4 ");
+  });
+  it('reports too many steps', async function() {
+    const simulation = Simulation.create();
+
+    await assert.rejects(simulation.runInWorker(countingModulePath, { maxSteps: 5 }), /Too many steps/);
+  });
+  it('terminates programs running longer than the timeout', async function() {
+    const simulation = Simulation.create();
+
+    await assert.rejects(simulation.runInWorker(endlessModulePath, { timeout: 200 }), /did not finish within 200 ms/);
+    assert.ok(simulation.isComplete);
+  });
+});
+
+// Pauses like an Asyncify build of library.js, counting to stepCount
+function createOnDemandModule(stepCount) {
+  const module = { simulatorCode: "int main() { }", executedSteps: 0 };
+  module.ccall = async function() {
+    for (let i = 0; i < stepCount; i++) {
+      module.executedSteps++;
+      module.simulatorSteps.push({ action: i % 2 ? 'decl' : 'eval', identifier: 'i', id: 0, dataValue: i });
+      if (module.simulatorSteps.length >= module.simulatorPauseAt)
+        await new Promise(wakeUp => { module.simulatorResume = wakeUp; module.onSimulatorPause(); });
+    }
+    return 0;
+  };
+  return module;
+}
+
+describe('Simulation.runOnDemand', function() {
+  it('only runs as far as stepping requires', async function() {
+    const module = createOnDemandModule(100);
+    const simulation = Simulation.create(module);
+    await simulation.runOnDemand({ chunkSize: 10 });
+
+    assert.equal(module.executedSteps, 10);
+    for (let i = 0; i < 6; i++) assert.ok(await simulation.stepForwardOnDemand());
+
+    assert.equal(simulation.currentStep, 12);
+    assert.equal(module.executedSteps, 20);
+    assert.deepEqual(simulation.getVariables(), [{ identifier: 'i', dataType: undefined, dataValue: 11 }]);
+  });
+  it('completes when the program returns', async function() {
+    const simulation = Simulation.create(createOnDemandModule(15));
+    await simulation.runOnDemand({ chunkSize: 10 });
+
+    while (await simulation.stepForwardOnDemand());
+
+    assert.ok(simulation.isComplete);
+    assert.equal(simulation.currentStep, 14);
+  });
+});
+
+describe('Simulation.getVariables', function() {
+  it('matches replaying all steps across checkpoints', function() {
+    const module = { simulatorCode: "", simulatorSteps: [] };
+    module._main = () => {
+      for (let i = 0; i < 2500; i++)
+        module.simulatorSteps.push({ action: i % 3 ? 'assign' : 'decl', identifier: `v${i % 7}`, dataType: 'int', dataValue: i });
+    };
+    const simulation = Simulation.create(module);
+    simulation.run();
+
+    for (const currentStep of [0, 999, 1000, 1001, 2499]) {
+      simulation.currentStep = currentStep;
+      assert.deepEqual(simulation.getVariables(), getVariables(module.simulatorSteps.slice(0, currentStep + 1)));
+    }
+  });
+});
+
+describe('Simulation.getMemory', function() {
+  it('restores the nearest checkpoint and replays assignments', function() {
+    const memory = new Uint8Array(65536);
+    const module = { simulatorCode: "", simulatorSteps: [] };
+    const notify = step => {
+      if (step.action === 'assign') new DataView(memory.buffer).setInt32(step.address, step.dataValue, true);
+      module.simulatorSteps.push(step);
+      if (module.simulatorSteps.length % module.simulatorCheckpointInterval === 0)
+        module.onSimulatorCheckpoint(module.simulatorSteps.length, memory);
+    };
+    module._main = () => {
+      for (let i = 0; i < 10; i++) notify({ action: 'assign', dataType: 'int', identifier: 'x', address: 4 * (i % 3), dataValue: i + 1 });
+    };
+    const simulation = Simulation.create(module);
+    simulation.recordMemory(4);
+    simulation.run();
+
+    simulation.currentStep = 2;
+    assert.equal(simulation.getMemory(), undefined);
+    simulation.currentStep = 5;
+    assert.deepEqual(Array.from(new Int32Array(simulation.getMemory().buffer, 0, 3)), [4, 5, 6]);
+    simulation.currentStep = 9;
+    assert.deepEqual(Array.from(new Int32Array(simulation.getMemory().buffer, 0, 3)), [10, 8, 9]);
+    assert.deepEqual(simulation.getMemoryStatistics().map(s => s.stepCount), [4, 8]);
+  });
+});
+
+describe('Simulation.getOutput', function() {
+  it('returns output up to the current step', function() {
+    const module = { simulatorCode: "", simulatorSteps: [], simulatorOutput: { stdout: "", stderr: "" } };
+    const write = (stream, text) => {
+      module.simulatorOutput[stream] += text;
+      module.simulatorSteps.push({ action: stream, end: module.simulatorOutput[stream].length });
+    };
+    module._main = () => {
+      write('stdout', 'a');
+      module.simulatorSteps.push({ action: 'stat' });
+      write('stderr', 'error\n');
+      write('stdout', 'b\n');
+    };
+    const simulation = Simulation.create(module);
+    simulation.run();
+
+    assert.equal(simulation.getOutput(), "> program.exe\na");
+    simulation.currentStep = 2;
+    assert.equal(simulation.getOutput(), "> program.exe\na");
+    simulation.currentStep = 3;
+    assert.equal(simulation.getOutput(), "> program.exe\nab\n");
+  });
+  it('supports steps storing their output', function() {
+    const module = { simulatorCode: "", simulatorSteps: [] };
+    module._main = () => module.simulatorSteps.push({ action: 'stdout', value: 'a\n' });
+    const simulation = Simulation.create(module);
+    simulation.run();
+
+    assert.equal(simulation.getOutput(), "> program.exe\na\n");
+  });
+});
+
+describe('Simulation watchpoints', function() {
+  // for (int i = 0; i < 3; i++) x = i / 2;
+  function createLoopSimulation() {
+    const module = { simulatorCode: "", simulatorSteps: [] };
+    module._main = () => {
+      module.simulatorSteps.push({ action: 'decl', identifier: 'x', dataValue: 0 });
+      module.simulatorSteps.push({ action: 'decl', identifier: 'i', dataValue: 0 });
+      for (let i = 0; i < 3; i++) {
+        module.simulatorSteps.push({ action: 'eval', location: [2, 5, 2, 9], dataValue: Math.floor(i / 2) });
+        module.simulatorSteps.push({ action: 'assign', identifier: 'x', location: [2, 1, 2, 9], dataValue: Math.floor(i / 2) });
+        module.simulatorSteps.push({ action: 'eval', location: [1, 30, 1, 32], dataValue: i });
+        module.simulatorSteps.push({ action: 'assign', identifier: 'i', location: [1, 30, 1, 32], dataValue: i + 1 });
+      }
+    };
+    const simulation = Simulation.create(module);
+    simulation.run();
+    return simulation;
+  }
+
+  it('runs to a line in both directions', function() {
+    const simulation = createLoopSimulation();
+
+    assert.ok(simulation.runToLine(2));
+    assert.equal(simulation.currentStep, 2);
+    assert.ok(simulation.runToLine(2));
+    assert.equal(simulation.currentStep, 6);
+    assert.ok(simulation.runToLine(2, 'backward'));
+    assert.equal(simulation.currentStep, 2);
+    assert.ok(!simulation.runToLine(3));
+    assert.deepEqual(simulation.getExecutedLines(), [1, 2]);
+  });
+  it('runs until a value changes in both directions', function() {
+    const simulation = createLoopSimulation();
+
+    assert.ok(simulation.runUntilChanged('x'));
+    assert.equal(simulation.currentStep, 11);
+    assert.ok(!simulation.runUntilChanged('x'));
+    assert.ok(simulation.runUntilChanged('x', 'backward'));
+    assert.equal(simulation.currentStep, 0);
+  });
+  it('runs until a predicate holds', function() {
+    const simulation = createLoopSimulation();
+
+    assert.ok(simulation.runUntil(s => s.dataValue === 2, { identifier: 'i' }));
+    assert.equal(simulation.currentStep, 9);
+    assert.ok(simulation.runUntil(s => s.dataValue === 1));
+    assert.equal(simulation.currentStep, 10);
+    assert.ok(simulation.runUntil(s => s.dataValue === 0, { direction: 'backward' }));
+    assert.equal(simulation.currentStep, 6);
+  });
+});
+
+describe('Simulation.getEvaluatedCode', function() {
+  it('only evaluates the steps of the current statement', function() {
+    const module = { simulatorCode: "x = 1 + 2;\ny = x;", simulatorSteps: [] };
+    module._main = () => {
+      module.simulatorSteps.push({ action: 'stat', location: [1, 1, 1, 9] });
+      module.simulatorSteps.push({ action: 'eval', location: [1, 5, 1, 9], dataValue: 3 });
+      module.simulatorSteps.push({ action: 'stat', location: [2, 1, 2, 5] });
+      module.simulatorSteps.push({ action: 'eval', location: [2, 5, 2, 5], dataValue: 3 });
+    };
+    const simulation = Simulation.create(module);
+    simulation.run();
+
+    simulation.currentStep = 1;
+    assert.equal(simulation.getEvaluatedCode(), "x = 3;\ny = x;");
+    assert.deepEqual(simulation.getHighlightedLocation(), [1, 1, 1, 9]);
+    simulation.currentStep = 3;
+    assert.equal(simulation.getEvaluatedCode(), "x = 1 + 2;\ny = 3;");
+    assert.deepEqual(simulation.getStatementSteps().map(s => s.action), ['stat', 'eval']);
+  });
+});